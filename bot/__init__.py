@@ -7,12 +7,21 @@ from .func_helper.logger_config import logu, Now
 LOGGER = logu(__name__)
 
 from .schemas import Config
+from .func_helper.config_store import ConfigWriter
 
 config = Config.load_config()
+config_writer = ConfigWriter(config, LOGGER)
 
 
-def save_config():
-    config.save_config()
+def save_config(now: bool = False):
+    """
+    保存配置：默认合并短时间内的多次修改后在线程中写入
+    :param now: 立即同步写入，用于 os.execl 重启等不会执行 atexit 的场景
+    """
+    if now:
+        config_writer.save_now()
+    else:
+        config_writer.schedule()
 
 
 '''从config对象中获取属性值'''
@@ -50,6 +59,10 @@ db_is_docker = config.db_is_docker
 db_docker_name = config.db_docker_name
 db_backup_dir = config.db_backup_dir
 db_backup_maxcount = config.db_backup_maxcount
+db_backup_method = config.db_backup_method
+db_backup_compress = config.db_backup_compress
+db_backup_per_table = config.db_backup_per_table
+db_backup_incremental = config.db_backup_incremental
 # 探针
 tz_ad = config.tz_ad
 tz_api = config.tz_api
@@ -57,12 +70,14 @@ tz_id = config.tz_id
 tz_version = config.tz_version
 tz_username = config.tz_username
 tz_password = config.tz_password
+tz_poll_interval = config.tz_poll_interval
 
 w_anti_channel_ids = config.w_anti_channel_ids
 kk_gift_days = config.kk_gift_days
 fuxx_pitao = config.fuxx_pitao
 activity_check_days = config.activity_check_days
 red_envelope = config.red_envelope
+media_notify_window = config.media_notify_window
 
 moviepilot = config.moviepilot
 auto_update = config.auto_update
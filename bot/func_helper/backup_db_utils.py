@@ -1,89 +1,324 @@
 import asyncio
 import glob
+import json
 import os
+import re
+import shutil
+import time
+import zlib
+from dataclasses import dataclass, field
 from datetime import datetime
+from typing import Dict, List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 from bot import LOGGER
 
+# 每次从 mysqldump 管道读取的字节数，内存占用与之成正比，与库大小无关
+READ_CHUNK_SIZE = 1024 * 1024
+# Telegram 机器人单文件上传上限 2000MB，分卷留出余量
+TELEGRAM_PART_SIZE = 1900 * 1024 * 1024
+_SUFFIX = {'gzip': '.gz', 'zstd': '.zst', 'none': ''}
+
+
+class BackupError(Exception):
+    pass
+
+
+@dataclass
+class BackupResult:
+    files: List[str] = field(default_factory=list)
+    size: int = 0
+    duration: float = 0.0
+    # 按表备份时实际导出的表；整库备份为 None
+    tables: Optional[List[str]] = None
+
+    @property
+    def summary(self) -> str:
+        text = f'{len(self.files)} 个文件，{self.size / 1024 / 1024:.2f} MB，耗时 {self.duration:.1f}s'
+        if self.tables is not None:
+            text += f'，导出表 {len(self.tables)} 张'
+        return text
+
+
+class _PartWriter:
+    """按大小滚动写入分卷文件 name.part001、name.part002 ...，只有一卷时命名为 name"""
+
+    def __init__(self, path: str, part_size: int):
+        self.path = path
+        self.part_size = part_size
+        self.files: List[str] = []
+        self.size = 0
+        self._file = None
+        self._written = 0
+
+    def _next_part(self):
+        if self._file:
+            self._file.close()
+        part = f'{self.path}.part{len(self.files) + 1:03d}'
+        self.files.append(part)
+        self._file = open(part, 'wb')
+        self._written = 0
+
+    def write(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            if self._file is None or self._written >= self.part_size:
+                self._next_part()
+            n = min(len(view), self.part_size - self._written)
+            self._file.write(view[:n])
+            self._written += n
+            self.size += n
+            view = view[n:]
+
+    def close(self):
+        if self._file is None:
+            self._next_part()
+        self._file.close()
+        if len(self.files) == 1:
+            os.replace(self.files[0], self.path)
+            self.files = [self.path]
+
+    def remove(self):
+        for f in self.files:
+            if os.path.exists(f):
+                os.remove(f)
+
+
+class _CompressedFile:
+    """同步写入接口：缓冲后压缩并写入分卷文件，供内置表导出器使用"""
+
+    def __init__(self, path: str, compress: str):
+        self.compressor = _compressor(compress)
+        self.parts = _PartWriter(path, TELEGRAM_PART_SIZE)
+        self._buffer = bytearray()
+
+    def _drain(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        if self.compressor is not None:
+            data = self.compressor.compress(data)
+        if data:
+            self.parts.write(data)
+
+    def write(self, data: bytes):
+        self._buffer += data
+        if len(self._buffer) >= READ_CHUNK_SIZE:
+            self._drain()
+
+    def close(self):
+        self._drain()
+        if self.compressor is not None:
+            self.parts.write(self.compressor.flush())
+        self.parts.close()
+
+
+def _compressor(compress: str):
+    if compress == 'zstd':
+        if zstandard is not None:
+            return zstandard.ZstdCompressor(level=10).compressobj()
+        LOGGER.warning("未安装 zstandard，备份改用 gzip 压缩")
+        compress = 'gzip'
+    if compress == 'gzip':
+        # wbits=31 输出 gzip 格式，可直接 gunzip
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    return None
+
+
+def _suffix(compress: str) -> str:
+    if compress == 'zstd' and zstandard is None:
+        compress = 'gzip'
+    return _SUFFIX.get(compress, '.gz')
+
+
+def _mysqldump_args(user, database_name, tables=None, host=None, port=None, skip_ssl=False) -> List[str]:
+    args = ['mysqldump', '--single-transaction', '--quick', '--no-tablespaces', f'-u{user}']
+    if skip_ssl:
+        args.append('--skip-ssl')
+    if host:
+        args += [f'-h{host}', f'-P{port}']
+    return args + [database_name] + list(tables or [])
+
+
+async def _dump_to_file(argv: List[str], password: str, path: str, compress: str) -> _PartWriter:
+    """
+    不经过 shell 执行 mysqldump，密码通过 MYSQL_PWD 环境变量传递，stdout 边读边压缩写入分卷文件
+    """
+    env = {**os.environ, 'MYSQL_PWD': password}
+    process = await asyncio.create_subprocess_exec(*argv, stdout=asyncio.subprocess.PIPE,
+                                                   stderr=asyncio.subprocess.PIPE, env=env)
+    stderr_task = asyncio.create_task(process.stderr.read())
+    compressor = _compressor(compress)
+    writer = _PartWriter(path, TELEGRAM_PART_SIZE)
+    try:
+        while True:
+            chunk = await process.stdout.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            if compressor is not None:
+                chunk = await asyncio.to_thread(compressor.compress, chunk)
+            if chunk:
+                writer.write(chunk)
+        if compressor is not None:
+            writer.write(compressor.flush())
+    except BaseException:
+        try:
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+            writer.close()
+            writer.remove()
+        finally:
+            # 读取 stderr 的任务不能悬空，否则会留下未取回的异常
+            stderr_task.cancel()
+            await asyncio.gather(stderr_task, return_exceptions=True)
+        raise
+    writer.close()
+    return_code = await process.wait()
+    stderr = await stderr_task
+    if return_code != 0:
+        writer.remove()
+        raise BackupError(f"code {return_code}: {stderr.decode(errors='ignore').strip()[-500:]}")
+    return writer
+
+
+async def _dump_with_ssl_fallback(build_argv, password: str, path: str, compress: str) -> _PartWriter:
+    try:
+        return await _dump_to_file(build_argv(False), password, path, compress)
+    except BackupError as e:
+        LOGGER.warning(f"BOT数据库备份失败，使用 skip-ssl方式尝试备份: {e}")
+        return await _dump_to_file(build_argv(True), password, path, compress)
+
+
+def _table_checksums() -> Dict[str, int]:
+    """CHECKSUM TABLE 计算各表校验值，用于增量备份判断表是否有变化"""
+    from sqlalchemy import inspect, text
+    from bot.sql_helper import engine
+
+    checksums = {}
+    with engine.connect() as conn:
+        for table in inspect(conn).get_table_names():
+            row = conn.execute(text(f'CHECKSUM TABLE `{table}`')).first()
+            checksums[table] = row[1] if row else None
+    return checksums
+
+
+def _load_state(path: str) -> dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
 
 class BackupDBUtils:
 
     @staticmethod
-    # 数据库备份(mysql直装/本机含有mysql)
-    async def backup_mysql_db(host, port, user, password, database_name, backup_dir, max_backup_count):
-        # 如果文件夹不存在，就创建它
-        if not os.path.exists(backup_dir):
-            os.makedirs(backup_dir)
-        # 根据时间创建当前备份文件
-        backup_file = os.path.join(backup_dir, f'{database_name}-{datetime.now().strftime("%Y-%m-%d-%H-%M-%S")}.sql')
-        command = f"mysqldump -h{host} --no-tablespaces -P{port} -u{user} -p\'{password}\' {database_name} > {backup_file}"
-        skip_ssl_command = f"mysqldump -h{host} --skip-ssl --no-tablespaces -P{port} -u{user} -p\'{password}\' {database_name} > {backup_file}"
-        return_code = -1
+    def rotate_backups(backup_dir, database_name, max_backup_count, protected=()):
+        """
+        按修改时间保留最近 max_backup_count 份备份，同一次备份的分卷/按表目录视为一份
+        protected 中的备份（增量备份仍在引用的表文件）不会被删除
+        """
+        pattern = re.compile(rf'^{re.escape(database_name)}-\d{{4}}(-\d{{2}}){{5}}')
+        sets: Dict[str, List[str]] = {}
+        for path in glob.glob(os.path.join(backup_dir, f'{glob.escape(database_name)}-*')):
+            match = pattern.match(os.path.basename(path))
+            if match:
+                sets.setdefault(match.group(0), []).append(path)
+        ordered = sorted(sets.items(), key=lambda kv: max(os.path.getmtime(p) for p in kv[1]), reverse=True)
+        for name, paths in ordered[max_backup_count:]:
+            if name in protected:
+                continue
+            for path in paths:
+                shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+            LOGGER.info(f"删除过期备份 {name}")
+
+    @staticmethod
+    async def _backup(build_argv, password, database_name, backup_dir, max_backup_count, compress='gzip',
+                      per_table=False, incremental=False) -> Optional[BackupResult]:
+        os.makedirs(backup_dir, exist_ok=True)
+        set_name = f'{database_name}-{datetime.now().strftime("%Y-%m-%d-%H-%M-%S")}'
+        suffix = _suffix(compress)
+        start = time.perf_counter()
+        result = BackupResult()
+        state_file = os.path.join(backup_dir, f'{database_name}.tables.json')
+        state = _load_state(state_file) if incremental else {}
         try:
-            process = await asyncio.create_subprocess_shell(command)
-            await process.communicate()
-            return_code = process.returncode
-            if return_code != 0:
-                LOGGER.warning(f"BOT数据库备份失败，使用 skip-ssl方式尝试备份")
-                process = await asyncio.create_subprocess_shell(skip_ssl_command)
-                await process.communicate()
-                return_code = process.returncode
-            if return_code != 0:
-                LOGGER.error(f"BOT数据库备份失败, error code: {return_code}")
-                return None
-            LOGGER.info(f"BOT数据库备份成功,文件保存为 {backup_file}")
-            # 获取所有备份文件，并且通过时间进行排序
-            all_backups = sorted(glob.glob(os.path.join(backup_dir, f'{database_name}-*.sql')))
-            # 如果超过了当前的备份最大数量，则删除最久的一个
-            while len(all_backups) > max_backup_count:
-                os.remove(all_backups[0])
-                all_backups.pop(0)
+            if not (per_table or incremental):
+                writer = await _dump_with_ssl_fallback(lambda skip_ssl: build_argv(None, skip_ssl), password,
+                                                       os.path.join(backup_dir, f'{set_name}.sql{suffix}'), compress)
+                result.files, result.size = writer.files, writer.size
+            else:
+                checksums = await asyncio.to_thread(_table_checksums)
+                result.tables = [t for t, c in checksums.items()
+                                 if not incremental or c is None or state.get(t, {}).get('checksum') != c]
+                set_dir = os.path.join(backup_dir, set_name)
+                if result.tables:
+                    os.makedirs(set_dir, exist_ok=True)
+                for table in result.tables:
+                    writer = await _dump_with_ssl_fallback(lambda skip_ssl: build_argv([table], skip_ssl), password,
+                                                           os.path.join(set_dir, f'{table}.sql{suffix}'), compress)
+                    result.files += writer.files
+                    result.size += writer.size
+                    state[table] = {'checksum': checksums[table], 'set': set_name}
+                if incremental:
+                    state = {t: v for t, v in state.items() if t in checksums}
+                    with open(state_file, 'w', encoding='utf-8') as f:
+                        json.dump(state, f, indent=2)
         except Exception as e:
             LOGGER.error(f"BOT数据库备份失败, error: {str(e)}")
             return None
-        return backup_file
+        result.duration = time.perf_counter() - start
+        LOGGER.info(f"BOT数据库备份成功 {set_name}: {result.summary}")
+        BackupDBUtils.rotate_backups(backup_dir, database_name, max_backup_count,
+                                     protected={v['set'] for v in state.values()})
+        return result
 
     @staticmethod
-    # 数据库备份(docker)
-    async def backup_mysql_db_docker(container_name, user, password, database_name, backup_dir, max_backup_count):
-        # 如果文件夹不存在，就创建它
-        if not os.path.exists(backup_dir):
-            os.makedirs(backup_dir)
-        # 根据当前时间创建备份文件
-        backup_file_in_container = f'{database_name}-{datetime.now().strftime("%Y-%m-%d-%H-%M-%S")}.sql'
-        backup_file_on_host = os.path.join(backup_dir, backup_file_in_container)
-        # 进入容器，使用mysqldump备份文件
-        command = f'docker exec {container_name} sh -c "mysqldump  --no-tablespaces -u{user} -p\'{password}\' {database_name} > {backup_file_in_container}"'
-        skip_ssl_command = f'docker exec {container_name} sh -c "mysqldump --skip-ssl --no-tablespaces -u{user} -p\'{password}\' {database_name} > {backup_file_in_container}"'
-        return_code = -1
+    # 数据库备份(内置导出器，不依赖 mysqldump/docker)，恢复见 scripts/db_tables.py
+    async def backup_native(database_name, backup_dir, max_backup_count, compress='gzip') -> Optional[BackupResult]:
+        from bot.func_helper.table_export import export_tables
+        from bot.sql_helper import engine
+
+        os.makedirs(backup_dir, exist_ok=True)
+        set_name = f'{database_name}-{datetime.now().strftime("%Y-%m-%d-%H-%M-%S")}'
+        out = _CompressedFile(os.path.join(backup_dir, f'{set_name}.jsonl{_suffix(compress)}'), compress)
+        start = time.perf_counter()
         try:
-            process = await asyncio.create_subprocess_shell(command)
-            await process.communicate()
-            return_code = process.returncode
-            if return_code != 0:
-                LOGGER.warning(f"BOT数据库备份失败，使用 skip-ssl方式尝试备份")
-                process = await asyncio.create_subprocess_shell(skip_ssl_command)
-                await process.communicate()
-                return_code = process.returncode
-            if return_code != 0:
-                LOGGER.error(f"BOT数据库备份失败, error code: {return_code}")
-                return None
-            # 将容器中的备份文件复制到本地
-            command = f'docker cp {container_name}:{backup_file_in_container} {backup_file_on_host}'
-            process = await asyncio.create_subprocess_shell(command)
-            await process.communicate()
+            counts = await asyncio.to_thread(export_tables, engine, out)
+            out.close()
         except Exception as e:
+            out.close()
+            out.parts.remove()
             LOGGER.error(f"BOT数据库备份失败, error: {str(e)}")
-        finally:
-            # 删除容器中文件
-            command = f'docker exec {container_name} rm {backup_file_in_container}'
-            process = await asyncio.create_subprocess_shell(command)
-            await process.communicate()
-        LOGGER.info(f"BOT数据库备份成功,文件保存为 {backup_file_on_host}")
-        # 获取所有备份文件，并且通过时间进行排序
-        all_backups = sorted(glob.glob(os.path.join(backup_dir, f'{database_name}-*.sql')))
-        # 如果超过了当前的备份最大数量，则删除最久的一个
-        while len(all_backups) > max_backup_count:
-            os.remove(all_backups[0])
-            all_backups.pop(0)
-        return backup_file_on_host
+            return None
+        result = BackupResult(files=out.parts.files, size=out.parts.size, duration=time.perf_counter() - start,
+                              tables=list(counts))
+        LOGGER.info(f"BOT数据库备份成功 {set_name}: {result.summary}，共 {sum(counts.values())} 行")
+        BackupDBUtils.rotate_backups(backup_dir, database_name, max_backup_count)
+        return result
+
+    @staticmethod
+    # 数据库备份(mysql直装/本机含有mysql)
+    async def backup_mysql_db(host, port, user, password, database_name, backup_dir, max_backup_count,
+                              compress='gzip', per_table=False, incremental=False) -> Optional[BackupResult]:
+        def build_argv(tables, skip_ssl):
+            return _mysqldump_args(user, database_name, tables, host=host, port=port, skip_ssl=skip_ssl)
+
+        return await BackupDBUtils._backup(build_argv, password, database_name, backup_dir, max_backup_count,
+                                           compress, per_table, incremental)
+
+    @staticmethod
+    # 数据库备份(docker)，mysqldump 的输出直接经 docker exec 的 stdout 流回本机，不在容器内落地
+    async def backup_mysql_db_docker(container_name, user, password, database_name, backup_dir, max_backup_count,
+                                     compress='gzip', per_table=False, incremental=False) -> Optional[BackupResult]:
+        def build_argv(tables, skip_ssl):
+            # -e MYSQL_PWD 不带值时 docker 从本进程环境变量中取值，密码不会出现在命令行
+            return ['docker', 'exec', '-e', 'MYSQL_PWD', container_name] + \
+                _mysqldump_args(user, database_name, tables, skip_ssl=skip_ssl)
+
+        return await BackupDBUtils._backup(build_argv, password, database_name, backup_dir, max_backup_count,
+                                           compress, per_table, incremental)
@@ -0,0 +1,94 @@
+"""
+config.json 写回：短时间内的多次修改合并为一次写入，在线程中以 临时文件 + rename 的方式原子替换
+本模块在 bot 包初始化时加载，不从 bot 导入任何东西
+"""
+import asyncio
+import atexit
+import json
+import os
+import tempfile
+import threading
+
+# 合并写入的窗口（秒）
+SAVE_DELAY = 2.0
+
+
+def write_json_atomic(path: str, data):
+    """写到同目录的临时文件后 os.replace，中途崩溃不会留下半个文件"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix='.config.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class ConfigWriter:
+    def __init__(self, config, logger, path: str = 'config.json', delay: float = SAVE_DELAY):
+        self.config = config
+        self.logger = logger
+        self.path = path
+        self.delay = delay
+        self._handle: asyncio.TimerHandle = None
+        self._dirty = False
+        # 保证线程中的写入与退出时的同步写入不会交错
+        self._write_lock = threading.Lock()
+        atexit.register(self.flush_now)
+
+    def schedule(self):
+        """标记有修改；事件循环中合并到 delay 秒后写入，没有运行中的事件循环时直接写入"""
+        self._dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return self.flush_now()
+        if self._handle is None:
+            self._handle = loop.call_later(self.delay, lambda: loop.create_task(self.flush()))
+
+    def _take(self):
+        """在事件循环线程中取快照，避免线程里序列化时配置正在被修改"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if not self._dirty:
+            return None
+        self._dirty = False
+        return self.config.model_dump()
+
+    def _write(self, data):
+        with self._write_lock:
+            write_json_atomic(self.path, data)
+
+    async def flush(self):
+        data = self._take()
+        if data is None:
+            return
+        try:
+            await asyncio.to_thread(self._write, data)
+        except Exception as e:
+            self.logger.error(f'写入配置文件失败，稍后重试: {e}')
+            self.schedule()
+
+    def save_now(self):
+        """立即同步写入当前配置，用于 os.execl 重启等不会执行 atexit 的场景"""
+        self._dirty = True
+        self.flush_now()
+
+    def flush_now(self):
+        """有未写入的修改时立即同步写入，退出时自动调用"""
+        data = self._take()
+        if data is None:
+            return
+        try:
+            self._write(data)
+        except Exception as e:
+            self._dirty = True
+            self.logger.error(f'写入配置文件失败: {e}')
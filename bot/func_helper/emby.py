@@ -11,6 +11,7 @@ from contextlib import asynccontextmanager
 
 from bot import emby_url, emby_api, emby_block, extra_emby_libs, LOGGER
 from bot.sql_helper.sql_emby import sql_update_emby, Emby
+from bot.func_helper.job_profiler import count_call
 from bot.func_helper.utils import pwd_create, convert_runtime, cache, Singleton
 
 
@@ -164,6 +165,7 @@ class Embyservice(metaclass=Singleton):
         url = f"{self.url}{endpoint}"
         
         for attempt in range(self.max_retries):
+            count_call('emby')
             try:
                 async with self.session() as session:
                     async with session.request(method, url, **kwargs) as response:
@@ -1331,37 +1333,49 @@ class Embyservice(metaclass=Singleton):
             LOGGER.error(f"获取用户设备统计异常: {str(e)}")
             return False, [], False, False
 
-    @staticmethod
-    async def get_medias_count() -> str:
+    async def get_item_counts(self) -> Optional[Dict]:
         """
-        获取媒体数量统计
-        :return: 统计文本
+        获取媒体数量统计 /Items/Counts
+        :return: 原始统计字典，失败返回 None
         """
-        try:
-            # 创建临时会话进行请求
-            timeout = aiohttp.ClientTimeout(total=10)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                url = f"{emby_url}/emby/Items/Counts?api_key={emby_api}"
-                async with session.get(url) as response:
-                    if response.status in [200, 204]:
-                        result = await response.json()
-                        movie_count = result.get("MovieCount", 0)
-                        tv_count = result.get("SeriesCount", 0)
-                        episode_count = result.get("EpisodeCount", 0)
-                        music_count = result.get("SongCount", 0)
-                        
-                        txt = f'🎬 电影数量：{movie_count}\n' \
-                              f'📽️ 剧集数量：{tv_count}\n' \
-                              f'🎵 音乐数量：{music_count}\n' \
-                              f'🎞️ 总集数：{episode_count}\n'
-                        LOGGER.debug("获取媒体统计成功")
-                        return txt
-                    else:
-                        LOGGER.error(f"获取媒体统计失败: HTTP {response.status}")
-                        return '🤕Emby 服务器返回数据为空!'
-        except Exception as e:
-            LOGGER.error(f"获取媒体统计异常: {str(e)}")
-            return '🤕Emby 服务器连接失败!'
+        result = await self._request('GET', '/emby/Items/Counts')
+        if result.success and isinstance(result.data, dict):
+            return result.data
+        LOGGER.error(f"获取媒体统计失败: {result.error}")
+        return None
+
+    # 搜索/媒体目录需要的字段
+    MEDIA_ITEM_FIELDS = "ProductionYear,Overview,OriginalTitle,Taglines,ProviderIds,Genres,RunTimeTicks,ProductionLocations,DateCreated,Studios"
+
+    def media_item(self, item: Dict) -> Dict:
+        """把 Emby 返回的电影/剧集条目整理为展示用的字典"""
+        # 处理标题
+        name = item.get("Name", "")
+        original_title = item.get("OriginalTitle", "")
+        display_title = name if not original_title or name == original_title else f'{name} - {original_title}'
+
+        # 处理其他字段
+        production_locations = ", ".join(item.get("ProductionLocations") or ["普遍"])
+        genres = ", ".join(item.get("Genres") or ["未知"])
+        runtime = convert_runtime(item.get("RunTimeTicks")) if item.get("RunTimeTicks") else '数据缺失'
+        tmdb_id = (item.get("ProviderIds") or {}).get("Tmdb")
+
+        return {
+            'item_type': item.get("Type"),
+            'item_id': item.get("Id"),
+            'title': display_title,
+            'name': name,
+            'original_title': original_title,
+            'year': item.get("ProductionYear", '缺失'),
+            'od': production_locations,
+            'genres': genres,
+            'photo': f'{self.url}/emby/Items/{item.get("Id")}/Images/Primary?maxHeight=400&maxWidth=600&quality=90',
+            'runtime': runtime,
+            'overview': item.get("Overview", "暂无更多信息"),
+            'taglines': '简介：' if not item.get("Taglines") else item.get("Taglines")[0],
+            'tmdbid': tmdb_id,
+            'add': (item.get("DateCreated") or "None.").split('.')[0],
+        }
 
     async def get_movies(self, title: str, start: int = 0, limit: int = 5) -> List[Dict]:
         """
@@ -1377,7 +1391,7 @@ class Embyservice(metaclass=Singleton):
             encoded_title = urllib.parse.quote(title)
             
             url = (f"/emby/Items?IncludeItemTypes=Movie,Series"
-                   f"&Fields=ProductionYear,Overview,OriginalTitle,Taglines,ProviderIds,Genres,RunTimeTicks,ProductionLocations,DateCreated,Studios"
+                   f"&Fields={self.MEDIA_ITEM_FIELDS}"
                    f"&StartIndex={int(start)}&Recursive=true&SearchTerm={encoded_title}&Limit={int(limit)}&IncludeSearchTypes=false")
             
             # 使用较短的超时时间
@@ -1391,36 +1405,7 @@ class Embyservice(metaclass=Singleton):
             
             if result.success and result.data:
                 items = result.data.get("Items", [])
-                ret_movies = []
-                
-                for item in items:
-                    # 处理标题
-                    name = item.get("Name", "")
-                    original_title = item.get("OriginalTitle", "")
-                    display_title = name if name == original_title else f'{name} - {original_title}'
-                    
-                    # 处理其他字段
-                    production_locations = ", ".join(item.get("ProductionLocations", ["普遍"]))
-                    genres = ", ".join(item.get("Genres", ["未知"]))
-                    runtime = convert_runtime(item.get("RunTimeTicks")) if item.get("RunTimeTicks") else '数据缺失'
-                    tmdb_id = item.get("ProviderIds", {}).get("Tmdb")
-                    
-                    movie_item = {
-                        'item_type': item.get("Type"),
-                        'item_id': item.get("Id"),
-                        'title': display_title,
-                        'year': item.get("ProductionYear", '缺失'),
-                        'od': production_locations,
-                        'genres': genres,
-                        'photo': f'{self.url}/emby/Items/{item.get("Id")}/Images/Primary?maxHeight=400&maxWidth=600&quality=90',
-                        'runtime': runtime,
-                        'overview': item.get("Overview", "暂无更多信息"),
-                        'taglines': '简介：' if not item.get("Taglines") else item.get("Taglines")[0],
-                        'tmdbid': tmdb_id,
-                        'add': item.get("DateCreated", "None.").split('.')[0],
-                    }
-                    ret_movies.append(movie_item)
-                
+                ret_movies = [self.media_item(item) for item in items]
                 LOGGER.debug(f"搜索电影成功: {title} - 找到 {len(ret_movies)} 个结果")
                 return ret_movies
             else:
@@ -1431,6 +1416,20 @@ class Embyservice(metaclass=Singleton):
             LOGGER.error(f"搜索电影异常: {title} - {str(e)}")
             return []
 
+    async def get_library_items(self, start: int = 0, limit: int = 500) -> Tuple[bool, List[Dict], int]:
+        """
+        按入库时间倒序分页读取全部电影/剧集，供本地媒体目录同步
+        :return: (是否成功, 原始条目列表, 总数)
+        """
+        url = (f"/emby/Items?IncludeItemTypes=Movie,Series&Recursive=true"
+               f"&Fields={self.MEDIA_ITEM_FIELDS}&SortBy=DateCreated&SortOrder=Descending"
+               f"&StartIndex={int(start)}&Limit={int(limit)}")
+        result = await self._request('GET', url)
+        if result.success and result.data:
+            return True, result.data.get("Items", []), result.data.get("TotalRecordCount", 0)
+        LOGGER.error(f"读取媒体库条目失败: {result.error}")
+        return False, [], 0
+
     async def get_device_by_deviceid(self, deviceid: str) -> Tuple[bool, Union[Dict, Dict[str, str]]]:
         """
         通过设备ID获取设备信息
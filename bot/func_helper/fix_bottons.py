@@ -3,9 +3,9 @@ from pykeyboard import InlineKeyboard, InlineButton
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
 from pyromod.helpers import ikb, array_chunk
 from datetime import datetime, timezone, timedelta
-from bot import chanel, main_group, bot_name, extra_emby_libs, tz_id, tz_ad, tz_api, tz_version, tz_username, tz_password, _open, sakura_b, \
+from bot import chanel, main_group, bot_name, extra_emby_libs, _open, sakura_b, \
     schedall, auto_update, fuxx_pitao, moviepilot, red_envelope, config, game, LOGGER
-from bot.func_helper import nezha_res
+from bot.func_helper.server_status import server_status
 from bot.func_helper.emby import emby
 from bot.func_helper.utils import members_info
 from bot import api as config_api
@@ -132,13 +132,12 @@ user_emby_unblock_ikb = ikb([[('❎ 已显示', 'members')]])
 """server ↓"""
 
 
-@cache.memoize(ttl=120)
 async def cr_page_server():
     """
-    翻页服务器面板
+    翻页服务器面板，读取后台轮询的状态快照
     :return:
     """
-    sever = await nezha_res.sever_info(tz_ad, tz_api, tz_id, tz_version, tz_username, tz_password)
+    sever = server_status.snapshot
     if not sever:
         return ikb([[('🔙 - 用户', 'members'), ('❌ - 上一级', 'back_start')]]), None
     d = []
@@ -519,7 +518,13 @@ def sched_buttons():
                  InlineButton(f'{backup_db} 自动备份数据库', f'sched-backup_db'),
                  InlineButton(f'{partition_check} 分区授权检查', f'sched-partition_check')
                  )
-    keyboard.row(InlineButton(f'🫧 返回', 'manage'))
+    keyboard.row(InlineButton('📊 运行记录', 'jobstats'), InlineButton('🫧 返回', 'manage'))
+    return keyboard
+
+
+def job_stats_buttons():
+    keyboard = InlineKeyboard()
+    keyboard.row(InlineButton('🔄 刷新', 'jobstats'), InlineButton('🫧 返回', 'schedall'))
     return keyboard
 
 
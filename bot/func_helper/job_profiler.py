@@ -0,0 +1,121 @@
+"""
+定时任务运行剖析：统计单次运行中的 Emby / 数据库 / Telegram 调用次数与内存
+计数器保存在 ContextVar 中，只统计任务自身（及其创建的子任务）发起的调用，不会混入同一时间处理的其他消息
+"""
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from bot import LOGGER
+
+
+@dataclass
+class JobStats:
+    duration: float = 0.0
+    emby_calls: int = 0
+    db_calls: int = 0
+    tg_calls: int = 0
+    peak_rss_mb: Optional[float] = None
+    rss_delta_mb: Optional[float] = None
+
+    def columns(self) -> dict:
+        return {
+            'emby_calls': self.emby_calls,
+            'db_calls': self.db_calls,
+            'tg_calls': self.tg_calls,
+            'peak_rss_mb': self.peak_rss_mb,
+            'rss_delta_mb': self.rss_delta_mb,
+        }
+
+
+_current_stats: ContextVar[Optional[JobStats]] = ContextVar('job_profiler_stats', default=None)
+_hooks_installed = False
+
+
+def count_call(kind: str):
+    """
+    当前处于任务剖析上下文时，对应计数 +1
+    :param kind: emby / db / tg
+    """
+    stats = _current_stats.get()
+    if stats is not None:
+        field = f'{kind}_calls'
+        setattr(stats, field, getattr(stats, field) + 1)
+
+
+def _rss_mb() -> Optional[float]:
+    """当前进程常驻内存(MB)，仅 Linux 可用"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / 1024 / 1024
+    except Exception:
+        return None
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """进程启动以来的峰值常驻内存(MB)，Linux 下 ru_maxrss 单位为 KB"""
+    if resource is None:
+        return None
+    try:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except Exception:
+        return None
+
+
+@contextmanager
+def profile_job():
+    """
+    在上下文中运行任务，退出时填充耗时与内存
+    内存为进程级数据：peak_rss_mb 为运行结束时的进程峰值，rss_delta_mb 为运行前后常驻内存的差值
+    """
+    stats = JobStats()
+    token = _current_stats.set(stats)
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats.duration = time.perf_counter() - start
+        stats.peak_rss_mb = _peak_rss_mb()
+        rss_after = _rss_mb()
+        if rss_before is not None and rss_after is not None:
+            stats.rss_delta_mb = rss_after - rss_before
+        _current_stats.reset(token)
+
+
+def install_hooks():
+    """
+    挂载数据库与 Telegram 调用计数，只执行一次
+    Emby 调用在 Embyservice._request 内直接计数
+    """
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    _hooks_installed = True
+
+    from sqlalchemy import event
+    from bot import bot
+    from bot.sql_helper import engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _count_db_call(*_):
+        count_call('db')
+
+    invoke = bot.invoke
+
+    @functools.wraps(invoke)
+    async def _counted_invoke(*args, **kwargs):
+        count_call('tg')
+        return await invoke(*args, **kwargs)
+
+    bot.invoke = _counted_invoke
+    LOGGER.info("定时任务剖析计数已挂载")
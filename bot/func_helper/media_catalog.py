@@ -0,0 +1,208 @@
+"""
+本地媒体目录：在内存中镜像 Emby 的电影/剧集，内联搜索直接查本地索引，不请求 Emby
+
+同步方式：
+    启动时全量读取；之后按 DateCreated 倒序增量读取，遇到已同步过的时间点即停止
+    library.new / library.deleted 事件实时增删；定期全量重建以清理漏掉的删除
+索引：
+    标题、原名（及安装 pypinyin 时的全拼、首字母）归一化后按单字和二元组建倒排表，查询时取交集再做子串校验
+"""
+import asyncio
+import re
+import time
+import unicodedata
+from typing import Dict, List, Set
+
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:
+    lazy_pinyin = None
+
+from bot import LOGGER
+from bot.func_helper.emby import emby
+
+# 增量同步间隔、全量重建间隔（秒）
+REFRESH_INTERVAL = 600
+FULL_REFRESH_INTERVAL = 6 * 3600
+PAGE_SIZE = 500
+
+_NON_WORD = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def normalize(text: str) -> str:
+    """全角转半角、小写、去掉空白和标点"""
+    if not text:
+        return ''
+    return _NON_WORD.sub('', unicodedata.normalize('NFKC', text).lower())
+
+
+def _grams(text: str) -> Set[str]:
+    """查询用：二元组，单字查询为该字本身"""
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _key_grams(text: str) -> Set[str]:
+    """建索引用：单字 + 二元组，保证单字查询也能命中"""
+    return set(text) | _grams(text)
+
+
+def _search_keys(entry: Dict) -> List[str]:
+    keys = [normalize(entry.get('name')), normalize(entry.get('original_title'))]
+    if lazy_pinyin is not None and entry.get('name'):
+        keys.append(normalize(''.join(lazy_pinyin(entry['name']))))
+        keys.append(normalize(''.join(lazy_pinyin(entry['name'], style=Style.FIRST_LETTER))))
+    return list(dict.fromkeys(k for k in keys if k))
+
+
+class MediaCatalog:
+    def __init__(self):
+        # item_id -> emby.media_item() 的结果
+        self.items: Dict[str, Dict] = {}
+        self._keys: Dict[str, List[str]] = {}
+        self._index: Dict[str, Set[str]] = {}
+        # 已同步到的最新 DateCreated（Emby 返回的 ISO 字符串，可直接比较）
+        self.cursor: str = ''
+        self.ready = False
+        # 全量重建期间收到的 webhook 增删，替换前重放到新目录上；不在重建时为 None
+        self._journal: List[tuple] = None
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task = None
+
+    def upsert(self, raw: Dict, advance: bool = True):
+        """
+        写入/更新一条 Emby 原始条目，只收录电影和剧集
+        :param advance: 是否推进同步游标；webhook 推送的单条不推进，避免跳过更早入库但尚未同步的条目
+        """
+        if raw.get('Type') not in ('Movie', 'Series') or not raw.get('Id'):
+            return
+        entry = emby.media_item(raw)
+        entry['date_created'] = raw.get('DateCreated') or ''
+        item_id = entry['item_id']
+        if self._journal is not None:
+            self._journal.append(('upsert', raw))
+        self._unindex(item_id)
+        keys = _search_keys(entry)
+        self.items[item_id] = entry
+        self._keys[item_id] = keys
+        for key in keys:
+            for gram in _key_grams(key):
+                self._index.setdefault(gram, set()).add(item_id)
+        if advance and entry['date_created'] > self.cursor:
+            self.cursor = entry['date_created']
+
+    def remove(self, item_id: str):
+        if self._journal is not None:
+            self._journal.append(('remove', item_id))
+        self._unindex(item_id)
+        self.items.pop(item_id, None)
+
+    def _unindex(self, item_id: str):
+        for key in self._keys.pop(item_id, ()):
+            for gram in _key_grams(key):
+                ids = self._index.get(gram)
+                if ids is not None:
+                    ids.discard(item_id)
+                    if not ids:
+                        del self._index[gram]
+
+    def search(self, query: str, start: int = 0, limit: int = 10) -> List[Dict]:
+        """
+        标题/原名/拼音子串匹配，完全匹配 > 前缀匹配 > 其他，同级按入库时间倒序
+        """
+        q = normalize(query)
+        if not q:
+            return []
+        candidates = None
+        for gram in sorted(_grams(q), key=lambda g: len(self._index.get(g, ()))):
+            ids = self._index.get(gram)
+            if not ids:
+                return []
+            candidates = set(ids) if candidates is None else candidates & ids
+            if not candidates:
+                return []
+        ranked = []
+        for item_id in candidates:
+            keys = self._keys[item_id]
+            if any(k == q for k in keys):
+                rank = 0
+            elif any(k.startswith(q) for k in keys):
+                rank = 1
+            elif any(q in k for k in keys):
+                rank = 2
+            else:
+                continue
+            ranked.append((rank, item_id))
+        # 先按入库时间倒序，再按匹配等级稳定排序
+        ranked.sort(key=lambda r: self.items[r[1]]['date_created'], reverse=True)
+        ranked.sort(key=lambda r: r[0])
+        return [self.items[item_id] for _, item_id in ranked[start:start + limit]]
+
+    async def _fetch(self, stop_at: str = None) -> List[Dict]:
+        """按入库时间倒序分页读取，stop_at 不为空时读到不晚于该时间的条目即停止"""
+        items, start = [], 0
+        while True:
+            ok, page, total = await emby.get_library_items(start, PAGE_SIZE)
+            if not ok:
+                raise RuntimeError('读取 Emby 媒体库失败')
+            for raw in page:
+                if stop_at and (raw.get('DateCreated') or '') <= stop_at:
+                    return items
+                items.append(raw)
+            start += len(page)
+            if not page or start >= total:
+                return items
+
+    async def refresh(self, full: bool = False):
+        async with self._lock:
+            begin = time.perf_counter()
+            if full or not self.ready:
+                self._journal = []
+                try:
+                    raws = await self._fetch()
+                    fresh = MediaCatalog()
+                    for raw in raws:
+                        fresh.upsert(raw)
+                    # 读取期间 webhook 已写入旧目录的增删，按顺序补到新目录，避免替换时丢失
+                    for op, arg in self._journal:
+                        if op == 'upsert':
+                            fresh.upsert(arg, advance=False)
+                        else:
+                            fresh.remove(arg)
+                finally:
+                    self._journal = None
+                self.items, self._keys, self._index, self.cursor = fresh.items, fresh._keys, fresh._index, fresh.cursor
+                self.ready = True
+            else:
+                raws = await self._fetch(stop_at=self.cursor)
+                for raw in raws:
+                    self.upsert(raw)
+            LOGGER.info(f"媒体目录{'全量' if full else '增量'}同步 {len(raws)} 条，共 {len(self.items)} 条，"
+                        f"耗时 {time.perf_counter() - begin:.1f}s")
+
+    async def _run(self):
+        last_full = 0.0
+        while True:
+            full = time.time() - last_full >= FULL_REFRESH_INTERVAL
+            try:
+                await self.refresh(full=full)
+                if full:
+                    last_full = time.time()
+            except Exception as e:
+                LOGGER.error(f"媒体目录同步失败: {e}")
+            await asyncio.sleep(REFRESH_INTERVAL)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_event_loop().create_task(self._run())
+
+
+media_catalog = MediaCatalog()
+
+
+async def search_media(title: str, start: int = 0, limit: int = 10) -> List[Dict]:
+    """目录已加载时查本地索引，否则退回 Emby 搜索"""
+    if media_catalog.ready:
+        return media_catalog.search(title, start, limit)
+    return await emby.get_movies(title=title, start=start, limit=limit)
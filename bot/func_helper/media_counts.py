@@ -0,0 +1,87 @@
+"""
+媒体数量统计：内存中保存 /Items/Counts 的结果，后台定时校准，入库/删除 webhook 实时增减
+/count 只读内存；Emby 不可达时继续展示上一次的数据并标注更新时间
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict
+
+from cacheout import Cache
+
+from bot import LOGGER
+from bot.func_helper.emby import emby
+
+# 定时校准间隔（秒），webhook 增减的误差（如删除整部剧时未逐集推送）在校准时修正
+REFRESH_INTERVAL = 1800
+
+# webhook 条目类型 -> /Items/Counts 字段
+_TYPE_FIELDS = {
+    'Movie': 'MovieCount',
+    'Series': 'SeriesCount',
+    'Episode': 'EpisodeCount',
+    'Audio': 'SongCount',
+}
+
+
+class MediaCounts:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.counts: Dict[str, int] = {}
+        self.updated_at: float = 0.0
+        # 最近一次校准是否失败
+        self.stale = False
+        # 已计入的新增条目 id；Emby 对同一条目会先后推送 item.added 和 library.new，只计一次
+        self._counted = Cache(maxsize=10000, ttl=interval)
+        self._task: asyncio.Task = None
+
+    async def refresh(self) -> bool:
+        data = await emby.get_item_counts()
+        if data is None:
+            self.stale = True
+            return False
+        self.counts = {field: int(data.get(field) or 0) for field in _TYPE_FIELDS.values()}
+        self.updated_at = time.time()
+        self.stale = False
+        return True
+
+    def bump(self, item_type: str, delta: int = 1, item_id: str = None):
+        """webhook 入库 +1 / 删除 -1，尚未加载过时忽略，等待校准；同一 item_id 的重复入库事件只计一次"""
+        if item_id:
+            if delta > 0:
+                if self._counted.has(item_id):
+                    return
+                self._counted.set(item_id, True)
+            else:
+                self._counted.delete(item_id)
+        field = _TYPE_FIELDS.get(item_type)
+        if field and self.counts:
+            self.counts[field] = max(self.counts[field] + delta, 0)
+
+    async def text(self) -> str:
+        if not self.counts and not await self.refresh():
+            return '🤕Emby 服务器连接失败!'
+        txt = f"🎬 电影数量：{self.counts['MovieCount']}\n" \
+              f"📽️ 剧集数量：{self.counts['SeriesCount']}\n" \
+              f"🎵 音乐数量：{self.counts['SongCount']}\n" \
+              f"🎞️ 总集数：{self.counts['EpisodeCount']}\n"
+        if self.stale:
+            updated = datetime.fromtimestamp(self.updated_at).strftime('%Y-%m-%d %H:%M')
+            txt += f'\n⚠️ Emby 暂时无法连接，以上为 {updated} 的数据'
+        return txt
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.stale = True
+                LOGGER.error(f'媒体数量统计刷新异常: {e}')
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_event_loop().create_task(self._run())
+
+
+media_counts = MediaCounts(REFRESH_INTERVAL)
@@ -1,6 +1,9 @@
-import requests
 import json
+import time
+from typing import NamedTuple, Optional
+from cacheout import LRUCache
 from bot import LOGGER, moviepilot, save_config
+from bot.func_helper.utils import jwt_expires_at
 import aiohttp
 import asyncio
 
@@ -14,7 +17,27 @@ class MoviePilot:
 
 mp = MoviePilot()
 
+# 搜索结果按关键词缓存，所有用户共享；超过容量时淘汰最久未用的关键词
+SEARCH_CACHE_SIZE = 64
+SEARCH_CACHE_TTL = 600
+_search_cache = LRUCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+
+
+class SearchResult(NamedTuple):
+    """一条搜索结果：只保留展示用的字段，torrent 为提交下载所需的种子信息"""
+    title: str
+    year: str
+    type: str
+    size: int
+    labels: str
+    seeders: int
+    media: str
+    description: str
+    torrent: dict
+
 TIMEOUT = 30
+# token 剩余有效期小于该值时提前重新登录（秒）
+TOKEN_REFRESH_MARGIN = 600
 # aiohttp重试装饰器
 def aiohttp_retry(retry_count):
     def decorator(func):
@@ -29,34 +52,95 @@ def aiohttp_retry(retry_count):
         return wrapper
 
     return decorator
-@aiohttp_retry(3)
-async def _do_request(request):
-    async with aiohttp.ClientSession() as session:
-        async with session.request(method=request['method'], url=request['url'], headers=request['headers'], data=request.get('data')) as response:
-            if response.status == 401 or response.status == 403:
-                LOGGER.error("MP Token过期, 尝试重新登录.")
-                success = await login()
-                if success:
-                    request['headers']['Authorization'] = mp.access_token
-                    return await _do_request(request)
+
+
+_session: aiohttp.ClientSession = None
+
+
+def _get_session() -> aiohttp.ClientSession:
+    """所有 MP 请求共用一个 ClientSession，复用连接"""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=TIMEOUT))
+    return _session
+
+
+class TokenManager:
+    """
+    缓存 MP access_token 到过期前，临近过期时提前登录
+    并发请求共用一次登录（single-flight），不会因 token 过期各自重复登录
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self.expires_at = self._expires_at(mp.access_token)
+
+    @staticmethod
+    def _expires_at(token):
+        if not token:
+            return 0.0
+        # 无法解析到期时间（旧配置中的 token）时先继续用，等 401 再登录
+        return jwt_expires_at(token.split(' ')[-1]) or float('inf')
+
+    def _fresh(self) -> bool:
+        return bool(mp.access_token) and self.expires_at - time.time() > TOKEN_REFRESH_MARGIN
+
+    async def get(self) -> Optional[str]:
+        """返回可用的 token；需要登录且登录失败时返回 None"""
+        if self._fresh():
+            return mp.access_token
+        async with self._lock:
+            # 等锁期间可能已由其他请求登录完成
+            if not self._fresh() and not await self._login():
                 return None
-            return await response.json()
-async def login():
-    url = f"{mp.url}/api/v1/login/access-token"
-    payload = f"username={mp.username}&password={mp.password}"
-    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
-    response = requests.post(url, data=payload, headers=headers, timeout=TIMEOUT)
-    result = response.json()
-    if 'access_token' in result:
-        mp.access_token = result['token_type'] + ' ' + result['access_token']
-        moviepilot.access_token = mp.access_token # 保存到config
-        save_config()
-        LOGGER.info("MP 登录成功, token已保存")
-        return True
-    else:
+            return mp.access_token
+
+    def invalidate(self, token: str):
+        """token 被拒绝后让下一次 get 重新登录；token 已被其他请求换新时不处理"""
+        if token == mp.access_token:
+            self.expires_at = 0.0
+
+    async def _login(self) -> bool:
+        url = f"{mp.url}/api/v1/login/access-token"
+        payload = {'username': mp.username, 'password': mp.password}
+        try:
+            async with _get_session().post(url, data=payload) as response:
+                result = await response.json(content_type=None)
+        except Exception as e:
+            LOGGER.error(f"MP 登录失败: {e}")
+            return False
+        if 'access_token' in result:
+            mp.access_token = result['token_type'] + ' ' + result['access_token']
+            self.expires_at = self._expires_at(mp.access_token)
+            moviepilot.access_token = mp.access_token # 保存到config
+            save_config()
+            LOGGER.info("MP 登录成功, token已保存")
+            return True
         LOGGER.error(f"MP 登录失败: {result}")
         return False
 
+
+tokens = TokenManager()
+
+
+@aiohttp_retry(3)
+async def _do_request(request):
+    """发送请求，Authorization 由 TokenManager 提供；401/403 时换新 token 重试一次"""
+    headers = dict(request.get('headers') or {})
+    for attempt in range(2):
+        token = await tokens.get()
+        if token is None:
+            LOGGER.error(f"MP 登录失败，放弃请求 {request['url']}")
+            return None
+        headers['Authorization'] = token
+        async with _get_session().request(method=request['method'], url=request['url'], headers=headers,
+                                          data=request.get('data')) as response:
+            if response.status not in (401, 403):
+                return await response.json()
+        LOGGER.error("MP Token过期, 尝试重新登录.")
+        tokens.invalidate(token)
+    return None
+
 async def search(title):
     """
     搜索资源
@@ -71,8 +155,7 @@ async def search(title):
         return False, []
         
     url = f"{mp.url}/api/v1/search/title?keyword={title}"
-    headers = {'Authorization': mp.access_token}
-    request = {'method': 'GET', 'url': url, 'headers': headers}
+    request = {'method': 'GET', 'url': url}
     try:
         data = await _do_request(request)
         results = []
@@ -87,24 +170,28 @@ async def search(title):
                     seeders = int(seeders) if seeders else 0
                 except (ValueError, TypeError):
                     seeders = 0
-                result = {
-                    "title": meta_info.get("title", ""),
-                    "year": meta_info.get("year", ""),
-                    "type": meta_info.get("type", ""),
-                    "resource_pix": meta_info.get("resource_pix", ""),
-                    "video_encode": meta_info.get("video_encode", ""),
-                    "audio_encode": meta_info.get("audio_encode", ""),
-                    "resource_team": meta_info.get("resource_team", ""),
-                    "seeders": seeders,
-                    "size": torrent_info.get("size", "0"),
-                    "labels": torrent_info.get("labels", ""),
-                    "description": torrent_info.get("description", ""),
-                    "torrent_info": torrent_info,
-                }
-                results.append(result)
-                
+                try:
+                    size = int(float(torrent_info.get("size") or 0))
+                except (ValueError, TypeError):
+                    size = 0
+                labels = torrent_info.get("labels", "")
+                if isinstance(labels, list):
+                    labels = " ".join(str(label) for label in labels)
+                media = [meta_info.get(k) for k in ("resource_pix", "video_encode", "audio_encode")]
+                results.append(SearchResult(
+                    title=meta_info.get("title", ""),
+                    year=meta_info.get("year", ""),
+                    type=meta_info.get("type", ""),
+                    size=size,
+                    labels=labels,
+                    seeders=seeders,
+                    media=" | ".join(m for m in media if m),
+                    description=torrent_info.get("description", ""),
+                    torrent=torrent_info,
+                ))
+
         # 只按做种数排序,移除数量限制
-        results.sort(key=lambda x: x["seeders"], reverse=True)
+        results.sort(key=lambda x: x.seeders, reverse=True)
             
         LOGGER.info("MP Search successful!")
         return True, results
@@ -113,12 +200,29 @@ async def search(title):
         return False, []
 
 
+async def search_cached(title):
+    """
+    带缓存的搜索，同一关键词在 SEARCH_CACHE_TTL 内不会重复请求 MP；失败结果不缓存
+    返回不可变的 tuple，调用方可以直接共享引用（如搜索会话固定住展示给用户的结果）
+    """
+    if title is None:
+        return False, []
+    key = " ".join(title.split()).lower()
+    results = _search_cache.get(key)
+    if results is not None:
+        return True, results
+    success, results = await search(title)
+    results = tuple(results)
+    if success:
+        _search_cache.set(key, results)
+    return success, results
+
+
 async def add_download_task(param):
     if param is None:
         return False, None
     url = f"{mp.url}/api/v1/download/add"
-    headers = {'Content-Type': 'application/json',
-               'Authorization': mp.access_token}
+    headers = {'Content-Type': 'application/json'}
     jsonData = json.dumps(param)
     request = {'method': 'POST', 'url': url,
                'headers': headers, 'data': jsonData}
@@ -136,8 +240,7 @@ async def add_download_task(param):
 
 async def get_download_task():
     url = f"{mp.url}/api/v1/download?name=下载"
-    headers = {'Authorization': mp.access_token}
-    request = {'method': 'GET', 'url': url, 'headers': headers}
+    request = {'method': 'GET', 'url': url}
     try:
         result = await _do_request(request)
         data = []
@@ -154,8 +257,7 @@ async def get_download_task():
         return None
 async def get_history_transfer_task_by_title_download_id(title, download_id, page = 1, count = 50):
     url = f"{mp.url}/api/v1/history/transfer?title={title}&page={page}&count={count}"
-    headers = {'Authorization': mp.access_token}
-    request = {'method': 'GET', 'url': url, 'headers': headers}
+    request = {'method': 'GET', 'url': url}
     try:
         result = await _do_request(request)
         if result and result.get("success", False) and result.get("data", []):
@@ -168,4 +270,31 @@ async def get_history_transfer_task_by_title_download_id(title, download_id, pag
             return None
     except Exception as e:
         LOGGER.error(f"MP 获取历史转移任务失败: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+async def get_transfer_history(download_ids, count=100, max_pages=3):
+    """
+    一次同步周期内只拉取一次转移历史，返回 {download_hash: status}
+    从最新一页开始，待查的 download_ids 全部找到或到达 max_pages 时停止
+    """
+    wanted = set(download_ids)
+    history = {}
+    for page in range(1, max_pages + 1):
+        url = f"{mp.url}/api/v1/history/transfer?title=&page={page}&count={count}"
+        request = {'method': 'GET', 'url': url}
+        try:
+            result = await _do_request(request)
+        except Exception as e:
+            LOGGER.error(f"MP 获取历史转移任务失败: {e}")
+            break
+        if not result or not result.get("success", False):
+            LOGGER.error(f"MP 获取历史转移任务失败: {result}")
+            break
+        items = (result.get("data") or {}).get("list") or []
+        for item in items:
+            # 同一个 hash 只保留最新的一条
+            history.setdefault(item.get('download_hash'), item.get('status'))
+        if len(items) < count or wanted <= history.keys():
+            break
+    return history
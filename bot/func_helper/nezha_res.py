@@ -2,16 +2,57 @@
 根据哪吒探针项目修改，只是图服务器界面好看。
 支持 Nezha V0、V1 API 和 Komari API
 """
+import time
+from contextlib import asynccontextmanager
+
 import humanize as humanize
-import requests as r
 import aiohttp
 import asyncio
 import logging
 
+from bot.func_helper.utils import jwt_expires_at
+
 logger = logging.getLogger(__name__)
 
+# 单次请求超时（秒）
+REQUEST_TIMEOUT = 10
+# 每个探针客户端保持的最大连接数
+POOL_SIZE = 10
+# token 剩余有效期小于该值时提前刷新（秒）
+TOKEN_REFRESH_MARGIN = 300
+# 无法从 token 中解析到期时间时按此有效期处理（秒）
+DEFAULT_TOKEN_TTL = 3600
+
+
+class _ProbeClient:
+    """长连接探针客户端：跨轮询复用同一个 ClientSession 的连接池，并记录最近一次请求的延迟"""
+
+    def __init__(self):
+        self.session = None
+        # 最近一次请求耗时（毫秒）
+        self.latency = None
+
+    async def _ensure_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+                connector=aiohttp.TCPConnector(limit=POOL_SIZE, keepalive_timeout=75),
+            )
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+    @asynccontextmanager
+    async def _timed(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.latency = (time.perf_counter() - start) * 1000
 
-class KomariAPI:
+
+class KomariAPI(_ProbeClient):
     """Komari 探针 API 客户端"""
 
     def __init__(self, dashboard_url, api_key=None):
@@ -20,17 +61,9 @@ class KomariAPI:
         :param dashboard_url: Komari 面板地址
         :param api_key: API Key (可选，用于 Bearer 认证访问管理接口)
         """
+        super().__init__()
         self.base_url = dashboard_url.rstrip('/')
         self.api_key = api_key
-        self.session = None
-
-    async def _ensure_session(self):
-        if self.session is None or self.session.closed:
-            self.session = aiohttp.ClientSession()
-
-    async def close(self):
-        if self.session and not self.session.closed:
-            await self.session.close()
 
     async def request(self, method, endpoint, **kwargs):
         """发送 API 请求"""
@@ -43,7 +76,7 @@ class KomariAPI:
             headers['Authorization'] = f'Bearer {self.api_key}'
 
         try:
-            async with self.session.request(method, url, headers=headers, **kwargs) as resp:
+            async with self._timed(), self.session.request(method, url, headers=headers, **kwargs) as resp:
                 if resp.status == 200:
                     return await resp.json()
                 else:
@@ -69,9 +102,71 @@ class KomariAPI:
         return data
 
 
+def _komari_node_status(node, recent_resp):
+    """把 Komari 节点与其最近状态渲染为服务器信息"""
+    node_uuid = node.get('uuid')
+    node_name = node.get('name', '未知节点')
+    if recent_resp and recent_resp.get('status') == 'success' and recent_resp.get('data'):
+        # 获取最新的一条数据
+        latest_data = recent_resp['data'][-1] if recent_resp['data'] else None
+
+        if latest_data:
+            # 解析数据
+            uptime_sec = latest_data.get('uptime', 0)
+            uptime = f'{int(uptime_sec / 86400)} 天' if uptime_sec > 0 else '⚠️掉线辣'
+
+            cpu_data = latest_data.get('cpu', {})
+            CPU = f"{cpu_data.get('usage', 0):.2f}"
+
+            ram_data = latest_data.get('ram', {})
+            mem_total = ram_data.get('total', 0)
+            mem_used = ram_data.get('used', 0)
+            MemTotal = humanize.naturalsize(mem_total, gnu=True)
+            MemUsed = humanize.naturalsize(mem_used, gnu=True)
+            Mempercent = f"{(mem_used / mem_total) * 100:.2f}" if mem_total != 0 else "0"
+
+            network_data = latest_data.get('network', {})
+            NetInSpeed = humanize.naturalsize(network_data.get('down', 0), gnu=True)
+            NetOutSpeed = humanize.naturalsize(network_data.get('up', 0), gnu=True)
+            NetInTransfer = humanize.naturalsize(network_data.get('totalDown', 0), gnu=True)
+            NetOutTransfer = humanize.naturalsize(network_data.get('totalUp', 0), gnu=True)
+        else:
+            uptime = '⚠️掉线辣'
+            CPU = "0.00"
+            MemTotal = "0"
+            MemUsed = "0"
+            Mempercent = "0"
+            NetInTransfer = "0"
+            NetOutTransfer = "0"
+            NetInSpeed = "0"
+            NetOutSpeed = "0"
+    else:
+        # 没有状态数据，可能离线
+        uptime = '⚠️掉线辣'
+        CPU = "0.00"
+        MemTotal = humanize.naturalsize(node.get('mem_total', 0), gnu=True)
+        MemUsed = "0"
+        Mempercent = "0"
+        NetInTransfer = "0"
+        NetOutTransfer = "0"
+        NetInSpeed = "0"
+        NetOutSpeed = "0"
+
+    # 使用节点的 region 信息
+    region = node.get('region', '')
+    display_name = f"{region} {node_name}".strip() if region else node_name
+
+    status_msg = f"· 🌐 服务器 | {display_name} · {uptime}\n" \
+                 f"· 💫 CPU | {CPU}% \n" \
+                 f"· 🌩️ 内存 | {Mempercent}% [{MemUsed}/{MemTotal}]\n" \
+                 f"· ⚡ 网速 | ↓{NetInSpeed}/s  ↑{NetOutSpeed}/s\n" \
+                 f"· 🌊 流量 | ↓{NetInTransfer}  ↑{NetOutTransfer}\n"
+    return dict(name=node_name, id=node_uuid, server=status_msg)
+
+
 async def sever_info_komari_async(tz, tz_api, tz_id):
     """
-    Komari API: 获取服务器信息
+    Komari API: 获取服务器信息，各节点的最近状态并发请求
     :param tz: Komari 面板地址
     :param tz_api: API Key (可选)
     :param tz_id: 要显示的节点 UUID 列表 (如果为空则显示所有)
@@ -79,138 +174,87 @@ async def sever_info_komari_async(tz, tz_api, tz_id):
     if not tz:
         return None
 
-    api = KomariAPI(tz, tz_api if tz_api else None)
-    b = []
+    api = get_client("komari", tz, tz_api=tz_api)
     try:
         # 获取所有节点列表
         nodes_resp = await api.get_nodes()
         if not nodes_resp or nodes_resp.get('status') != 'success':
             logger.warning(f"Komari 获取节点列表失败: {nodes_resp}")
-            await api.close()
             return None
 
         nodes = nodes_resp.get('data', [])
-        
-        for node in nodes:
-            node_uuid = node.get('uuid')
-            node_name = node.get('name', '未知节点')
-            
-            # 如果指定了 tz_id，只显示指定的节点
-            if tz_id:
-                # tz_id 可以是 UUID 字符串或者数字索引
-                if node_uuid not in tz_id and str(nodes.index(node) + 1) not in [str(x) for x in tz_id]:
-                    continue
-
-            # 获取节点最近状态
-            recent_resp = await api.get_node_recent(node_uuid)
-            
-            if recent_resp and recent_resp.get('status') == 'success' and recent_resp.get('data'):
-                # 获取最新的一条数据
-                latest_data = recent_resp['data'][-1] if recent_resp['data'] else None
-                
-                if latest_data:
-                    # 解析数据
-                    uptime_sec = latest_data.get('uptime', 0)
-                    uptime = f'{int(uptime_sec / 86400)} 天' if uptime_sec > 0 else '⚠️掉线辣'
-                    
-                    cpu_data = latest_data.get('cpu', {})
-                    CPU = f"{cpu_data.get('usage', 0):.2f}"
-                    
-                    ram_data = latest_data.get('ram', {})
-                    mem_total = ram_data.get('total', 0)
-                    mem_used = ram_data.get('used', 0)
-                    MemTotal = humanize.naturalsize(mem_total, gnu=True)
-                    MemUsed = humanize.naturalsize(mem_used, gnu=True)
-                    Mempercent = f"{(mem_used / mem_total) * 100:.2f}" if mem_total != 0 else "0"
-                    
-                    network_data = latest_data.get('network', {})
-                    NetInSpeed = humanize.naturalsize(network_data.get('down', 0), gnu=True)
-                    NetOutSpeed = humanize.naturalsize(network_data.get('up', 0), gnu=True)
-                    NetInTransfer = humanize.naturalsize(network_data.get('totalDown', 0), gnu=True)
-                    NetOutTransfer = humanize.naturalsize(network_data.get('totalUp', 0), gnu=True)
-                else:
-                    uptime = '⚠️掉线辣'
-                    CPU = "0.00"
-                    MemTotal = "0"
-                    MemUsed = "0"
-                    Mempercent = "0"
-                    NetInTransfer = "0"
-                    NetOutTransfer = "0"
-                    NetInSpeed = "0"
-                    NetOutSpeed = "0"
-            else:
-                # 没有状态数据，可能离线
-                uptime = '⚠️掉线辣'
-                CPU = "0.00"
-                MemTotal = humanize.naturalsize(node.get('mem_total', 0), gnu=True)
-                MemUsed = "0"
-                Mempercent = "0"
-                NetInTransfer = "0"
-                NetOutTransfer = "0"
-                NetInSpeed = "0"
-                NetOutSpeed = "0"
-
-            # 使用节点的 region 信息
-            region = node.get('region', '')
-            display_name = f"{region} {node_name}".strip() if region else node_name
-
-            status_msg = f"· 🌐 服务器 | {display_name} · {uptime}\n" \
-                         f"· 💫 CPU | {CPU}% \n" \
-                         f"· 🌩️ 内存 | {Mempercent}% [{MemUsed}/{MemTotal}]\n" \
-                         f"· ⚡ 网速 | ↓{NetInSpeed}/s  ↑{NetOutSpeed}/s\n" \
-                         f"· 🌊 流量 | ↓{NetInTransfer}  ↑{NetOutTransfer}\n"
-            b.append(dict(name=node_name, id=node_uuid, server=status_msg))
+        # 如果指定了 tz_id，只显示指定的节点；tz_id 可以是 UUID 字符串或者数字索引
+        wanted = {str(x) for x in tz_id} if tz_id else None
+        nodes = [node for i, node in enumerate(nodes, 1)
+                 if wanted is None or node.get('uuid') in wanted or str(i) in wanted]
 
-        await api.close()
+        recents = await asyncio.gather(*(api.get_node_recent(node.get('uuid')) for node in nodes))
+        b = [_komari_node_status(node, recent) for node, recent in zip(nodes, recents)]
         return b if b else None
     except Exception as e:
         logger.error(f"Komari 获取服务器信息异常: {e}")
-        await api.close()
         return None
 
 
-class NezhaV1API:
-    """Nezha V1 API 客户端"""
+class NezhaV1API(_ProbeClient):
+    """Nezha V1 API 客户端，token 缓存到过期前，临近过期时提前刷新"""
     MAX_RETRY = 2  # 最大重试次数，防止无限循环
 
     def __init__(self, dashboard_url, username, password):
+        super().__init__()
         self.base_url = dashboard_url.rstrip('/') + '/api/v1'
         self.username = username
         self.password = password
         self.token = None
-        self.session = None
+        self.token_expires_at = 0.0
         self.lock = asyncio.Lock()
 
-    async def _ensure_session(self):
-        if self.session is None or self.session.closed:
-            self.session = aiohttp.ClientSession()
+    def _set_token(self, token):
+        self.token = token
+        self.token_expires_at = jwt_expires_at(token) or time.time() + DEFAULT_TOKEN_TTL
 
-    async def close(self):
-        if self.session and not self.session.closed:
-            await self.session.close()
+    async def _refresh_token(self):
+        """用仍有效的 token 换新 token，避免重新登录"""
+        try:
+            async with self.session.get(f'{self.base_url}/refresh-token',
+                                        headers={'Authorization': f'Bearer {self.token}'}) as resp:
+                data = await resp.json()
+                if resp.status == 200 and data.get('success'):
+                    self._set_token(data['data']['token'])
+                    return True
+        except Exception as e:
+            logger.warning(f"Nezha V1 刷新 token 失败，将重新登录: {e}")
+        return False
+
+    async def _login(self):
+        login_url = f'{self.base_url}/login'
+        payload = {
+            'username': self.username,
+            'password': self.password
+        }
+        try:
+            async with self.session.post(login_url, json=payload) as resp:
+                data = await resp.json()
+                if data.get('success'):
+                    self._set_token(data['data']['token'])
+                    return True
+                else:
+                    logger.warning(f"Nezha V1 认证失败: {data.get('message', '未知错误')}")
+                    return False
+        except Exception as e:
+            logger.error(f"Nezha V1 认证异常: {e}")
+            return False
 
     async def authenticate(self):
         async with self.lock:
-            if self.token is not None:
+            remaining = self.token_expires_at - time.time() if self.token else 0
+            if remaining > TOKEN_REFRESH_MARGIN:
                 return True
             await self._ensure_session()
-            login_url = f'{self.base_url}/login'
-            payload = {
-                'username': self.username,
-                'password': self.password
-            }
-            try:
-                async with self.session.post(login_url, json=payload) as resp:
-                    data = await resp.json()
-                    if data.get('success'):
-                        self.token = data['data']['token']
-                        return True
-                    else:
-                        logger.warning(f"Nezha V1 认证失败: {data.get('message', '未知错误')}")
-                        return False
-            except Exception as e:
-                logger.error(f"Nezha V1 认证异常: {e}")
-                return False
+            if remaining > 0 and await self._refresh_token():
+                return True
+            self.token = None
+            return await self._login()
 
     async def request(self, method, endpoint, retry_count=0, **kwargs):
         if not await self.authenticate():
@@ -221,7 +265,7 @@ class NezhaV1API:
         headers['Authorization'] = f'Bearer {self.token}'
 
         try:
-            async with self.session.request(method, url, headers=headers, **kwargs) as resp:
+            async with self._timed(), self.session.request(method, url, headers=headers, **kwargs) as resp:
                 if resp.status == 401:
                     if retry_count >= self.MAX_RETRY:
                         logger.error(f"Nezha V1 请求重试次数过多: {endpoint}")
@@ -250,45 +294,58 @@ class NezhaV1API:
         return None
 
 
-def sever_info_v0(tz, tz_api, tz_id):
-    """V0 API: 使用 token 认证"""
-    if not tz or not tz_api or not tz_id: 
+class NezhaV0API(_ProbeClient):
+    """Nezha V0 API 客户端，使用后台 API Token 认证"""
+
+    def __init__(self, dashboard_url, api_token):
+        super().__init__()
+        self.base_url = dashboard_url.rstrip('/')
+        self.api_token = api_token
+
+    async def get_server_detail(self, server_id):
+        await self._ensure_session()
+        tz_url = f'{self.base_url}/api/v1/server/details?id={server_id}'
+        # 发送GET请求，获取服务器流量信息
+        async with self._timed(), self.session.get(tz_url, headers={'Authorization': self.api_token}) as resp:
+            return await resp.json(content_type=None)
+
+
+async def _v0_server_detail(api, x):
+    res = await api.get_server_detail(x)
+    detail = res["result"][0]
+    """cpu"""
+    uptime = f'{int(detail["status"]["Uptime"] / 86400)} 天' if detail["status"]["Uptime"] != 0 else '⚠️掉线辣'
+    CPU = f"{detail['status']['CPU']:.2f}"
+    """内存"""
+    MemTotal = humanize.naturalsize(detail['host']['MemTotal'], gnu=True)
+    MemUsed = humanize.naturalsize(detail['status']['MemUsed'], gnu=True)
+    Mempercent = f"{(detail['status']['MemUsed'] / detail['host']['MemTotal']) * 100:.2f}" if detail['host'][
+                                                                                                  'MemTotal'] != 0 else "0"
+    """流量"""
+    NetInTransfer = humanize.naturalsize(detail['status']['NetInTransfer'], gnu=True)
+    NetOutTransfer = humanize.naturalsize(detail['status']['NetOutTransfer'], gnu=True)
+    """网速"""
+    NetInSpeed = humanize.naturalsize(detail['status']['NetInSpeed'], gnu=True)
+    NetOutSpeed = humanize.naturalsize(detail['status']['NetOutSpeed'], gnu=True)
+
+    status_msg = f"· 🌐 服务器 | {detail['name']} · {uptime}\n" \
+                 f"· 💫 CPU | {CPU}% \n" \
+                 f"· 🌩️ 内存 | {Mempercent}% [{MemUsed}/{MemTotal}]\n" \
+                 f"· ⚡ 网速 | ↓{NetInSpeed}/s  ↑{NetOutSpeed}/s\n" \
+                 f"· 🌊 流量 | ↓{NetInTransfer}  ↑{NetOutTransfer}\n"
+    return dict(name=f'{detail["name"]}', id=detail["id"], server=status_msg)
+
+
+async def sever_info_v0_async(tz, tz_api, tz_id):
+    """V0 API: 使用 token 认证，各服务器并发请求"""
+    if not tz or not tz_api or not tz_id:
         return None
-    # 请求头
-    tz_headers = {
-        'Authorization': tz_api  # 后台右上角下拉菜单获取 API Token
-    }
-    b = []
+    # tz_api 为后台右上角下拉菜单获取的 API Token
+    api = get_client("v0", tz, tz_api=tz_api)
     try:
-        # 请求地址
-        for x in tz_id:
-            tz_url = f'{tz}/api/v1/server/details?id={x}'
-            # 发送GET请求，获取服务器流量信息
-            res = r.get(tz_url, headers=tz_headers).json()
-            detail = res["result"][0]
-            """cpu"""
-            uptime = f'{int(detail["status"]["Uptime"] / 86400)} 天' if detail["status"]["Uptime"] != 0 else '⚠️掉线辣'
-            CPU = f"{detail['status']['CPU']:.2f}"
-            """内存"""
-            MemTotal = humanize.naturalsize(detail['host']['MemTotal'], gnu=True)
-            MemUsed = humanize.naturalsize(detail['status']['MemUsed'], gnu=True)
-            Mempercent = f"{(detail['status']['MemUsed'] / detail['host']['MemTotal']) * 100:.2f}" if detail['host'][
-                                                                                                          'MemTotal'] != 0 else "0"
-            """流量"""
-            NetInTransfer = humanize.naturalsize(detail['status']['NetInTransfer'], gnu=True)
-            NetOutTransfer = humanize.naturalsize(detail['status']['NetOutTransfer'], gnu=True)
-            """网速"""
-            NetInSpeed = humanize.naturalsize(detail['status']['NetInSpeed'], gnu=True)
-            NetOutSpeed = humanize.naturalsize(detail['status']['NetOutSpeed'], gnu=True)
-
-            status_msg = f"· 🌐 服务器 | {detail['name']} · {uptime}\n" \
-                         f"· 💫 CPU | {CPU}% \n" \
-                         f"· 🌩️ 内存 | {Mempercent}% [{MemUsed}/{MemTotal}]\n" \
-                         f"· ⚡ 网速 | ↓{NetInSpeed}/s  ↑{NetOutSpeed}/s\n" \
-                         f"· 🌊 流量 | ↓{NetInTransfer}  ↑{NetOutTransfer}\n"
-            b.append(dict(name=f'{detail["name"]}', id=detail["id"], server=status_msg))
-        return b
-    except:
+        return list(await asyncio.gather(*(_v0_server_detail(api, x) for x in tz_id)))
+    except Exception as e:
+        logger.error(f"Nezha V0 获取服务器信息异常: {e}")
         return None
 
 
@@ -297,13 +354,12 @@ async def sever_info_v1_async(tz, tz_username, tz_password, tz_id):
     if not tz or not tz_username or not tz_password:
         return None
 
-    api = NezhaV1API(tz, tz_username, tz_password)
+    api = get_client("v1", tz, tz_username=tz_username, tz_password=tz_password)
     b = []
     try:
         servers = await api.get_servers()
         if not servers or not servers.get('success'):
             logger.warning(f"Nezha V1 获取服务器列表失败: {servers}")
-            await api.close()
             return None
 
         for server in servers['data']:
@@ -349,15 +405,31 @@ async def sever_info_v1_async(tz, tz_username, tz_password, tz_id):
                          f"· ⚡ 网速 | ↓{NetInSpeed}/s  ↑{NetOutSpeed}/s\n" \
                          f"· 🌊 流量 | ↓{NetInTransfer}  ↑{NetOutTransfer}\n"
             b.append(dict(name=f'{server["name"]}', id=server["id"], server=status_msg))
-        
-        await api.close()
+
         return b if b else None
     except Exception as e:
         logger.error(f"Nezha V1 获取服务器信息异常: {e}")
-        await api.close()
         return None
 
 
+# (版本, 地址, 凭据) -> 长连接客户端，配置不变时所有轮询共用
+_clients = {}
+
+
+def get_client(tz_version, tz, tz_api=None, tz_username=None, tz_password=None):
+    """获取（必要时创建）与当前配置对应的探针客户端"""
+    if tz_version == "v1":
+        key, factory = ("v1", tz, tz_username, tz_password), lambda: NezhaV1API(tz, tz_username, tz_password)
+    elif tz_version == "komari":
+        key, factory = ("komari", tz, tz_api), lambda: KomariAPI(tz, tz_api if tz_api else None)
+    else:
+        key, factory = ("v0", tz, tz_api), lambda: NezhaV0API(tz, tz_api)
+    client = _clients.get(key)
+    if client is None:
+        client = _clients[key] = factory()
+    return client
+
+
 async def sever_info(tz, tz_api, tz_id, tz_version="v0", tz_username=None, tz_password=None):
     """
     获取服务器信息的统一入口
@@ -369,7 +441,6 @@ async def sever_info(tz, tz_api, tz_id, tz_version="v0", tz_username=None, tz_pa
     :param tz_password: V1 密码
     :return: 服务器信息列表
     """
-    print(f"使用探针 API 版本: {tz_version}")
     if tz_version == "v1":
         # V1 使用异步调用
         return await sever_info_v1_async(tz, tz_username, tz_password, tz_id)
@@ -377,5 +448,5 @@ async def sever_info(tz, tz_api, tz_id, tz_version="v0", tz_username=None, tz_pa
         # Komari 使用异步调用
         return await sever_info_komari_async(tz, tz_api, tz_id)
     else:
-        # 默认使用 V0 API (同步调用)
-        return sever_info_v0(tz, tz_api, tz_id)
+        # 默认使用 V0 API
+        return await sever_info_v0_async(tz, tz_api, tz_id)
@@ -0,0 +1,100 @@
+"""
+通知扇出队列：同一用户短时间内的多条更新合并为一条摘要消息，并按全局速率发送，避免触发 Telegram 限流
+"""
+import asyncio
+import time
+from collections import OrderedDict
+
+from pyrogram.errors import FloodWait
+
+from bot import LOGGER, bot
+
+# 用户收到第一条更新后等待多久再发送摘要（秒）
+# 入库通知已先经过 media_notify_window 合并，这里只需合并相邻几个窗口的更新，总延迟约为两者之和
+DIGEST_DELAY = 15
+# 全局每秒最多发送的消息数，Telegram 对机器人的上限约为 30 条/秒
+SEND_RATE = 20
+# 单条消息长度上限
+MAX_MESSAGE_LENGTH = 4000
+
+
+class NotifyQueue:
+    def __init__(self, delay: float = DIGEST_DELAY, rate: float = SEND_RATE):
+        self.delay = delay
+        self.interval = 1 / rate
+        # tg -> {header: {group: [item, ...]}}
+        self._pending: dict = {}
+        self._queue: asyncio.Queue = None
+        self._worker: asyncio.Task = None
+        self._last_send = 0.0
+
+    def add(self, tg: int, header: str, group: str, item: str):
+        """
+        登记一条更新，delay 秒后与该用户其他更新合并发送
+        :param header: 摘要段落标题，如 剧集名
+        :param group: 段落内分组，如 季名
+        :param item: 分组内条目，如 第3集，重复条目会去重
+        """
+        first = tg not in self._pending
+        groups = self._pending.setdefault(tg, OrderedDict()).setdefault(header, OrderedDict())
+        items = groups.setdefault(group, [])
+        if item not in items:
+            items.append(item)
+        if first:
+            asyncio.get_running_loop().call_later(self.delay, self._enqueue, tg)
+
+    def _enqueue(self, tg: int):
+        sections = self._pending.pop(tg, None)
+        if not sections:
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        for text in self._render(sections):
+            self._queue.put_nowait((tg, text))
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    @staticmethod
+    def _render(sections) -> list:
+        blocks = []
+        for header, groups in sections.items():
+            lines = [header]
+            lines.extend(f"{group}：{'、'.join(items)}" if group else '、'.join(items)
+                         for group, items in groups.items())
+            blocks.append('\n'.join(lines))
+        # 超长摘要按段落拆分为多条消息
+        messages, current = [], ''
+        for block in blocks:
+            if current and len(current) + len(block) + 2 > MAX_MESSAGE_LENGTH:
+                messages.append(current)
+                current = ''
+            current = f"{current}\n\n{block}" if current else block[:MAX_MESSAGE_LENGTH]
+        if current:
+            messages.append(current)
+        return messages
+
+    async def _run(self):
+        while not self._queue.empty():
+            tg, text = self._queue.get_nowait()
+            await self._send(tg, text)
+
+    async def _send(self, tg: int, text: str):
+        wait = self._last_send + self.interval - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        self._last_send = time.monotonic()
+        try:
+            await bot.send_message(chat_id=tg, text=text)
+        except FloodWait as f:
+            LOGGER.warning(f"发送通知触发限流，等待 {f.value} 秒: {tg}")
+            await asyncio.sleep(f.value * 1.2)
+            self._last_send = time.monotonic()
+            try:
+                await bot.send_message(chat_id=tg, text=text)
+            except Exception as e:
+                LOGGER.error(f"发送通知失败: {tg} - {str(e)}")
+        except Exception as e:
+            LOGGER.error(f"发送通知失败: {tg} - {str(e)}")
+
+
+notify_queue = NotifyQueue()
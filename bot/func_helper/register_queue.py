@@ -8,7 +8,9 @@ from bot.func_helper.concurrency import get_user_lock
 from bot.func_helper.emby import emby
 from bot.func_helper.fix_bottons import re_create_ikb
 from bot.func_helper.msg_utils import editMessage, sendMessage
-from bot.func_helper.utils import tem_adduser
+from bot.func_helper.utils import tem_update
+from bot.sql_helper.sql_counter import OPEN_TEM, sql_reserve_slot, sql_commit_slot, sql_release_slot, \
+    sql_expire_slots, sql_get_counter
 from bot.sql_helper.sql_emby import sql_get_emby, sql_update_emby, Emby
 
 @dataclass
@@ -19,14 +21,24 @@ class RegisterJob:
     stats: bool
     days: int
     status_message: object
+    # 预留的席位是否已提交为已注册
+    committed: bool = False
 
 
 class RegisterQueueManager:
-    def __init__(self):
+    """
+    注册席位在数据库中预留/提交/释放（见 sql_counter），多实例共享同一上限且不会超发；
+    本进程只负责排队、去重和控制 worker 并发
+    """
+
+    def __init__(self, counter: str = OPEN_TEM):
+        self.counter = counter
         self._queue: asyncio.Queue[RegisterJob] = asyncio.Queue()
         self._workers: list[asyncio.Task] = []
         self._busy_users: set[int] = set()
+        # 本进程持有的预留数，以及正在向数据库预留、尚未入队的数量
         self._reserved_slots = 0
+        self._pending = 0
         self._lock = asyncio.Lock()
         self._active_jobs = 0
 
@@ -41,7 +53,7 @@ class RegisterQueueManager:
 
     def _max_waiting_queue_size_locked(self) -> int:
         remaining_after_active = self._remaining_slot_count_locked() - self._active_jobs
-        return max(0, min(self._configured_queue_limit(), remaining_after_active))
+        return max(0, min(self._configured_queue_limit(), remaining_after_active)) - self._pending
 
     async def ensure_started(self):
         async with self._lock:
@@ -55,19 +67,49 @@ class RegisterQueueManager:
         async with self._lock:
             return user_id in self._busy_users
 
+    async def _refresh_tem(self):
+        """已注册席位以数据库为准，其他实例的注册/释放也要反映到本进程；读取失败时沿用内存中的值"""
+        _open.tem = await asyncio.to_thread(sql_get_counter, self.counter, int(_open.tem or 0))
+
+    async def _reserve(self, user_id: int) -> str:
+        cap = int(_open.all_user)
+        reason = await asyncio.to_thread(sql_reserve_slot, user_id, cap, self.counter)
+        if reason in ("slot_full", "duplicate"):
+            # 可能是崩溃遗留、已过期的预留占着席位，回收后重试一次
+            if await asyncio.to_thread(sql_expire_slots, self.counter):
+                reason = await asyncio.to_thread(sql_reserve_slot, user_id, cap, self.counter)
+        if reason == "slot_full":
+            # 满员提示展示的席位数取最新值
+            await self._refresh_tem()
+        return reason
+
     async def enqueue(self, job: RegisterJob) -> tuple[bool, str, Optional[int]]:
+        """
+        :return: (是否入队, queued/duplicate/queue_full/slot_full/error, 排队序号)
+        """
         await self.ensure_started()
+        await self._refresh_tem()
         async with self._lock:
             if job.user_id in self._busy_users:
                 return False, "duplicate", None
-            current_tem = int(_open.tem or 0)
-            if current_tem + self._reserved_slots >= _open.all_user:
-                return False, "slot_full", None
             if self._queue.qsize() >= self._max_waiting_queue_size_locked():
                 return False, "queue_full", None
+            self._busy_users.add(job.user_id)
+            self._pending += 1
 
+        # 数据库预留不持有本地锁，多个用户的预留可以并发进行
+        try:
+            reason = await self._reserve(job.user_id)
+        except Exception as e:
+            LOGGER.exception(f"注册席位预留异常: tg={job.user_id}, error={e}")
+            reason = "error"
+
+        async with self._lock:
+            self._pending -= 1
+            if reason != "reserved":
+                self._busy_users.discard(job.user_id)
+                return False, reason, None
             ahead = self._active_jobs + self._queue.qsize()
-            self._busy_users.add(job.user_id)
             self._reserved_slots += 1
             await self._queue.put(job)
             return True, "queued", ahead + 1
@@ -84,12 +126,30 @@ class RegisterQueueManager:
                 LOGGER.exception(f"注册队列worker异常[{worker_index}]: {e}")
                 await self._safe_edit(job.status_message, "❌ 注册任务执行异常，请稍后重试。", re_create_ikb)
             finally:
+                if not job.committed:
+                    await self._release_slot(job.user_id)
                 async with self._lock:
                     self._active_jobs = max(0, self._active_jobs - 1)
                     self._busy_users.discard(job.user_id)
                     self._reserved_slots = max(0, self._reserved_slots - 1)
                 self._queue.task_done()
 
+    async def _release_slot(self, user_id: int):
+        try:
+            await asyncio.to_thread(sql_release_slot, user_id, self.counter)
+        except Exception as e:
+            # 释放失败的预留会在过期后被回收
+            LOGGER.exception(f"注册席位释放异常: tg={user_id}, error={e}")
+
+    async def _commit_slot(self, job: RegisterJob):
+        tem = await asyncio.to_thread(sql_commit_slot, job.user_id, self.counter)
+        if tem is None:
+            LOGGER.error(f"注册席位提交失败，已注册席位可能偏少，可在注册面板校准: tg={job.user_id}")
+            tem = int(_open.tem or 0) + 1
+        else:
+            job.committed = True
+        tem_update(tem)
+
     async def _process_job(self, job: RegisterJob):
         async with get_user_lock(job.user_id):
             current = sql_get_emby(tg=job.user_id)
@@ -99,12 +159,6 @@ class RegisterQueueManager:
                 return await self._safe_edit(job.status_message, "💦 你已经有账户啦！请勿重复注册。")
             if not job.stats and int(current.us or 0) <= 0:
                 return await self._safe_edit(job.status_message, "🤖 当前没有可用注册资格，请重新领取注册码后再试。")
-            if _open.tem >= _open.all_user:
-                return await self._safe_edit(
-                    job.status_message,
-                    f'**🚫 很抱歉，剩余可注册总数({_open.tem})，已达总注册限制({_open.all_user})。**',
-                )
-
             await self._safe_edit(
                 job.status_message,
                 f'🆗 已进入处理\n\n用户名：**{job.username}**  安全码：**{job.pwd2}** \n\n__正在为您初始化账户，更新用户策略__......',
@@ -155,7 +209,7 @@ class RegisterQueueManager:
                 await self._rollback_created_account(job.user_id, eid, "创建后写入数据库失败")
                 return await self._safe_edit(job.status_message, "❌ 账户初始化失败，请稍后重试。")
 
-            tem_adduser()
+            await self._commit_slot(job)
 
             if schedall.check_ex:
                 ex_text = ex.strftime("%Y-%m-%d %H:%M:%S")
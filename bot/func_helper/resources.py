@@ -0,0 +1,58 @@
+"""
+静态资源注册表：语录等 JSON 资源只解析、校验一次，之后直接返回内存中的不可变对象
+每隔 CHECK_INTERVAL 秒最多 stat 一次文件，mtime 变化时重新加载；新文件校验失败则继续使用旧内容
+"""
+import json
+import os
+import time
+from typing import Dict, Type
+
+from pydantic import BaseModel
+
+from bot import LOGGER
+from bot.schemas import Yulv
+
+CHECK_INTERVAL = 5.0
+
+
+class StaticResource:
+    def __init__(self, path: str, model: Type[BaseModel], check_interval: float = CHECK_INTERVAL):
+        self.path = path
+        self.model = model
+        self.check_interval = check_interval
+        self._value = None
+        self._mtime = None
+        self._checked = 0.0
+
+    def _load(self, mtime):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            value = self.model(**json.load(f))
+        self._value, self._mtime = value, mtime
+        LOGGER.info(f'已加载资源 {self.path}')
+
+    def get(self):
+        now = time.monotonic()
+        if self._value is not None and now - self._checked < self.check_interval:
+            return self._value
+        self._checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime != self._mtime:
+                self._load(mtime)
+        except Exception as e:
+            if self._value is None:
+                raise
+            LOGGER.error(f'重新加载资源 {self.path} 失败，继续使用旧内容: {e}')
+        return self._value
+
+
+resources: Dict[str, StaticResource] = {}
+
+
+def register(name: str, path: str, model: Type[BaseModel]) -> StaticResource:
+    resources[name] = StaticResource(path, model)
+    return resources[name]
+
+
+# 语录：wh_msg / red_bag / white_list
+yulv = register('yulv', 'bot/func_helper/yvlu.json', Yulv)
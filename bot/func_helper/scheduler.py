@@ -1,7 +1,26 @@
 import asyncio
+import functools
+from datetime import datetime, timedelta
+
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
 from bot import LOGGER
+from bot.func_helper.job_profiler import install_hooks, profile_job
 from bot.func_helper.utils import Singleton
+from bot.sql_helper.sql_sched import sql_start_job_run, sql_finish_job_run, sql_get_last_success, \
+    sql_mark_stale_job_runs, sql_prune_job_runs
+
+
+def _previous_fire_time(trigger, now, window: timedelta):
+    """
+    计算 trigger 在 (now - window, now] 内最后一次应触发的时间
+    """
+    fire_time = trigger.get_next_fire_time(None, now - window)
+    previous = None
+    while fire_time and fire_time <= now:
+        previous = fire_time
+        fire_time = trigger.get_next_fire_time(fire_time, fire_time + timedelta(microseconds=1))
+    return previous
 
 
 class Scheduler(metaclass=Singleton):
@@ -9,20 +28,101 @@ class Scheduler(metaclass=Singleton):
         # 创建一个AsyncIOScheduler对象，并传入时区、容忍度和事件循环参数
         self.SCHEDULER = AsyncIOScheduler(timezone=timezone, misfire_grace_time=misfire_grace_time, max_instances=5,
                                           event_loop=event_loop or asyncio.get_event_loop())
+        # 正在运行的任务id，防止同一任务重叠执行（定时触发与手动命令共用）
+        self._running_jobs: set = set()
+        # 启动时需要检查是否错过运行的任务id
+        self._catch_up_jobs: set = set()
+        # 进程启动时间，早于此时仍为 running 的记录属于之前的进程
+        self.started_at = datetime.now()
+        # 挂载任务剖析用的数据库/Telegram 调用计数
+        install_hooks()
         # 启动调度器
         self.SCHEDULER.start()
         # 设置日志级别为INFO
         # logging.basicConfig(level=logging.INFO)
 
+    def guard(self, func, job_id=None):
+        """
+        包装任务函数：同一 job_id 同时只运行一个，每次运行写入 sched_job_runs
+        已包装过的函数直接返回，定时任务和手动命令应使用同一个包装后的函数
+        """
+        job_id = job_id or func.__name__
+        if getattr(func, '__sched_job_id__', None) == job_id:
+            return func
+
+        @functools.wraps(func)
+        async def wrapper(*args, _run_trigger='manual', **kwargs):
+            if job_id in self._running_jobs:
+                LOGGER.warning(f"任务 {job_id} 仍在运行，跳过本次({_run_trigger})执行")
+                sql_start_job_run(job_id, trigger=_run_trigger, status='skipped')
+                return None
+            self._running_jobs.add(job_id)
+            run_id = sql_start_job_run(job_id, trigger=_run_trigger)
+            try:
+                with profile_job() as stats:
+                    result = await func(*args, **kwargs)
+            except Exception as e:
+                sql_finish_job_run(run_id, 'failed', duration=stats.duration, error=repr(e), stats=stats.columns())
+                LOGGER.error(f"任务 {job_id} 执行失败: {e}")
+                raise
+            else:
+                sql_finish_job_run(run_id, 'success', duration=stats.duration, stats=stats.columns())
+                LOGGER.info(f"任务 {job_id} 完成 耗时{stats.duration:.1f}s emby={stats.emby_calls} "
+                            f"db={stats.db_calls} tg={stats.tg_calls}")
+                return result
+            finally:
+                self._running_jobs.discard(job_id)
+
+        wrapper.__sched_job_id__ = job_id
+        return wrapper
+
+    def is_job_running(self, job_id) -> bool:
+        return job_id in self._running_jobs
+
     # 函数、触发器、
-    def add_job(self, func, trigger, **kwargs):
-        # 调用调度器的add_job方法，添加定时任务
+    def add_job(self, func, trigger, catch_up=True, **kwargs):
+        """
+        :param catch_up: 启动时是否补跑错过的运行；非幂等的任务（如发放积分）应传 False，
+                         否则提交后崩溃、记录为失败的运行会被再次执行
+        """
+        # 调用调度器的add_job方法，添加定时任务，任务会被 guard 包装并替换同id的旧任务
         try:
-            self.SCHEDULER.add_job(func, trigger, **kwargs)
+            job_id = kwargs.setdefault('id', func.__name__)
+            job_kwargs = dict(kwargs.pop('kwargs', None) or {})
+            job_kwargs['_run_trigger'] = trigger if isinstance(trigger, str) else 'scheduled'
+            kwargs.setdefault('replace_existing', True)
+            kwargs.setdefault('max_instances', 1)
+            kwargs.setdefault('coalesce', True)
+            self.SCHEDULER.add_job(self.guard(func, job_id), trigger, kwargs=job_kwargs, **kwargs)
+            if catch_up:
+                self._catch_up_jobs.add(job_id)
+            else:
+                self._catch_up_jobs.discard(job_id)
             LOGGER.info(f"Added a job: {func.__name__} with {trigger} trigger and {kwargs} arguments.")
         except Exception as e:
             LOGGER.error(f"Failed to add a job: {e}")
 
+    async def catch_up_missed_runs(self, window: timedelta = timedelta(days=1)):
+        """
+        启动时补跑：cron 任务在 window 内应触发过、但最后一次成功早于该触发时间的，立即补跑一次
+        从未成功运行过的任务（新部署）不补跑
+        """
+        sql_mark_stale_job_runs(self.started_at)
+        sql_prune_job_runs()
+        now = datetime.now(self.SCHEDULER.timezone)
+        jobs = [job for job in self.SCHEDULER.get_jobs()
+                if job.id in self._catch_up_jobs and isinstance(job.trigger, CronTrigger)]
+        last_success = sql_get_last_success([job.id for job in jobs])
+        for job in jobs:
+            success_at = last_success.get(job.id)
+            if success_at is None:
+                continue
+            previous = _previous_fire_time(job.trigger, now, window)
+            if previous is None or success_at >= previous.astimezone().replace(tzinfo=None):
+                continue
+            LOGGER.info(f"任务 {job.id} 错过了 {previous} 的运行(最后成功 {success_at})，开始补跑")
+            asyncio.create_task(job.func(*job.args, **{**job.kwargs, '_run_trigger': 'catch_up'}))
+
     def remove_job(self, job_id=None, jobstore=None):
         # 调用调度器的remove_job方法，移除一个定时任务
         try:
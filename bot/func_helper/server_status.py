@@ -0,0 +1,55 @@
+"""
+服务器状态快照：后台按间隔轮询探针，面板直接读取内存中的快照，不在点击时请求探针
+"""
+import asyncio
+import time
+
+from bot import LOGGER, tz_ad, tz_api, tz_id, tz_version, tz_username, tz_password, tz_poll_interval
+from bot.func_helper import nezha_res
+
+
+class ServerStatusCollector:
+    def __init__(self, interval: float):
+        self.interval = max(interval, 10)
+        # 按探针返回顺序保存 {id: dict(name, id, server)}；某次轮询失败时保留上一次的结果
+        self._nodes: dict = {}
+        self.updated_at: float = 0.0
+        # 最近一次轮询中探针接口的响应延迟（毫秒）
+        self.latency: float = None
+        self._task: asyncio.Task = None
+
+    @property
+    def snapshot(self) -> list:
+        return list(self._nodes.values())
+
+    def get(self, server_id):
+        return self._nodes.get(server_id)
+
+    async def refresh(self):
+        start = time.perf_counter()
+        servers = await nezha_res.sever_info(tz_ad, tz_api, tz_id, tz_version, tz_username, tz_password)
+        self.latency = nezha_res.get_client(tz_version, tz_ad, tz_api, tz_username, tz_password).latency
+        if not servers:
+            LOGGER.warning('服务器状态轮询无结果，继续使用上一次的快照')
+            return
+        self._nodes = {s['id']: s for s in servers}
+        self.updated_at = time.time()
+        LOGGER.debug(f'服务器状态已更新 {len(servers)} 个节点，耗时 {time.perf_counter() - start:.2f}s，'
+                     f'探针延迟 {self.latency or 0:.0f}ms')
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                LOGGER.error(f'服务器状态轮询异常: {e}')
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """未配置探针时不启动"""
+        if not tz_ad or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.get_event_loop().create_task(self._run())
+
+
+server_status = ServerStatusCollector(tz_poll_interval)
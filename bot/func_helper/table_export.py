@@ -0,0 +1,219 @@
+"""
+内置表导出/恢复：不依赖 mysqldump，用服务端游标流式读取本bot的表，写成可恢复的 JSON Lines（外层再压缩）
+
+文件格式，每行一个 JSON：
+    {"format": "sakura-tables", "version": 1, "created_at": "..."}
+    {"table": "emby", "columns": ["tg", "embyid", ...]}
+    ["行数据", ...]
+    {"end": "emby", "rows": 123}
+"""
+import base64
+import glob
+import gzip
+import io
+import json
+import os
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Dict, Iterable, List
+
+from sqlalchemy import insert, select
+
+from bot import LOGGER
+
+EXPORT_FORMAT = 'sakura-tables'
+EXPORT_VERSION = 1
+# 服务端游标每次取回的行数，以及恢复时每条 INSERT 的行数
+BATCH_SIZE = 1000
+
+
+class ExportFormatError(Exception):
+    pass
+
+
+def bot_tables(names: Iterable[str] = None):
+    """本bot的全部表（按外键依赖排序），names 不为空时只返回其中的表"""
+    from bot.sql_helper import Base
+    from bot.sql_helper import sql_code, sql_counter, sql_emby, sql_emby2, sql_favorites, sql_ledger, sql_partition, \
+        sql_request_record, sql_sched  # noqa: F401
+
+    tables = Base.metadata.sorted_tables
+    if names:
+        names = set(names)
+        tables = [t for t in tables if t.name in names]
+    return tables
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, time):
+        return {'$time': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'$dec': str(value)}
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {'$b64': base64.b64encode(bytes(value)).decode()}
+    raise TypeError(f'无法导出的类型 {type(value)}')
+
+
+def _decode(obj: dict):
+    if len(obj) == 1:
+        key, value = next(iter(obj.items()))
+        if key == '$dt':
+            return datetime.fromisoformat(value)
+        if key == '$date':
+            return date.fromisoformat(value)
+        if key == '$time':
+            return time.fromisoformat(value)
+        if key == '$dec':
+            return Decimal(value)
+        if key == '$b64':
+            return base64.b64decode(value)
+    return obj
+
+
+def _dumps(obj) -> bytes:
+    return (json.dumps(obj, default=_encode, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def export_tables(engine, fileobj, tables=None) -> Dict[str, int]:
+    """
+    导出表到二进制可写对象 fileobj，所有表在同一个事务内读取（InnoDB 下为一致性快照）
+    :param tables: sqlalchemy Table 列表，默认本bot的全部表
+    :return: {表名: 行数}
+    """
+    tables = tables if tables is not None else bot_tables()
+    counts = {}
+    fileobj.write(_dumps({'format': EXPORT_FORMAT, 'version': EXPORT_VERSION,
+                          'created_at': datetime.now().isoformat(), 'tables': [t.name for t in tables]}))
+    with engine.connect() as conn, conn.begin():
+        for table in tables:
+            columns = [c.name for c in table.columns]
+            fileobj.write(_dumps({'table': table.name, 'columns': columns}))
+            stmt = select(table).order_by(*table.primary_key.columns)
+            result = conn.execution_options(stream_results=True, yield_per=BATCH_SIZE).execute(stmt)
+            rows = 0
+            for row in result:
+                fileobj.write(_dumps(list(row)))
+                rows += 1
+            fileobj.write(_dumps({'end': table.name, 'rows': rows}))
+            counts[table.name] = rows
+    return counts
+
+
+def _insert_batch(conn, table, columns, batch):
+    conn.execute(insert(table), [dict(zip(columns, row)) for row in batch])
+
+
+def restore_tables(engine, fileobj, tables: Iterable[str] = None, replace: bool = True) -> Dict[str, int]:
+    """
+    从 export_tables 的输出恢复，整个恢复在一个事务内完成
+    :param tables: 只恢复这些表名，默认文件中的全部表
+    :param replace: True 时先清空目标表
+    :return: {表名: 恢复行数}
+    """
+    known = {t.name: t for t in bot_tables()}
+    only = set(tables) if tables else None
+    lines = io.TextIOWrapper(fileobj, encoding='utf-8')
+    try:
+        header = json.loads(next(lines, 'null'))
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get('format') != EXPORT_FORMAT:
+        raise ExportFormatError('不是有效的表导出文件')
+    if header.get('version', 0) > EXPORT_VERSION:
+        raise ExportFormatError(f"导出文件版本 {header.get('version')} 高于当前支持的 {EXPORT_VERSION}")
+
+    counts = {}
+    with engine.begin() as conn:
+        table = columns = keep = None
+        batch: List[list] = []
+        rows = 0
+        for line in lines:
+            record = json.loads(line, object_hook=_decode)
+            if isinstance(record, list):
+                rows += 1
+                if table is None:
+                    continue
+                batch.append([record[i] for i in keep])
+                if len(batch) >= BATCH_SIZE:
+                    _insert_batch(conn, table, columns, batch)
+                    batch = []
+            elif 'table' in record:
+                name, rows = record['table'], 0
+                if name not in known:
+                    LOGGER.warning(f"导出文件中的表 {name} 不属于当前版本，跳过")
+                table = known.get(name) if only is None or name in only else None
+                if table is None:
+                    continue
+                table.create(conn, checkfirst=True)
+                # 只恢复当前模型中仍存在的列
+                keep = [i for i, c in enumerate(record['columns']) if c in table.columns]
+                columns = [record['columns'][i] for i in keep]
+                if len(columns) != len(record['columns']):
+                    LOGGER.warning(f"表 {name} 忽略已不存在的列 {set(record['columns']) - set(columns)}")
+                if replace:
+                    conn.execute(table.delete())
+            elif 'end' in record:
+                if rows != record['rows']:
+                    raise ExportFormatError(f"表 {record['end']} 行数不符: {rows} != {record['rows']}")
+                if table is not None:
+                    if batch:
+                        _insert_batch(conn, table, columns, batch)
+                        batch = []
+                    counts[table.name] = rows
+                table = None
+    return counts
+
+
+class _ChainedReader(io.RawIOBase):
+    """把分卷文件按顺序串成一个只读流"""
+
+    def __init__(self, paths: List[str]):
+        self._paths = list(paths)
+        self._file = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while True:
+            if self._file is None:
+                if not self._paths:
+                    return 0
+                self._file = open(self._paths.pop(0), 'rb')
+            n = self._file.readinto(buffer)
+            if n:
+                return n
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        super().close()
+
+
+def open_export(path: str):
+    """
+    打开导出文件用于恢复，path 不存在时查找 path.part001 ... 分卷；按后缀选择 gzip/zstd 解压
+    """
+    paths = [path] if os.path.exists(path) else sorted(glob.glob(f'{glob.escape(path)}.part[0-9][0-9][0-9]'))
+    if not paths:
+        raise FileNotFoundError(path)
+    raw = io.BufferedReader(_ChainedReader(paths))
+    if path.endswith('.gz'):
+        return gzip.GzipFile(fileobj=raw, mode='rb')
+    if path.endswith('.zst'):
+        import zstandard
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw))
+    return raw
+
+
+def restore_from_file(path: str, engine=None, tables: Iterable[str] = None, replace: bool = True) -> Dict[str, int]:
+    if engine is None:
+        from bot.sql_helper import engine
+    with open_export(path) as fileobj:
+        return restore_tables(engine, fileobj, tables=tables, replace=replace)
@@ -1,13 +1,21 @@
 import pytz
 
 from bot import bot, _open, save_config, owner, admins, bot_name, ranks, schedall, group, config
-from bot.sql_helper.sql_code import sql_add_code
+from bot.sql_helper.sql_code import sql_add_code, sql_existing_codes, sql_mint_codes, sql_get_minted_codes
 from bot.sql_helper.sql_emby import sql_get_emby
+from bot.sql_helper.sql_counter import OPEN_TEM, sql_init_counter, sql_add_counter, sql_set_counter, sql_get_counter
 from cacheout import Cache
 
 cache = Cache()
 
 
+def load_tem():
+    """已注册席位以数据库计数为准，首次运行时用 config 中的 tem 初始化；开机时调用"""
+    tem = sql_init_counter(OPEN_TEM, _open.tem)
+    if tem is not None:
+        _open.tem = tem
+
+
 def judge_admins(uid):
     """
     判断是否admin
@@ -58,24 +66,38 @@ async def open_check():
     """
     open_stats = _open.stat
     all_user = _open.all_user
-    tem = _open.tem
+    tem = await refresh_tem()
     timing = _open.timing
     return open_stats, all_user, tem, timing
 
 
-def tem_adduser():
-    _open.tem = _open.tem + 1
-    if _open.tem >= _open.all_user:
+async def refresh_tem() -> int:
+    """已注册席位以数据库为准，读取后同步到内存；读取失败时沿用内存中的值"""
+    _open.tem = await asyncio.to_thread(sql_get_counter, OPEN_TEM, int(_open.tem or 0))
+    return _open.tem
+
+
+def tem_update(tem: int):
+    """更新内存中的已注册席位，满员时关闭注册（只有注册开关变化时才写回配置）"""
+    _open.tem = tem
+    if _open.tem >= _open.all_user and _open.stat:
         _open.stat = False
-    save_config()
+        save_config()
 
 
 def tem_deluser():
-    _open.tem = _open.tem - 1
-    save_config()
+    tem = sql_add_counter(OPEN_TEM, -1)
+    _open.tem = tem if tem is not None else _open.tem - 1
 
 
-from random import choice
+def tem_set(value: int):
+    """按数据库实际账户数校准已注册席位"""
+    sql_set_counter(OPEN_TEM, value)
+    _open.tem = value
+
+
+import asyncio
+from secrets import choice
 import string
 
 
@@ -89,74 +111,86 @@ async def pwd_create(length=8, chars=string.ascii_letters + string.digits):
     return ''.join([choice(chars) for i in range(length)])
 
 
+# 批量铸码：最多重试的轮数（每轮只补足缺少的数量）
+MINT_MAX_ROUNDS = 5
+
+
+def mint_codes(tg: int, prefix: str, count: int, days: int, length: int = 10):
+    """
+    批量生成码并写入数据库
+    随机串来自 secrets（CSPRNG），整批查重后 INSERT IGNORE，冲突的部分下一轮补足
+    :param prefix: 码前缀，如 logo-30-Register
+    :return: 实际写入的码列表；数据库失败返回 None
+    """
+    chars = string.ascii_letters + string.digits
+    minted = []
+    for _ in range(MINT_MAX_ROUNDS):
+        need = count - len(minted)
+        if need <= 0:
+            break
+        batch = set()
+        while len(batch) < need:
+            batch.add(f'{prefix}_{"".join(choice(chars) for _ in range(length))}')
+        existing = sql_existing_codes(batch)
+        if existing is None:
+            return None
+        batch = list(batch - existing)
+        inserted = sql_mint_codes(batch, tg, days)
+        if inserted is None:
+            return None
+        if inserted == len(batch):
+            minted += batch
+        else:
+            # 查重与写入之间被并发写入了同名码，确认实际写入的部分
+            minted += sql_get_minted_codes(batch, tg, days)
+    return minted
+
+
+def code_links(codes: list, method: str, plain: bool = False) -> str:
+    """
+    把码拼成消息文本
+    :param method: code - 码 | link - 深链接
+    :param plain: True 时不加 markdown 代码标记，用于导出文件
+    """
+    if method == 'link':
+        return ''.join(f't.me/{bot_name}?start={c}\n' for c in codes)
+    return ''.join(f'{c}\n' if plain else f'`{c}`\n' for c in codes)
+
+
 # 创建注册
-async def cr_link_one(tg: int, times, count, days: int, method: str):
+async def cr_link_one(tg: int, times, count, days: int, method: str, plain: bool = False):
     """
-    创建连接
+    创建注册码/深链接
     :param tg:
     :param times:
     :param count:
     :param days:
     :param method:
-    :return:
+    :param plain: 见 code_links
+    :return: 链接文本，写入失败返回 None
     """
-    links = ''
-    code_list = []
-    i = 1
-    if method == 'code':
-        while i <= count:
-            p = await pwd_create(10)
-            uid = f'{ranks.logo}-{times}-Register_{p}'
-            code_list.append(uid)
-            link = f'`{uid}`\n'
-            links += link
-            i += 1
-    elif method == 'link':
-        while i <= count:
-            p = await pwd_create(10)
-            uid = f'{ranks.logo}-{times}-Register_{p}'
-            code_list.append(uid)
-            link = f't.me/{bot_name}?start={uid}\n'
-            links += link
-            i += 1
-    if sql_add_code(code_list, tg, days) is False:
+    codes = await asyncio.to_thread(mint_codes, tg, f'{ranks.logo}-{times}-Register', count, days)
+    if codes is None:
         return None
-    return links
+    return code_links(codes, method, plain)
 
 
 # 创建续期
-async def rn_link_one(tg: int, times, count, days: int, method: str):
+async def rn_link_one(tg: int, times, count, days: int, method: str, plain: bool = False):
     """
-    创建连接
+    创建续期码/深链接
     :param tg:
     :param times:
     :param count:
     :param days:
     :param method:
-    :return:
+    :param plain: 见 code_links
+    :return: 链接文本，写入失败返回 None
     """
-    links = ''
-    code_list = []
-    i = 1
-    if method == 'code':
-        while i <= count:
-            p = await pwd_create(10)
-            uid = f'{ranks.logo}-{times}-Renew_{p}'
-            code_list.append(uid)
-            link = f'`{uid}`\n'
-            links += link
-            i += 1
-    elif method == 'link':
-        while i <= count:
-            p = await pwd_create(10)
-            uid = f'{ranks.logo}-{times}-Renew_{p}'
-            code_list.append(uid)
-            link = f't.me/{bot_name}?start={uid}\n'
-            links += link
-            i += 1
-    if sql_add_code(code_list, tg, days) is False:
+    codes = await asyncio.to_thread(mint_codes, tg, f'{ranks.logo}-{times}-Renew', count, days)
+    if codes is None:
         return None
-    return links
+    return code_links(codes, method, plain)
 
 
 async def cr_link_two(tg: int, for_tg, days: int):
@@ -285,6 +319,20 @@ class Singleton(abc.ABCMeta, type):
             cls._instances[key] = super().__call__(*args, **kwargs)
         return cls._instances[key]
 
+
+import base64
+import json
+
+
+def jwt_expires_at(token: str):
+    """读取 JWT 载荷中的 exp（不校验签名），解析失败返回 None"""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
 # import random
 # import grequests
 
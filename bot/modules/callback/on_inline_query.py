@@ -12,10 +12,17 @@ from bot.func_helper.filters import user_in_group_on_filter
 from pyrogram.types import (InlineQueryResultArticle, InputTextMessageContent,
                             InlineKeyboardMarkup, InlineKeyboardButton, InlineQuery, ChosenInlineResult)
 from bot.func_helper.emby import emby
+from bot.func_helper.media_catalog import media_catalog, search_media
 from bot.sql_helper.sql_emby import sql_get_emby
 from pyrogram.errors import BadRequest
 from bot.func_helper.msg_utils import callAnswer
 
+INLINE_PAGE_SIZE = 10
+
+# 开机后加载本地媒体目录并定时增量同步
+loop = asyncio.get_event_loop()
+loop.call_later(10, media_catalog.start)
+
 
 @bot.on_inline_query(user_in_group_on_filter)
 async def find_sth_media(_, inline_query: InlineQuery):
@@ -51,7 +58,7 @@ async def find_sth_media(_, inline_query: InlineQuery):
             # print(inline_query)
             Name = inline_query.query
             inline_count = 0 if not inline_query.offset else int(inline_query.offset)
-            ret_movies = await emby.get_movies(title=Name, start=inline_count)
+            ret_movies = await search_media(Name, start=inline_count, limit=INLINE_PAGE_SIZE)
             if not ret_movies:
                 results = [InlineQueryResultArticle(
                     title=f"{ranks.logo}",
@@ -88,9 +95,11 @@ async def find_sth_media(_, inline_query: InlineQuery):
                         # url=f't.me/{bot_name}?start=itemid-{i["item_id"]}')]]),
                         thumb_url=i['photo'], thumb_width=220, thumb_height=330)
                     results.append(result)
-                await inline_query.answer(results=results, cache_time=300, switch_pm_text='查看结果（最多20条）',
+                # 本地目录可以一直往后翻，退回 Emby 搜索时保持最多两页
+                more = len(ret_movies) == INLINE_PAGE_SIZE and (media_catalog.ready or not inline_query.offset)
+                await inline_query.answer(results=results, cache_time=300, switch_pm_text='查看结果',
                                           is_personal=True,
-                                          next_offset='10' if not inline_query.offset else '',
+                                          next_offset=str(inline_count + INLINE_PAGE_SIZE) if more else '',
                                           switch_pm_parameter='start')
     except BadRequest:
         pass
@@ -5,7 +5,9 @@ from typing import Dict, List
 from pyrogram import filters
 from bot import bot, prefixes, sakura_b, game, LOGGER
 from bot.func_helper.msg_utils import deleteMessage
-from bot.sql_helper.sql_emby import sql_get_emby, sql_update_emby, Emby
+from bot.sql_helper.sql_emby import sql_get_emby
+from bot.sql_helper.sql_ledger import sql_debit_emby, sql_credit_embys, sql_add_pending_credits, \
+    sql_settle_pending_credits
 
 async def get_fullname_with_link(user_id):
     try:
@@ -19,10 +21,17 @@ active_bets: Dict[int, Dict] = {}
 # 存储参与者信息 (bet_id -> list of participants)
 bet_participants: Dict[str, List[Dict]] = {}
 
+# 派奖失败后的重试间隔（秒）与最多尝试次数
+PAYOUT_RETRY_DELAY = 60
+PAYOUT_MAX_RETRIES = 5
+
+
 class BettingSystem:
     def __init__(self):
         self.active_bets = active_bets
         self.participants = bet_participants
+        # 多次派奖失败的赌局 bet_id -> {bet, participants, rewards}；奖励本身记在 pending_credits 表中
+        self.pending_payouts: Dict[str, Dict] = {}
     
     def set_start_message_id(self, chat_id: int, message_id: int):
         if chat_id in self.active_bets:
@@ -139,8 +148,9 @@ class BettingSystem:
             # 追加投注
             try:
                 # 扣除余额
-                new_balance = user.iv - amount_int
-                sql_update_emby(Emby.tg == user_id, iv=new_balance)
+                new_balance = sql_debit_emby(user_id, amount_int, reason='bet', ref=bet_id)
+                if new_balance is None:
+                    return "❌ 余额不足"
 
                 await bot.send_message(
                     chat_id=user_id,
@@ -180,8 +190,9 @@ class BettingSystem:
             # 首次投注
             try:
                 # 扣除余额
-                new_balance = user.iv - amount_int
-                sql_update_emby(Emby.tg == user_id, iv=new_balance)
+                new_balance = sql_debit_emby(user_id, amount_int, reason='bet', ref=bet_id)
+                if new_balance is None:
+                    return "❌ 余额不足"
                 
                 await bot.send_message(
                     chat_id=user_id,
@@ -253,6 +264,52 @@ class BettingSystem:
         
         await self._draw_bet(chat_id)
     
+    @staticmethod
+    def _credit_winners(bet_info: Dict, bet_id: str, rewards) -> bool:
+        """已记入待补发表的赌局通过补发入账，与开机补发互斥，不会重复发放"""
+        if bet_info.get('payout_persisted'):
+            return sql_settle_pending_credits(ref=bet_id) is not None
+        return sql_credit_embys(rewards, reason='bet_win', ref=bet_id)
+
+    async def _payout_failed(self, chat_id: int, bet_id: str, result: int, winning_type: str, rewards) -> str:
+        """
+        派奖失败：不标记赢家已派奖，奖励记入待补发表后稍后重试；多次失败后移出活跃赌局，
+        待补发记录在开机时自动补发，重启也不会丢失
+        """
+        bet_info = self.active_bets[chat_id]
+        retries = bet_info['payout_retries'] = bet_info.get('payout_retries', 0) + 1
+        LOGGER.error(f"赌局 {bet_id} 派奖失败（第 {retries} 次）: {rewards}")
+        if not bet_info.get('payout_persisted'):
+            if sql_add_pending_credits(rewards, reason='bet_win', ref=bet_id):
+                bet_info['payout_persisted'] = True
+            else:
+                for tg, amount in rewards:
+                    LOGGER.error(f"赌局 {bet_id} 待派奖未能写入数据库，重启后需人工补发: tg={tg} amount={amount}")
+        text = f"🎲 赌局开奖结果：{result} ({winning_type})\n\n⚠️ 派奖失败，积分尚未发放。"
+        if retries < PAYOUT_MAX_RETRIES:
+            text += f"\n{PAYOUT_RETRY_DELAY} 秒后自动重试，结果不变。"
+            asyncio.create_task(self._retry_payout(chat_id, bet_id))
+        else:
+            del self.active_bets[chat_id]
+            self.pending_payouts[bet_id] = {'bet': bet_info, 'participants': self.participants.pop(bet_id, []),
+                                            'rewards': rewards}
+            if bet_info.get('payout_persisted'):
+                LOGGER.error(f"赌局 {bet_id} 多次派奖失败，已记入待补发，开机时自动补发: {rewards}")
+            else:
+                LOGGER.error(f"赌局 {bet_id} 多次派奖失败且未能记入待补发，需人工派奖: {rewards}")
+            text += f"\n多次重试仍失败，已记录待派奖，请联系管理员处理（赌局 {bet_id}）。"
+        try:
+            await bot.send_message(chat_id, text)
+        except Exception as e:
+            LOGGER.info(f"发送派奖失败消息失败: {e}")
+        return text
+
+    async def _retry_payout(self, chat_id: int, bet_id: str):
+        await asyncio.sleep(PAYOUT_RETRY_DELAY)
+        bet_info = self.active_bets.get(chat_id)
+        if bet_info and bet_info['id'] == bet_id and bet_info['status'] == 1:
+            await self._draw_bet(chat_id)
+
     async def _draw_bet(self, chat_id: int) -> str:
         """执行开奖"""
         if chat_id not in self.active_bets:
@@ -264,13 +321,16 @@ class BettingSystem:
         if bet_info['status'] != 1:
             return "❌ 赌局已经结束"
         
-        # 生成随机数
-        if bet_info['random_type'] == 'dice':
-            # 模拟Telegram骰子
-            result = random.randint(1, 6)
-        else:
-            # 系统随机
-            result = random.randint(1, 6)
+        # 生成随机数；派奖失败重试时沿用第一次的结果
+        result = bet_info.get('result')
+        if result is None:
+            if bet_info['random_type'] == 'dice':
+                # 模拟Telegram骰子
+                result = random.randint(1, 6)
+            else:
+                # 系统随机
+                result = random.randint(1, 6)
+            bet_info['result'] = result
         
         # 判断大小
         winning_type = '大' if result >= 4 else '小'
@@ -290,18 +350,14 @@ class BettingSystem:
 """
         
         if winners and total_winner_amount > 0:
-            for winner in winners:
-                # 计算个人奖励
-                personal_reward = round((winner['amount'] / total_winner_amount) * prize_pool)
-                
-                # 更新用户余额
-                user = sql_get_emby(winner['user_id'])
-                if user:
-                    new_balance = user.iv + personal_reward
-                    sql_update_emby(Emby.tg == winner['user_id'], iv=new_balance)
-                
+            rewards = [(winner['user_id'], round((winner['amount'] / total_winner_amount) * prize_pool))
+                       for winner in winners]
+            # 一条语句为所有赢家结算；失败时没有任何积分变动，赌局保留等待重试
+            if not self._credit_winners(bet_info, bet_id, rewards):
+                return await self._payout_failed(chat_id, bet_id, result, winning_type, rewards)
+            for winner, (_, personal_reward) in zip(winners, rewards):
                 winner['status'] = 1
-                
+
                 user_link = await get_fullname_with_link(winner['tg_id'])
                 result_message += f"🏆 {user_link} 获得 {personal_reward} {sakura_b}\n"
         else:
@@ -371,6 +427,17 @@ class BettingSystem:
 # 创建赌局系统实例
 betting_system = BettingSystem()
 
+
+async def settle_pending_payouts():
+    """开机补发上次运行中未能派发的奖励"""
+    settled = await asyncio.to_thread(sql_settle_pending_credits)
+    if settled:
+        LOGGER.info(f"已补发 {settled} 条待派发的积分")
+
+
+loop = asyncio.get_event_loop()
+loop.call_later(20, lambda: loop.create_task(settle_pending_payouts()))
+
 # 注册命令处理器
 @bot.on_message(filters.command('startbet', prefixes=prefixes) & filters.group)
 # 定义一个异步函数，用于处理开始下注的命令
@@ -405,8 +472,11 @@ async def handle_startbet_command(client, message):
         return
 
     # 扣除手续费
-    new_balance = user.iv - game.magnification
-    sql_update_emby(Emby.tg == user_id, iv=new_balance)
+    new_balance = sql_debit_emby(user_id, game.magnification, reason='bet_fee')
+    if new_balance is None:
+        error_message = await message.reply_text(f"❌ 你的余额不够支付 {game.magnification} {sakura_b} 手续费哦～")
+        asyncio.create_task(deleteMessage(error_message, 60))
+        return
 
     await bot.send_message(
         chat_id=user_id,
@@ -9,7 +9,7 @@ from bot.func_helper.concurrency import get_user_lock
 from bot.func_helper.fix_bottons import register_code_ikb
 from bot.func_helper.msg_utils import sendMessage, sendPhoto
 from bot.sql_helper.sql_code import Code
-from bot.sql_helper.sql_emby import sql_get_emby, Emby
+from bot.sql_helper.sql_emby import sql_get_emby, Emby, clear_lv_page_cache
 from bot.sql_helper import Session
 
 
@@ -77,6 +77,8 @@ def _redeem_renew_code_atomic(register_code: str, user_id: int):
 
         user.ex = ex_new
         session.commit()
+        if expired:
+            clear_lv_page_cache()
         return {
             "status": "ok",
             "issuer_tg": code.tg,
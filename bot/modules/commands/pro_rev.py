@@ -11,7 +11,7 @@ from pyrogram.errors import BadRequest
 from bot import bot, prefixes, owner, admins, save_config, LOGGER
 from bot.func_helper.filters import admins_on_filter
 from bot.func_helper.msg_utils import sendMessage, deleteMessage
-from bot.schemas import Yulv
+from bot.func_helper.resources import yulv
 from bot.scheduler.bot_commands import BotCommands
 from bot.sql_helper.sql_emby import sql_update_emby, Emby, sql_get_emby
 from bot.sql_helper.sql_emby2 import sql_get_emby2, sql_update_emby2, Emby2
@@ -38,7 +38,7 @@ async def pro_admin(_, msg):
 
     await asyncio.gather(deleteMessage(msg), BotCommands.pro_commands(_, uid),
                          sendMessage(msg,
-                                     f'**{random.choice(Yulv.load_yulv().wh_msg)}**\n\n'
+                                     f'**{random.choice(yulv.get().wh_msg)}**\n\n'
                                      f'👮🏻 新更新管理员 #[{first.first_name}](tg://user?id={uid}) | `{uid}`\n**当前admins**\n{admins}',
                                      timer=60))
 
@@ -80,21 +80,21 @@ async def pro_user(_, msg):
         if e is None and e2 is None:
             return await sendMessage(msg, f'用户名 `{username}` 在数据库中不存在！')
 
-        result_msg = f"**{random.choice(Yulv.load_yulv().wh_msg)}**\n\n"
+        result_msg = f"**{random.choice(yulv.get().wh_msg)}**\n\n"
         sign_name = f'{msg.sender_chat.title}' if msg.sender_chat else f'[{msg.from_user.first_name}](tg://user?id={msg.from_user.id})'
 
         # 更新emby表
         if e is not None and e.embyid is not None:
             if sql_update_emby(Emby.name == username, lv='a'):
                 user_display = f'[{e.name}](tg://user?id={e.tg})' if e.tg else e.name
-                result_msg += f"🎉 恭喜：{user_display} 获得 {sign_name} 签出的{random.choice(Yulv.load_yulv().white_list)}.\n"
+                result_msg += f"🎉 恭喜：{user_display} 获得 {sign_name} 签出的{random.choice(yulv.get().white_list)}.\n"
             else:
                 result_msg += "⚠️ 错误：数据库执行错误\n"
 
         # 更新emby2表
         if e2 is not None:
             if sql_update_emby2(Emby2.name == username, lv='a'):
-                result_msg += f"🎉 恭喜 {e2.name} 获得 {sign_name} 签出的{random.choice(Yulv.load_yulv().white_list)}.\n"
+                result_msg += f"🎉 恭喜 {e2.name} 获得 {sign_name} 签出的{random.choice(yulv.get().white_list)}.\n"
             else:
                 result_msg += "⚠️ 错误：数据库执行错误\n"
 
@@ -108,8 +108,8 @@ async def pro_user(_, msg):
         if sql_update_emby(Emby.tg == uid, lv='a'):
             sign_name = f'{msg.sender_chat.title}' if msg.sender_chat else f'[{msg.from_user.first_name}](tg://user?id={msg.from_user.id})'
             await asyncio.gather(deleteMessage(msg), sendMessage(msg,
-                                                                 f"**{random.choice(Yulv.load_yulv().wh_msg)}**\n\n"
-                                                                 f"🎉 恭喜 [{first.first_name}](tg://user?id={uid}) 获得 {sign_name} 签出的{random.choice(Yulv.load_yulv().white_list)}."))
+                                                                 f"**{random.choice(yulv.get().wh_msg)}**\n\n"
+                                                                 f"🎉 恭喜 [{first.first_name}](tg://user?id={uid}) 获得 {sign_name} 签出的{random.choice(yulv.get().white_list)}."))
         else:
             return await sendMessage(msg, '⚠️ 数据库执行错误')
         LOGGER.info(f"【admin】：{msg.from_user.id} 新增 白名单 {first.first_name}-{uid}")
@@ -7,7 +7,8 @@ from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 from bot import bot, prefixes, game, sakura_b
 from bot.func_helper.msg_utils import deleteMessage, editMessage
-from bot.sql_helper.sql_emby import sql_get_emby, sql_update_emby, Emby
+from bot.sql_helper.sql_emby import sql_get_emby
+from bot.sql_helper.sql_ledger import sql_debit_emby, sql_credit_emby, sql_transfer_emby
 
 # ==========================================
 # 辅助函数：智能取整
@@ -71,9 +72,19 @@ async def delete_msg_with_error(message, error_text):
     asyncio.create_task(deleteMessage(error_message, 180))
     asyncio.create_task(deleteMessage(message, 180))
 
-def change_emby_amount(user_id, amount):
-    final_amount = max(0, int(amount))
-    sql_update_emby(Emby.tg == user_id, iv=final_amount)
+def get_balance(user_id):
+    e = sql_get_emby(user_id)
+    return e.iv if e else 0
+
+def transfer_emby_amount(from_id, to_id, amount):
+    """
+    原子转移积分，余额不足时转出全部余额
+    返回 (实际转移数量, 转出方余额, 转入方余额)
+    """
+    moved, from_balance, to_balance = sql_transfer_emby(from_id, to_id, amount, reason='rob', partial=True)
+    if from_balance is None:
+        return 0, get_balance(from_id), get_balance(to_id)
+    return moved, from_balance, to_balance
 
 async def countdown(call, rob_message):
     while True:
@@ -214,17 +225,15 @@ async def update_edit_message(call, game, status=None):
         else:
             rob_gold = to_int(game['rob_gold'])
             
-        actual_rob_gold = min(rob_gold, target_user.iv)
-        
-        change_emby_amount(game['target_user_id'], target_user.iv - actual_rob_gold)
-        change_emby_amount(game['user_id'], user.iv + actual_rob_gold)
+        actual_rob_gold, target_balance, user_balance = transfer_emby_amount(
+            game['target_user_id'], game['user_id'], rob_gold)
 
         await editMessage(game['original_message'], update_text)
-        answer = f"🎉 对方投降了\n\n对方选择投降，乱世盗贼不战而胜\n获得：{actual_rob_gold} {sakura_b}\n余额：{user.iv + actual_rob_gold} {sakura_b}"
+        answer = f"🎉 对方投降了\n\n对方选择投降，乱世盗贼不战而胜\n获得：{actual_rob_gold} {sakura_b}\n余额：{user_balance} {sakura_b}"
 
         await bot.send_message(user.tg, answer, reply_to_message_id=call.message.id)
 
-        target_answer = f"😌 你投降了\n\n您向 {user_with_link} 的乱世盗贼投降\n割地赔款：{actual_rob_gold} {sakura_b}\n余额： {target_user.iv - actual_rob_gold} {sakura_b}️"
+        target_answer = f"😌 你投降了\n\n您向 {user_with_link} 的乱世盗贼投降\n割地赔款：{actual_rob_gold} {sakura_b}\n余额： {target_balance} {sakura_b}️"
         await bot.send_message(target_user.tg, target_answer, reply_to_message_id=call.message.id)
 
         del rob_games[game['rob_msg_id']]
@@ -263,22 +272,20 @@ async def update_edit_message(call, game, status=None):
             await editMessage(game['original_message'], update_text, buttons)
             
             if game["target_score"] > game["user_score"]:
-                actual_penalty = min(user.iv, FIGHT_PENALTY)
+                actual_penalty, user_balance, target_balance = transfer_emby_amount(
+                    user.tg, target_user.tg, FIGHT_PENALTY)
                 message = f"⏰ 时间到！{target_with_link} 以 {game['target_score']} : {game['user_score']} 获胜🏆\n{user_with_link} 失去 {actual_penalty} {sakura_b}😭"
                 success_msg = await bot.send_message(call.chat.id, message, reply_to_message_id=call.id)
                 asyncio.create_task(deleteMessage(success_msg, 180))
                 
-                change_emby_amount(user.tg, user.iv - actual_penalty)
-                change_emby_amount(target_user.tg, target_user.iv + actual_penalty)
-                
                 await bot.send_message(
                     user.tg,
-                    f"😌 抢劫失败\n\n时间到，抢劫失败\n损失：{actual_penalty} {sakura_b}\n余额：{sql_get_emby(user.tg).iv} {sakura_b}",
+                    f"😌 抢劫失败\n\n时间到，抢劫失败\n损失：{actual_penalty} {sakura_b}\n余额：{user_balance} {sakura_b}",
                     reply_to_message_id=call.id)
                     
                 await bot.send_message(
                     target_user.tg,
-                    f"🎉 防守成功\n\n时间到，你击败了盗贼\n获得：{actual_penalty} {sakura_b}\n余额：{sql_get_emby(target_user.tg).iv} {sakura_b}",
+                    f"🎉 防守成功\n\n时间到，你击败了盗贼\n获得：{actual_penalty} {sakura_b}\n余额：{target_balance} {sakura_b}",
                     reply_to_message_id=call.id)
                     
             elif game["target_score"] < game["user_score"]:
@@ -286,22 +293,20 @@ async def update_edit_message(call, game, status=None):
                     rob_gold = target_user.iv
                 else:
                     rob_gold = to_int(game['rob_gold'])
+                rob_gold, target_balance, user_balance = transfer_emby_amount(target_user.tg, user.tg, rob_gold)
                 
                 message = f"⏰ 时间到！{user_with_link} 以 {game['user_score']} : {game['target_score']} 获胜🏆\n{target_with_link} 损失 {rob_gold} {sakura_b}😭"
                 
                 await bot.send_message(
                     user.tg,
-                    f"🎉 抢劫成功\n\n时间到，抢劫成功\n获得：{rob_gold} {sakura_b}\n余额：{user.iv + rob_gold} {sakura_b}",
+                    f"🎉 抢劫成功\n\n时间到，抢劫成功\n获得：{rob_gold} {sakura_b}\n余额：{user_balance} {sakura_b}",
                     reply_to_message_id=call.id
                 )
                 await bot.send_message(
                     target_user.tg,
-                    f"😌 防守失败\n\n时间到，你败给了盗贼\n损失：{rob_gold} {sakura_b}\n余额：{target_user.iv - rob_gold} {sakura_b}",
+                    f"😌 防守失败\n\n时间到，你败给了盗贼\n损失：{rob_gold} {sakura_b}\n余额：{target_balance} {sakura_b}",
                     reply_to_message_id=call.id
                 )
-
-                change_emby_amount(user.tg, user.iv + rob_gold)
-                change_emby_amount(target_user.tg, target_user.iv - rob_gold)
                 
                 rob_msg = await bot.send_message(call.chat.id, message, reply_to_message_id=call.id)
                 asyncio.create_task(deleteMessage(rob_msg, 180))
@@ -410,22 +415,20 @@ async def fighting(call, game_id):
                 target_user = sql_get_emby(int(call.data.split("_")[4]))
 
                 if game["target_score"] > game["user_score"]:
-                    actual_penalty = min(user.iv, FIGHT_PENALTY)
+                    actual_penalty, user_balance, target_balance = transfer_emby_amount(
+                        user.tg, call.from_user.id, FIGHT_PENALTY)
                     message = f"{target_with_link} 以 {game['target_score']} : {game['user_score']} 击败了乱世的盗贼\n{target_with_link} 最终赢得了斗争🏆\n{user_with_link} 失去 {actual_penalty} {sakura_b}😭"
                     success_msg = await bot.send_message(call.message.chat.id, message, reply_to_message_id=call.message.id)
                     asyncio.create_task(deleteMessage(success_msg, 180))
                     
-                    change_emby_amount(user.tg, user.iv - actual_penalty)
-                    change_emby_amount(call.from_user.id, target_user.iv + actual_penalty)
-                    
                     await bot.send_message(
                         user.tg,
-                        f"😌 抢劫失败\n\n乱世的盗贼抢劫失败\n损失：{actual_penalty} {sakura_b}\n余额：{sql_get_emby(user.tg).iv} {sakura_b}",
+                        f"😌 抢劫失败\n\n乱世的盗贼抢劫失败\n损失：{actual_penalty} {sakura_b}\n余额：{user_balance} {sakura_b}",
                         reply_to_message_id=call.message.id)
                         
                     await bot.send_message(
                         target_user.tg,
-                        f"🎉 逃过一杰\n\n你打赢了乱世的盗贼\n获得：{actual_penalty} {sakura_b}\n余额：{sql_get_emby(target_user.tg).iv} {sakura_b}",
+                        f"🎉 逃过一杰\n\n你打赢了乱世的盗贼\n获得：{actual_penalty} {sakura_b}\n余额：{target_balance} {sakura_b}",
                         reply_to_message_id=call.message.id)
                         
                 elif game["target_score"] < game["user_score"]:
@@ -435,21 +438,19 @@ async def fighting(call, game_id):
                     else:
                         rob_gold = to_int(game['rob_gold'])
                         message = f"乱世的盗贼以 {game['user_score']} : {game['target_score']} 抢劫成功\n{target_with_link} 最终反抗失败🤡\n{user_with_link} 抢走 {rob_gold} {sakura_b}🏆"
+                    rob_gold, target_balance, user_balance = transfer_emby_amount(target_user.tg, user.tg, rob_gold)
                     
                     await bot.send_message(
                         user.tg,
-                        f"🎉 抢劫成功\n\n乱世的盗贼以 {game['user_score']} : {game['target_score']} 抢劫成功\n获得：{rob_gold} {sakura_b}\n余额：{user.iv + rob_gold} {sakura_b}",
+                        f"🎉 抢劫成功\n\n乱世的盗贼以 {game['user_score']} : {game['target_score']} 抢劫成功\n获得：{rob_gold} {sakura_b}\n余额：{user_balance} {sakura_b}",
                         reply_to_message_id=call.message.id
                     )
                     await bot.send_message(
                         target_user.tg,
-                        f"😌 防守失败\n\n你以 {game['target_score']} : {game['user_score']} 败给了乱世的盗贼\n损失：{rob_gold} {sakura_b}\n余额：{target_user.iv - rob_gold} {sakura_b}",
+                        f"😌 防守失败\n\n你以 {game['target_score']} : {game['user_score']} 败给了乱世的盗贼\n损失：{rob_gold} {sakura_b}\n余额：{target_balance} {sakura_b}",
                         reply_to_message_id=call.message.id
                     )
 
-                    change_emby_amount(user.tg, user.iv + rob_gold)
-                    change_emby_amount(target_user.tg, target_user.iv - rob_gold)
-
                     rob_msg = await bot.send_message(call.message.chat.id, message, reply_to_message_id=call.message.id)
                     asyncio.create_task(deleteMessage(rob_msg, 180))
                 else:
@@ -489,16 +490,15 @@ async def handle_kanxi_rewards(rob_game):
             kanxi_user = sql_get_emby(kanxi_id)
             
             if luck_roll == 1:
-                change_emby_amount(kanxi_id, kanxi_user.iv + LUCKY_AMOUNT)
+                sql_credit_emby(kanxi_id, LUCKY_AMOUNT, reason='rob_kanxi')
                 reward_messages.append(f". 恭喜 {name} 获得幸运大奖， 奖金 {LUCKY_AMOUNT} {sakura_b} 🥳")
             else:
                 reward_chance = random.randint(1, 100)
                 if reward_chance <= PENALTY_CHANCE:
                     # 惩罚
                     penalty = min(PENALTY_AMOUNT, kanxi_user.iv)
-                    if penalty > 0:
-                        change_emby_amount(kanxi_id, kanxi_user.iv - penalty)
-                        remaining_gold = sql_get_emby(kanxi_id).iv
+                    remaining_gold = sql_debit_emby(kanxi_id, penalty, reason='rob_kanxi') if penalty > 0 else None
+                    if remaining_gold is not None:
                         reward_messages.append(f"· {name} 被误伤，损失 {penalty} {sakura_b}🤕")
                         tasks.append(bot.send_message(kanxi_id, f"您被误伤，损失了 {penalty} {sakura_b}😭，剩余 {remaining_gold} {sakura_b}"))
                 
@@ -508,13 +508,12 @@ async def handle_kanxi_rewards(rob_game):
                         bonus_amount = to_int(TOTAL_GAME_COINS / 2)
                     
                     if bonus_amount > 0:
-                        change_emby_amount(kanxi_id, kanxi_user.iv + bonus_amount)
+                        remaining_gold = sql_credit_emby(kanxi_id, bonus_amount, reason='rob_kanxi')
                         total_rewards += bonus_amount
-                        remaining_gold = sql_get_emby(kanxi_id).iv
                         reward_messages.append(f"· {name} 捡到了 {bonus_amount} {sakura_b}，爽🥳")
                         tasks.append(bot.send_message(kanxi_id, f"您捡到了 {bonus_amount} {sakura_b}🍉，剩余 {remaining_gold} {sakura_b}"))
                 else:
-                    remaining_gold = sql_get_emby(kanxi_id).iv
+                    remaining_gold = kanxi_user.iv
                     reward_messages.append(f"· {name} 光顾着围观了，啥也没捞到😕")
                     tasks.append(bot.send_message(kanxi_id, f"您什么也没捞到😕，剩余 {remaining_gold} {sakura_b}"))
 
@@ -627,9 +626,12 @@ async def rob_user(_, message):
         asyncio.create_task(delete_msg_with_error(message, f'❌ 您的{sakura_b}不足以支付委托费用({COMMISSION_FEE}个)'))
         return
 
-    asyncio.create_task(deleteMessage(message, 0))
+    balance = sql_debit_emby(user.tg, COMMISSION_FEE, reason='rob_fee')
+    if balance is None:
+        asyncio.create_task(delete_msg_with_error(message, f'❌ 您的{sakura_b}不足以支付委托费用({COMMISSION_FEE}个)'))
+        return
 
-    change_emby_amount(user.tg, user.iv - COMMISSION_FEE)
+    asyncio.create_task(deleteMessage(message, 0))
     
     user_with_link = await get_fullname_with_link(user.tg)
     target_with_link = await get_fullname_with_link(target_user.tg)
@@ -643,7 +645,7 @@ async def rob_user(_, message):
 
     await bot.send_message(
         user.tg,
-        f"✅ 您已成功雇佣乱世的盗贼\n💰 扣除雇佣费：{COMMISSION_FEE} {sakura_b}\n💳 当前余额：{sql_get_emby(user.tg).iv} {sakura_b}"
+        f"✅ 您已成功雇佣乱世的盗贼\n💰 扣除雇佣费：{COMMISSION_FEE} {sakura_b}\n💳 当前余额：{balance} {sakura_b}"
     )
     await start_rob(message, user, target_user)
 
@@ -7,8 +7,8 @@
 import asyncio
 from pyrogram import filters
 
-from bot.func_helper.emby import Embyservice
-from bot.func_helper.utils import judge_admins, members_info, open_check
+from bot.func_helper.media_counts import media_counts
+from bot.func_helper.utils import judge_admins, members_info, open_check, load_tem
 from bot.modules.commands.exchange import rgs_code
 from bot.sql_helper.sql_emby import sql_add_emby, sql_get_emby
 from bot.func_helper.filters import user_in_group_filter, user_in_group_on_filter
@@ -17,6 +17,11 @@ from bot.func_helper.fix_bottons import group_f, judge_start_ikb, judge_group_ik
 from bot.modules.extra import user_cha_ip
 from bot import bot, prefixes, group, bot_photo, ranks, sakura_b
 
+# 开机后从数据库载入已注册席位，加载媒体数量统计并定时校准
+loop = asyncio.get_event_loop()
+loop.call_soon(load_tem)
+loop.call_later(5, media_counts.start)
+
 
 # 反命令提示
 @bot.on_message((filters.command('start', prefixes) | filters.command('count', prefixes)) & filters.chat(group))
@@ -40,7 +45,7 @@ async def my_info(_, msg):
 @bot.on_message(filters.command('count', prefixes) & user_in_group_on_filter & filters.private)
 async def count_info(_, msg):
     await deleteMessage(msg)
-    text = await Embyservice.get_medias_count()
+    text = await media_counts.text()
     await sendMessage(msg, text, timer=60)
 
 
@@ -20,9 +20,11 @@ from bot.func_helper.fix_bottons import users_iv_button
 from bot.func_helper.msg_utils import sendPhoto, sendMessage, callAnswer, editMessage
 from bot.func_helper.utils import pwd_create, judge_admins, get_users, cache
 from bot.sql_helper import Session
-from bot.sql_helper.sql_emby import Emby, sql_get_emby, sql_update_emby
+from bot.sql_helper.sql_emby import Emby, sql_get_emby
+from bot.sql_helper.sql_ledger import sql_debit_emby, sql_credit_emby
 from bot.ranks_helper.ranks_draw import RanksDraw
-from bot.schemas import Yulv, MAX_INT_VALUE, MIN_INT_VALUE
+from bot.schemas import MAX_INT_VALUE, MIN_INT_VALUE
+from bot.func_helper.resources import yulv
 
 # 小项目，说实话不想写数据库里面。放内存里了，从字典里面每次拿分
 
@@ -67,7 +69,7 @@ async def create_reds(
         envelope.target_user = private
     if private_text is None:
         # 专享红包：如果没有传入祝福语，则随机选择默认祝福语
-        envelope.message = random.choice(Yulv.load_yulv().red_bag)
+        envelope.message = random.choice(yulv.get().red_bag)
     else:
         envelope.message = private_text
     envelope.id = red_id
@@ -115,7 +117,7 @@ async def send_red_envelope(_, msg):
             private_text = (
                 msg.command[2]
                 if len(msg.command) > 2
-                else random.choice(Yulv.load_yulv().red_bag)
+                else random.choice(yulv.get().red_bag)
             )
         except (IndexError, ValueError):
             return await asyncio.gather(
@@ -134,7 +136,7 @@ async def send_red_envelope(_, msg):
                 private_text = (
                     msg.command[2]
                     if len(msg.command) > 2
-                    else random.choice(Yulv.load_yulv().red_bag)
+                    else random.choice(yulv.get().red_bag)
                 )
             except (IndexError, ValueError):
                 return await asyncio.gather(
@@ -273,10 +275,10 @@ async def grab_red_envelope(_, call):
             amount = envelope.rest_money
 
     # 更新用户余额
-    new_balance = e.iv + amount
-    if new_balance > MAX_INT_VALUE or new_balance < MIN_INT_VALUE:
+    if e.iv + amount > MAX_INT_VALUE or e.iv + amount < MIN_INT_VALUE:
         return await callAnswer(call, f"账户余额超出安全范围（{MIN_INT_VALUE} 到 {MAX_INT_VALUE}）。", True)
-    sql_update_emby(Emby.tg == call.from_user.id, iv=new_balance)
+    if sql_credit_emby(call.from_user.id, amount, reason='red_envelope', ref=red_id) is None:
+        return await callAnswer(call, "❌ 数据库操作失败，请稍后再试。", True)
 
     # 更新红包信息
     envelope.receivers[call.from_user.id] = {
@@ -351,8 +353,10 @@ async def verify_red_envelope_sender(msg, money, is_private=False):
             )
             return False, None, error_msg
 
-        # 验证通过,扣除余额
-        sql_update_emby(Emby.tg == msg.from_user.id, iv=e.iv - money)
+        # 验证通过,条件扣除余额，并发下余额不足时扣除失败
+        if sql_debit_emby(msg.from_user.id, money, reason='red_envelope_send') is None:
+            await sendMessage(msg, f"❌ 所持有{sakura_b}不足，发送失败", timer=60)
+            return False, None, "余额不足"
         return True, msg.from_user.first_name, None
 
     else:
@@ -429,7 +433,8 @@ async def s_rank(_, msg):
                 print(e)
             return
         else:
-            sql_update_emby(Emby.tg == msg.from_user.id, iv=e.iv - _open.srank_cost)
+            if sql_debit_emby(msg.from_user.id, _open.srank_cost, reason='srank') is None:
+                return await sendMessage(msg, f"❌ 所持有{sakura_b}不足以支付手续费{_open.srank_cost}", timer=60)
             sender = msg.from_user.id
     elif msg.sender_chat.id == msg.chat.id:
         sender = msg.chat.id
@@ -3,18 +3,23 @@
  功能暂定 开关注册，生成注册码，查看注册码情况，邀请注册排名情况
 """
 import asyncio
+import io
 
 from pyrogram import filters
 
 from bot import bot, _open, save_config, bot_photo, LOGGER, bot_name, admins, owner, config
 from bot.func_helper.filters import admins_on_filter
 from bot.schemas import ExDate
-from bot.sql_helper.sql_code import sql_count_code, sql_count_p_code, sql_delete_all_unused, sql_delete_unused_by_days
+from bot.sql_helper.sql_code import sql_count_code, sql_count_code_by_tg, sql_count_p_code, sql_delete_all_unused, sql_delete_unused_by_days
 from bot.sql_helper.sql_emby import sql_count_emby
 from bot.func_helper.fix_bottons import gm_ikb_content, open_menu_ikb, gog_rester_ikb, back_open_menu_ikb, \
     back_free_ikb, re_cr_link_ikb, close_it_ikb, ch_link_ikb, date_ikb, cr_paginate, cr_renew_ikb, invite_lv_ikb, checkin_lv_ikb
-from bot.func_helper.msg_utils import callAnswer, editMessage, sendPhoto, callListen, deleteMessage, sendMessage
-from bot.func_helper.utils import open_check, cr_link_one,rn_link_one
+from bot.func_helper.msg_utils import callAnswer, editMessage, sendPhoto, callListen, deleteMessage, sendMessage, \
+    sendFile
+from bot.func_helper.utils import open_check, cr_link_one,rn_link_one, tem_set, refresh_tem
+
+# 生成超过该数量的码时以 txt 文件发送
+CODE_FILE_THRESHOLD = 200
 
 
 @bot.on_callback_query(filters.regex('manage') & admins_on_filter)
@@ -47,8 +52,7 @@ async def open_menu(_, call):
            f'- **注册总人数限制 {all_user}**'
     await editMessage(call, text, buttons=open_menu_ikb(openstats, timingstats))
     if tem != emby:
-        _open.tem = emby
-        save_config()
+        tem_set(emby)
 
 
 @bot.on_callback_query(filters.regex('open_stat') & admins_on_filter)
@@ -148,7 +152,7 @@ async def open_timing(_, call):
 
 
 async def change_for_timing(timing, tgid, call):
-    a = _open.tem
+    a = await refresh_tem()
     timing = timing * 60
     try:
         await asyncio.sleep(timing)
@@ -158,6 +162,7 @@ async def change_for_timing(timing, tgid, call):
         _open.timing = 0
         _open.stat = False
         save_config()
+        await refresh_tem()
         b = _open.tem - a
         s = _open.all_user - _open.tem
         text = f'⏳** 注册结束**：\n\n🍉 目前席位：{_open.tem}\n🥝 新增席位：{b}\n🍋 剩余席位：{s}'
@@ -248,27 +253,24 @@ async def cr_link(_, call):
     except (ValueError, IndexError):
         return await editMessage(call, '⚠️ 检查输入，有误。', buttons=re_cr_link_ikb)
     else:
-        if renew == 'F':
-            links = await cr_link_one(call.from_user.id, times, count, days, method)
-            if links is None:
-                return await editMessage(call, '⚠️ 数据库插入失败，请检查数据库。', buttons=re_cr_link_ikb)
-            links = f"🎯 {bot_name}已为您生成了 **{days}天** 注册码 {count} 个\n\n" + links
-            chunks = [links[i:i + 4096] for i in range(0, len(links), 4096)]
-            for chunk in chunks:
-                await sendMessage(content, chunk, buttons=close_it_ikb)
-            await editMessage(call, f'📂 {bot_name}已为 您 生成了 {count} 个 {days} 天注册码', buttons=re_cr_link_ikb)
-            LOGGER.info(f"【admin】：{bot_name}已为 {content.from_user.id} 生成了 {count} 个 {days} 天注册码")
-
+        kind, create = ('注册码', cr_link_one) if renew == 'F' else ('续期码', rn_link_one)
+        as_file = count > CODE_FILE_THRESHOLD
+        links = await create(call.from_user.id, times, count, days, method, plain=as_file)
+        if links is None:
+            return await editMessage(call, '⚠️ 数据库插入失败，请检查数据库。', buttons=re_cr_link_ikb)
+        minted = links.count('\n')
+        if as_file:
+            # 大批量以文件发送，避免拆成大量消息
+            file = io.BytesIO(links.encode('utf-8'))
+            await sendFile(content, file, file_name=f'{kind}-{days}d-{minted}.txt',
+                           caption=f"🎯 {bot_name}已为您生成了 **{days}天** {kind} {minted} 个")
         else:
-            links = await rn_link_one(call.from_user.id, times, count, days, method)
-            if links is None:
-                return await editMessage(call, '⚠️ 数据库插入失败，请检查数据库。', buttons=re_cr_link_ikb)
-            links = f"🎯 {bot_name}已为您生成了 **{days}天** 续期码 {count} 个\n\n" + links
+            links = f"🎯 {bot_name}已为您生成了 **{days}天** {kind} {minted} 个\n\n" + links
             chunks = [links[i:i + 4096] for i in range(0, len(links), 4096)]
             for chunk in chunks:
                 await sendMessage(content, chunk, buttons=close_it_ikb)
-            await editMessage(call, f'📂 {bot_name}已为 您 生成了 {count} 个 {days} 天续期码', buttons=re_cr_link_ikb)
-            LOGGER.info(f"【admin】：{bot_name}已为 {content.from_user.id} 生成了 {count} 个 {days} 天续期码")
+        await editMessage(call, f'📂 {bot_name}已为 您 生成了 {minted} 个 {days} 天{kind}', buttons=re_cr_link_ikb)
+        LOGGER.info(f"【admin】：{bot_name}已为 {content.from_user.id} 生成了 {minted}/{count} 个 {days} 天{kind}")
 
 
 # 检索
@@ -279,9 +281,11 @@ async def ch_link(_, call):
     text = f'**🎫 常用code数据：\n• 已使用 - {a}  | • 未使用 - {e}\n• 月码 - {b}   | • 季码 - {c} \n• 半年码 - {d}  | • 年码 - {f}**'
     ls = []
     admins.append(owner)
+    # 所有管理员的统计一次查询取回
+    counts = sql_count_code_by_tg(admins)
     for i in admins:
         name = await bot.get_chat(i)
-        a, b, c, d, f ,e= sql_count_code(i)
+        a, b, c, d, f, e = counts[i]
         text += f'\n👮🏻`{name.first_name}`: 月/{b}，季/{c}，半年/{d}，年/{f}，已用/{a}，未用/{e}'
         f = [f"🔎 {name.first_name}", f"ch_admin_link-{i}"]
         ls.append(f)
@@ -351,10 +355,7 @@ async def buy_mon(_, call):
     cd, times, u = call.data.split('_')
     n = getattr(ExDate(), times)
     a, i = sql_count_p_code(u, n)
-    if a is None:
-        x = '**空**'
-    else:
-        x = a[0]
+    x = '**空**' if a is None else a
     first = await bot.get_chat(u)
     keyboard = await cr_paginate(i, 1, n)
     await sendMessage(call, f'🔎当前 {first.first_name} - **{n}**天，检索出以下 **{i}**页：\n\n{x}', keyboard)
@@ -365,9 +366,9 @@ async def buy_mon(_, call):
 async def paginate_keyboard(_, call):
     j, mode = map(int, call.data.split(":")[1].split('_'))
     await callAnswer(call, f'好的，将为您翻到第 {j} 页')
-    a, b = sql_count_p_code(call.from_user.id, mode)
+    # 只查询当前页
+    text, b = sql_count_p_code(call.from_user.id, mode, j)
     keyboard = await cr_paginate(b, j, mode)
-    text = a[j-1]
     await editMessage(call, f'🔎当前模式- **{mode}**天，检索出以下 **{b}**页链接：\n\n{text}', keyboard)
 
 
@@ -10,7 +10,8 @@ import datetime
 import math
 import random
 from datetime import timedelta, datetime
-from bot.schemas import ExDate, Yulv
+from bot.schemas import ExDate
+from bot.func_helper.resources import yulv
 from bot import bot, LOGGER, _open, emby_line, sakura_b, ranks, group, config, bot_name, schedall
 from pyrogram import filters
 from bot.func_helper.concurrency import get_user_lock
@@ -650,7 +651,7 @@ async def do_store_whitelist(_, call):
                                     True)
         await callAnswer(call, f'🏪 您已满足 {_open.whitelist_cost} {sakura_b}要求', True)
         sql_update_emby(Emby.tg == call.from_user.id, lv='a', iv=e.iv - _open.whitelist_cost)
-        send = await call.message.edit(f'**{random.choice(Yulv.load_yulv().wh_msg)}**\n\n'
+        send = await call.message.edit(f'**{random.choice(yulv.get().wh_msg)}**\n\n'
                                        f'🎉 恭喜[{call.from_user.first_name}](tg://user?id={call.from_user.id}) 今日晋升，{ranks["logo"]}白名单')
         await send.forward(group[0])
         LOGGER.info(f'【兑换白名单】- {call.from_user.id} 已花费 9999{sakura_b}，晋升白名单')
@@ -719,15 +720,15 @@ async def do_store_invite(_, call):
 
 @bot.on_callback_query(filters.regex('store-query'))
 async def do_store_query(_, call):
-    a, b = sql_count_c_code(tg_id=call.from_user.id)
-    if not a:
-        return await callAnswer(call, '❌ 空', True)
     try:
         number = int(call.data.split(':')[1])
     except (IndexError, KeyError, ValueError):
         number = 1
+    a, b = sql_count_c_code(tg_id=call.from_user.id, page=number)
+    if not a:
+        return await callAnswer(call, '❌ 空', True)
     await callAnswer(call, '📜 正在翻页')
-    await editMessage(call, text=a[number - 1], buttons=await store_query_page(b, number))
+    await editMessage(call, text=a, buttons=await store_query_page(b, number))
 @bot.on_callback_query(filters.regex('^my_favorites|^page_my_favorites:'))
 async def my_favorite(_, call):
     # 获取页码
@@ -5,14 +5,16 @@ from bot.func_helper.filters import user_in_group_on_filter
 from bot.func_helper.fix_bottons import re_download_center_ikb, back_members_ikb, continue_search_ikb, request_record_page_ikb,mp_search_page_ikb
 from bot.sql_helper.sql_emby import sql_get_emby, sql_update_emby, Emby
 from bot.sql_helper.sql_request_record import sql_add_request_record, sql_get_request_record_by_tg
-from bot.func_helper.moviepilot import search, add_download_task 
-from bot.func_helper.emby import emby
+from bot.func_helper.moviepilot import search_cached, add_download_task
+from bot.func_helper.media_catalog import search_media
 from bot.func_helper.utils import judge_admins
+from cacheout import Cache
 import asyncio
 import math
 
-# 添加全局字典来存储用户搜索记录
-user_search_data = {}
+# 用户搜索会话 {tg: {'keyword': 关键词, 'page': 当前页}}，只存关键词，结果从共享的搜索缓存按页切片
+SEARCH_SESSION_TTL = 1800
+search_sessions = Cache(maxsize=1000, ttl=SEARCH_SESSION_TTL)
 ITEMS_PER_PAGE = 10
 
 
@@ -51,11 +53,11 @@ async def download_media(_, call):
         return
 
     # 记录用户的搜索文本
-    user_search_data[call.from_user.id] = txt.text
+    search_sessions.set(call.from_user.id, {'keyword': txt.text, 'page': 1})
 
     # 先查询emby库中是否存在
     await editMessage(call, '🔍 正在查询Emby库，请稍后...')
-    emby_results = await emby.get_movies(title=txt.text)
+    emby_results = await search_media(txt.text, limit=5)
     if emby_results:
         text = "🎯 Emby库中已存在以下相关资源:\n\n"
         for item in emby_results:
@@ -71,58 +73,54 @@ async def download_media(_, call):
 async def continue_search(_, call):
     await callAnswer(call, '🔍 继续搜索')
     # 使用之前保存的搜索文本
-    search_text = user_search_data.get(call.from_user.id)
-    if not search_text:
+    session = search_sessions.get(call.from_user.id)
+    if not session:
         await editMessage(call.message, '❌ 未找到搜索记录，请重新搜索', buttons=re_download_center_ikb)
         return
-    await search_site_resources(call, search_text)
+    await search_site_resources(call, session['keyword'])
 
 
 @bot.on_callback_query(filters.regex('cancel_search') & user_in_group_on_filter)
 async def cancel_search(_, call):
     await callAnswer(call, '❌ 取消搜索')
     # 清除用户的搜索记录
-    user_search_data.pop(call.from_user.id, None)
+    search_sessions.delete(call.from_user.id)
     await editMessage(call.message, '🔍 已取消搜索', buttons=re_download_center_ikb)
 @bot.on_callback_query(filters.regex('cancel_download') & user_in_group_on_filter)
 async def cancel_download(_, call):
     await callAnswer(call, '❌ 取消下载')
-    user_search_data.pop(call.from_user.id, None)
+    search_sessions.delete(call.from_user.id)
     await editMessage(call.message, '🔍 已取消下载', buttons=re_download_center_ikb)
 
 async def search_site_resources(call, keyword, page=1, all_result=None):
-    """搜索站点资源并显示结果"""
+    """
+    搜索站点资源并显示结果，只渲染当前页
+    all_result 为空时发起新搜索（走共享搜索缓存）；翻页时传入会话中保存的结果，
+    保证用户看到的编号始终对应同一份结果，不会因缓存过期重新搜索而错位
+    """
     try:
-        if page == 1:
-            await editMessage(call.message, '🔍 正在搜索站点资源，请稍后...')
         if all_result is None:
-            success, all_result = await search(keyword)
+            await editMessage(call.message, '🔍 正在搜索站点资源，请稍后...')
+            success, all_result = await search_cached(keyword)
             if not success:
                 await editMessage(call.message, '🤷‍♂️ 搜索站点资源失败，请稍后再试', buttons=re_download_center_ikb)
                 return
-        if all_result is None or len(all_result) == 0:
+        if not all_result:
             await editMessage(call.message, '🤷‍♂️ 没有找到相关资源', buttons=re_download_center_ikb)
             return
 
         # 计算分页
-        start_idx = (page - 1) * ITEMS_PER_PAGE
-        end_idx = start_idx + ITEMS_PER_PAGE
-        page_items = all_result[start_idx:end_idx]
         total_pages = math.ceil(len(all_result) / ITEMS_PER_PAGE)
+        page = min(max(page, 1), total_pages)
+        start_idx = (page - 1) * ITEMS_PER_PAGE
+        page_items = all_result[start_idx:start_idx + ITEMS_PER_PAGE]
 
-        # 保存搜索结果到用户数据
-        user_search_data[call.from_user.id] = {
-            'keyword': keyword,
-            'all_result': all_result,
-            'current_page': page,
-            'total_pages': total_pages
-        }
+        # 会话持有结果 tuple 的引用（与搜索缓存共享，不复制）
+        search_sessions.set(call.from_user.id, {'keyword': keyword, 'page': page, 'results': all_result})
 
         # 显示当前页的搜索结果
         for index, item in enumerate(page_items, start=start_idx + 1):
-            text = format_resource_info(index, item)
-            item['tg_log'] = text
-            await sendMessage(call.message, text, send=True, chat_id=call.from_user.id)
+            await sendMessage(call.message, format_resource_info(index, item), send=True, chat_id=call.from_user.id)
 
         # 创建分页按钮
         keyboard = mp_search_page_ikb(page > 1, page < total_pages, page)
@@ -143,44 +141,36 @@ async def search_site_resources(call, keyword, page=1, all_result=None):
 
 def format_resource_info(index, item):
     """格式化资源信息显示"""
-    text = f"资源编号: `{index}`\n标题：{item['title']}"
+    text = f"资源编号: `{index}`\n标题：{item.title}"
 
     # 年份信息
-    if item["year"]:
-        text += f"\n年份：{item['year']}"
+    if item.year:
+        text += f"\n年份：{item.year}"
 
     # 类型信息
-    type_info = item["type"] if item["type"] and item["type"] != "未知" else "电影"
+    type_info = item.type if item.type and item.type != "未知" else "电影"
     text += f"\n类型：{type_info}"
 
     # 大小信息
-    if item["size"]:
-        size_in_bytes = int(item["size"])
-        size_in_gb = size_in_bytes / (1024 * 1024 * 1024)
+    if item.size:
+        size_in_gb = item.size / (1024 * 1024 * 1024)
         text += f"\n大小：{size_in_gb:.2f} GB"
 
     # 标签信息
-    if item["labels"]:
-        text += f"\n标签：{item['labels']}"
+    if item.labels:
+        text += f"\n标签：{item.labels}"
 
     # 资源组信息
-    if item["seeders"]:
-        text += f"\n种子数：{item['seeders']}"
+    if item.seeders:
+        text += f"\n种子数：{item.seeders}"
 
     # 媒体信息
-    media_info = []
-    if item["resource_pix"]:
-        media_info.append(item["resource_pix"])
-    if item["video_encode"]:
-        media_info.append(item["video_encode"])
-    if item["audio_encode"]:
-        media_info.append(item["audio_encode"])
-    if media_info:
-        text += f"\n媒体信息：{' | '.join(media_info)}"
+    if item.media:
+        text += f"\n媒体信息：{item.media}"
 
     # 描述信息
-    if item["description"]:
-        text += f"\n描述：{item['description']}"
+    if item.description:
+        text += f"\n描述：{item.description}"
 
     return text
 
@@ -191,36 +181,39 @@ async def handle_resource_selection(call, result):
         msg = await sendPhoto(call, photo=bot_photo, caption="【选择资源编号】：\n请在120s内对我发送你的资源编号，\n退出点 /cancel", send=True, chat_id=call.from_user.id)
         txt = await callListen(call, 120, buttons=re_download_center_ikb)
         if txt is False:
-            user_search_data.pop(call.from_user.id, None)
+            search_sessions.delete(call.from_user.id)
 
             await asyncio.gather(editMessage(msg, '🔍 已取消操作', buttons=back_members_ikb))
             return
         elif txt.text == '/cancel':
-            user_search_data.pop(call.from_user.id, None)
+            search_sessions.delete(call.from_user.id)
             await asyncio.gather(editMessage(msg, '🔍 已取消操作', buttons=back_members_ikb))
             return
         else:
             try:
                 await editMessage(msg, '🔍 正在处理，请稍后')
                 index = int(txt.text)
-                size = result[index-1]['size'] / (1024 * 1024 * 1024)
+                if index < 1:
+                    raise IndexError
+                item = result[index - 1]
+                size = item.size / (1024 * 1024 * 1024)
                 need_cost = math.ceil(size) * moviepilot.price
                 if need_cost > emby_user.iv:
                     await editMessage(msg, f"❌ 您的{sakura_b}不足，此资源需要 {need_cost}{sakura_b}\n请选择其他资源编号", buttons=re_download_center_ikb)
                     continue
-                torrent_info = result[index-1]['torrent_info']
+                torrent_info = item.torrent
                 # 兼容mp v2的api，加入了torrent_in
                 param = {**torrent_info, 'torrent_in': torrent_info}
                 success, download_id = await add_download_task(param)
-                user_search_data.pop(call.from_user.id, None)
+                search_sessions.delete(call.from_user.id)
                 if success:
                     log = f"【下载任务】：#{call.from_user.id} [{call.from_user.first_name}](tg://user?id={call.from_user.id}) 已成功添加到下载队列，此次消耗 {need_cost}{sakura_b}\n下载ID：{download_id}"
-                    download_log = f"{log}\n详情：{result[index-1]['tg_log']}"
+                    download_log = f"{log}\n详情：{format_resource_info(index, item)}"
                     LOGGER.info(log)
                     sql_update_emby(Emby.tg == call.from_user.id,
                                     iv=emby_user.iv - need_cost)
                     sql_add_request_record(
-                        call.from_user.id, download_id, result[index-1]['title'], download_log, need_cost)
+                        call.from_user.id, download_id, item.title, download_log, need_cost)
                     if moviepilot.download_log_chatid:
                         try:
                             await sendMessage(call, download_log, send=True, chat_id=moviepilot.download_log_chatid)
@@ -337,36 +330,35 @@ def get_request_record_text(request_record):
             text += f"「{index}」：{item.request_name} \n状态：{download_state_text} {progress_text}\n 剩余时间：{item.left_time}\n"
     return text
 
-# 添加新的回调处理函数
-@bot.on_callback_query(filters.regex('^mp_search_prev_page$') & user_in_group_on_filter)
-async def handle_prev_page(_, call):
-    user_data = user_search_data.get(call.from_user.id)
-    if not user_data:
+async def _turn_search_page(call, step):
+    session = search_sessions.get(call.from_user.id)
+    if not session:
         return await callAnswer(call, '❌ 搜索会话已过期，请重新搜索', True)
-    
-    new_page = user_data['current_page'] - 1
+    if 'results' not in session:
+        return await callAnswer(call, '❌ 搜索结果已失效，请重新搜索', True)
+    new_page = session['page'] + step
     await callAnswer(call, f'📃 正在加载第 {new_page} 页')
-    all_result = user_data['all_result']
-    keyword = user_data['keyword']
-    await search_site_resources(call, keyword, new_page, all_result)
+    await search_site_resources(call, session['keyword'], new_page, session['results'])
+
+
+@bot.on_callback_query(filters.regex('^mp_search_prev_page$') & user_in_group_on_filter)
+async def handle_prev_page(_, call):
+    await _turn_search_page(call, -1)
+
 
 @bot.on_callback_query(filters.regex('^mp_search_next_page$') & user_in_group_on_filter)
 async def handle_next_page(_, call):
-    user_data = user_search_data.get(call.from_user.id)
-    if not user_data:
-        return await callAnswer(call, '❌ 搜索会话已过期，请重新搜索', True)
-    
-    new_page = user_data['current_page'] + 1
-    await callAnswer(call, f'📃 正在加载第 {new_page} 页')
-    all_result = user_data['all_result']
-    keyword = user_data['keyword']
-    await search_site_resources(call, keyword, new_page, all_result)
+    await _turn_search_page(call, 1)
+
 
 @bot.on_callback_query(filters.regex('^mp_search_select_download$') & user_in_group_on_filter)
 async def handle_select_download(_, call):
-    user_data = user_search_data.get(call.from_user.id)
-    if not user_data:
+    session = search_sessions.get(call.from_user.id)
+    if not session:
         return await callAnswer(call, '❌ 搜索会话已过期，请重新搜索', True)
-    
+    # 只使用会话中展示过的那份结果，绝不在用户不知情时重新搜索
+    results = session.get('results')
+    if not results:
+        return await callAnswer(call, '❌ 搜索结果已失效，请重新搜索', True)
     await callAnswer(call, '💾 进入资源选择')
-    await handle_resource_selection(call, user_data['all_result'])
\ No newline at end of file
+    await handle_resource_selection(call, results)
@@ -7,9 +7,10 @@ from pyrogram.types import Message
 
 from bot import bot, sakura_b, schedall, save_config, prefixes, _open, owner, LOGGER, auto_update, group
 from bot.func_helper.filters import admins_on_filter, user_in_group_on_filter
-from bot.func_helper.fix_bottons import sched_buttons, plays_list_button
+from bot.func_helper.fix_bottons import sched_buttons, plays_list_button, job_stats_buttons
 from bot.func_helper.msg_utils import callAnswer, editMessage, deleteMessage
 from bot.func_helper.scheduler import scheduler
+from bot.sql_helper.sql_sched import sql_list_job_runs
 from bot.scheduler import *
 
 
@@ -17,11 +18,15 @@ from bot.scheduler import *
 loop = asyncio.get_event_loop()
 loop.call_later(5, lambda: loop.create_task(BotCommands.set_commands(client=bot)))
 loop.call_later(5, lambda: loop.create_task(check_restart()))
+# 补跑重启期间错过的定时任务
+loop.call_later(15, lambda: loop.create_task(scheduler.catch_up_missed_runs()))
 
-# 启动定时任务
-auto_backup_db = DbBackupUtils.auto_backup_db
+# 启动定时任务，定时与手动命令共用同一个 guard 包装，避免同一任务重叠执行
+auto_backup_db = scheduler.guard(DbBackupUtils.auto_backup_db, 'backup_db')
 user_plays_rank = Uplaysinfo.user_plays_rank
-check_low_activity = Uplaysinfo.check_low_activity
+check_low_activity = scheduler.guard(Uplaysinfo.check_low_activity, 'check_low_activity')
+check_expired = scheduler.guard(check_expired, 'check_expired')
+sync_favorites = scheduler.guard(sync_favorites, 'sync_favorites')
 
 async def user_day_plays(): await user_plays_rank(1)
 
@@ -55,12 +60,18 @@ args_dict = {
 }
 
 
+# 发放积分的任务不补跑，重复执行会重复入账
+no_catch_up = {"dayplayrank", "weekplayrank"}
+
+
+def add_sche(key):
+    scheduler.add_job(action_dict[key], 'cron', catch_up=key not in no_catch_up, **args_dict[key])
+
+
 def set_all_sche():
-    for key, value in action_dict.items():
+    for key in action_dict:
         if getattr(schedall, key):
-            action = action_dict[key]
-            args = args_dict[key]
-            scheduler.add_job(action, 'cron', **args)
+            add_sche(key)
 
 
 set_all_sche()
@@ -78,12 +89,11 @@ async def sched_change_policy(_, call):
     try:
         method = call.data.split('-')[1]
         # 根据method的值来添加或移除相应的任务
-        action = action_dict[method]
         args = args_dict[method]
         if getattr(schedall, method):
             scheduler.remove_job(job_id=args['id'], jobstore='default')
         else:
-            scheduler.add_job(action, 'cron', **args)
+            add_sche(method)
         setattr(schedall, method, not getattr(schedall, method))
         save_config()
         await asyncio.gather(callAnswer(call, f'⭕️ {method} 更改成功'), sched_panel(_, call.message))
@@ -91,6 +101,37 @@ async def sched_change_policy(_, call):
         await sched_panel(_, call.message)
 
 
+JOB_STATS_LIMIT = 5
+_run_status_icon = {'success': '✅', 'failed': '❌', 'skipped': '⏭', 'running': '⏳'}
+
+
+def _format_job_runs(job_id, runs):
+    lines = [f'**{job_id}**']
+    for r in runs:
+        icon = _run_status_icon.get(r.status, '❔')
+        duration = f'{r.duration:.1f}s' if r.duration is not None else '-'
+        calls = f'E{r.emby_calls or 0} D{r.db_calls or 0} T{r.tg_calls or 0}' if r.emby_calls is not None else ''
+        memory = f'{r.peak_rss_mb:.0f}MB({r.rss_delta_mb:+.1f})' \
+            if r.peak_rss_mb is not None and r.rss_delta_mb is not None else ''
+        lines.append(f'`{icon} {r.started_at:%m-%d %H:%M} {duration:>7} {calls} {memory}`')
+    return '\n'.join(lines)
+
+
+@bot.on_callback_query(filters.regex('jobstats') & admins_on_filter)
+async def job_stats_panel(_, call):
+    await callAnswer(call, '📊 定时任务运行记录')
+    job_ids = [args['id'] for args in args_dict.values()] + ['sync_favorites']
+    blocks = []
+    for job_id in job_ids:
+        runs = sql_list_job_runs(job_id, limit=JOB_STATS_LIMIT)
+        if runs:
+            blocks.append(_format_job_runs(job_id, runs))
+    text = f'📊 **定时任务运行记录**（每项最近{JOB_STATS_LIMIT}次）\n' \
+           f'E/D/T: Emby/数据库/Telegram 调用次数，内存为进程峰值(本次变化)\n\n'
+    text += '\n\n'.join(blocks) if blocks else '暂无运行记录'
+    await editMessage(call, text, buttons=job_stats_buttons())
+
+
 @bot.on_message(filters.command('check_ex', prefixes) & admins_on_filter)
 async def check_ex_admin(_, msg):
     await deleteMessage(msg)
@@ -100,6 +141,8 @@ async def check_ex_admin(_, msg):
     except:
         pass
     if confirm == 'true':
+        if scheduler.is_job_running('check_expired'):
+            return await msg.reply("⏳ 【到期检测】正在运行中，请稍后再试")
         send = await msg.reply("🍥 正在运行 【到期检测】。。。")
         await asyncio.gather(check_expired(), send.edit("✅ 【到期检测结束】"))
     else:
@@ -131,6 +174,8 @@ async def run_low_ac(_, msg):
     except:
         pass
     if confirm == 'true':
+        if scheduler.is_job_running('check_low_activity'):
+            return await msg.reply("⏳ 不活跃检测正在运行中，请稍后再试")
         send = await msg.reply("⭕ 不活跃检测运行ing···")
         await asyncio.gather(check_low_activity(), send.delete())
     else:
@@ -149,6 +194,8 @@ async def shou_dong_uplayrank(_, msg):
 @bot.on_message(filters.command('sync_favorites', prefixes) & admins_on_filter)
 async def sync_favorites_admin(_, msg):
     await deleteMessage(msg)
+    if scheduler.is_job_running('sync_favorites'):
+        return await msg.reply("⏳ 收藏记录同步正在运行中，请稍后再试")
     await msg.reply("⭕ 正在同步用户收藏记录...")
     await sync_favorites()
     await msg.reply("✅ 用户收藏记录同步完成")
@@ -159,7 +206,7 @@ async def restart_bot(_, msg):
     send = await msg.reply("Restarting，等待几秒钟。")
     schedall.restart_chat_id = send.chat.id
     schedall.restart_msg_id = send.id
-    save_config()
+    save_config(now=True)
     try:
         # some code here
         LOGGER.info("重启")
@@ -172,11 +219,10 @@ async def restart_bot(_, msg):
 async def page_uplayrank(_, call):
     j, days = map(int, call.data.split(":")[1].split('_'))
     await callAnswer(call, f'将为您翻到第 {j} 页')
-    a, b, c = await Uplaysinfo.users_playback_list(days)
-    if not a:
+    text, b = await Uplaysinfo.users_playback_page(days, j)
+    if not text:
         return await callAnswer(call, f'🍥 获取过去{days}天UserPlays失败了嘤嘤嘤 ~ 手动重试', True)
     button = await plays_list_button(b, j, days)
-    text = a[j - 1]
     await editMessage(call, text, buttons=button)
 
 
@@ -237,7 +283,7 @@ async def update_bot(force: bool = False, msg: Message = None, manual: bool = Fa
             LOGGER.info(text)
             auto_update.commit_sha = latest_commit
             auto_update.up_description = up_description
-            save_config()
+            save_config(now=True)
             os.execl(executable, executable, *argv)
         else:
             message = "【AutoUpdate_Bot】运行成功，未检测到更新，结束"
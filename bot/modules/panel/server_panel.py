@@ -2,6 +2,7 @@
 服务器讯息打印
 
 """
+import asyncio
 from datetime import datetime, timezone, timedelta
 from pyrogram import filters
 from bot import bot, emby_line, emby_whitelist_line
@@ -10,6 +11,11 @@ from bot.func_helper.filters import user_in_group_on_filter
 from bot.sql_helper.sql_emby import sql_get_emby
 from bot.func_helper.fix_bottons import cr_page_server
 from bot.func_helper.msg_utils import callAnswer, editMessage
+from bot.func_helper.server_status import server_status
+
+# 开机后启动探针后台轮询
+loop = asyncio.get_event_loop()
+loop.call_later(3, server_status.start)
 
 
 @bot.on_callback_query(filters.regex('server') & user_in_group_on_filter)
@@ -58,6 +64,8 @@ async def server(_, call):
             online = 'Emby服务器断连 ·0'
     except Exception:
         online = 'Emby服务器断连 ·0'
+    if server_info and server_status.latency is not None:
+        server_info += f'· 📡 探针 | {server_status.latency:.0f} ms\n'
     text = f'**▎↓目前线路 & 用户密码：**`{pwd}`\n' \
            f'{line}\n\n' \
            f'{server_info}' \
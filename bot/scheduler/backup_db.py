@@ -1,9 +1,8 @@
 import os
 
-import asyncio
-
-from bot import bot, owner, LOGGER, db_is_docker, db_docker_name, db_host, db_name, db_user, db_pwd, \
-    db_backup_dir, db_backup_maxcount, db_port
+from bot import bot, owner, LOGGER, config_writer, db_is_docker, db_docker_name, db_host, db_name, db_user, db_pwd, \
+    db_backup_dir, db_backup_maxcount, db_port, db_backup_compress, db_backup_per_table, db_backup_incremental, \
+    db_backup_method
 from bot.func_helper.backup_db_utils import BackupDBUtils
 
 
@@ -21,47 +20,65 @@ class DbBackupUtils:
 
     @classmethod
     async def backup_db(cls):
-        backup_file = None
+        result = None
+        options = dict(compress=db_backup_compress, per_table=db_backup_per_table, incremental=db_backup_incremental)
+        if db_backup_method == 'native':
+            return await BackupDBUtils.backup_native(
+                database_name=db_name,
+                backup_dir=db_backup_dir,
+                max_backup_count=db_backup_maxcount,
+                compress=db_backup_compress
+            )
         # 如果是在docker模式下运行的此程序，使用BackupDBUtils.backup_mysql_db的方式备份数据库（此镜像中已经安装了mysqldump工具）
         if os.environ.get('DOCKER_MODE') == "1" or not db_is_docker:
-            backup_file = await BackupDBUtils.backup_mysql_db(
+            result = await BackupDBUtils.backup_mysql_db(
                 host=db_host,
                 port=db_port,
                 user=db_user,
                 password=db_pwd,
                 database_name=db_name,
                 backup_dir=db_backup_dir,
-                max_backup_count=db_backup_maxcount
+                max_backup_count=db_backup_maxcount,
+                **options
             )
         elif db_is_docker:
-            backup_file = await BackupDBUtils.backup_mysql_db_docker(
+            result = await BackupDBUtils.backup_mysql_db_docker(
                 container_name=db_docker_name,
                 user=db_user,
                 password=db_pwd,
                 database_name=db_name,
                 backup_dir=db_backup_dir,
-                max_backup_count=db_backup_maxcount
+                max_backup_count=db_backup_maxcount,
+                **options
             )
-        return backup_file
+        return result
 
     @staticmethod
     async def auto_backup_db():
         LOGGER.info("BOT数据库备份开始")
-        backup_file = await DbBackupUtils.backup_db()
-        if backup_file is not None:
-            LOGGER.info(f'BOT数据库备份完毕')
+        result = await DbBackupUtils.backup_db()
+        if result is not None:
+            LOGGER.info(f'BOT数据库备份完毕: {result.summary}')
+            if not result.files:
+                LOGGER.info('增量备份: 数据库无变化，未生成新文件')
+                return
             try:
-                await asyncio.gather(bot.send_document(
-                    chat_id=owner,
-                    document=backup_file,
-                    caption=f'BOT数据库备份完毕',
-                    disable_notification=True  # 勿打扰
-                ), bot.send_document(
+                # 分卷/按表的多个文件依次发送，避免并发上传触发限流
+                for i, backup_file in enumerate(result.files, 1):
+                    await bot.send_document(
+                        chat_id=owner,
+                        document=backup_file,
+                        caption=f'BOT数据库备份完毕 ({i}/{len(result.files)})\n{result.summary}',
+                        disable_notification=True  # 勿打扰
+                    )
+                # 先写入尚在合并窗口内的配置修改
+                await config_writer.flush()
+                await bot.send_document(
                     chat_id=owner,
                     document='config.json',
                     caption=f'config备份完毕',
                     disable_notification=True  # 勿打扰
-                ))
+                )
             except Exception as e:
                 LOGGER.info(f'发送到owner失败，文件保存在本地:{e}')
         else:
@@ -1,48 +1,91 @@
+import asyncio
+
 from bot import LOGGER
-from bot.sql_helper.sql_favorites import sql_add_favorites, sql_clear_favorites
+from bot.sql_helper.sql_favorites import sql_get_favorite_map, sql_apply_favorites_diff
 from bot.sql_helper.sql_emby import get_all_emby, Emby
 from bot.func_helper.emby import emby
 
+# 同时向 Emby 拉取收藏的用户数
+SYNC_CONCURRENCY = 8
+
+
+async def _fetch_user_favorites(user, semaphore: asyncio.Semaphore):
+    """
+    拉取单个用户的收藏 {item_id: item_name}，请求失败返回 None（此时不能据此删除本地记录）
+    """
+    async with semaphore:
+        favorites = await emby.get_favorite_items(emby_id=user.embyid)
+    if favorites is False or favorites is None:
+        return None
+    remote = {}
+    for item in favorites.get("Items", []):
+        item_id = item.get("Id")
+        if item_id:
+            remote[item_id] = item.get("Name", "")
+    # 少数项目没有名称时才单独查询
+    for item_id, item_name in remote.items():
+        if not item_name:
+            async with semaphore:
+                remote[item_id] = await emby.item_id_name(emby_id=user.embyid, item_id=item_id) or "未知"
+    return remote
+
+
+def _diff_favorites(embyid: str, remote: dict, stored: dict):
+    """
+    比较远端与本地收藏，返回 (upserts, deletes)
+    EmbyID 变化的记录先删后插，避免按 (embyid, item_id) 唯一索引残留旧记录
+    """
+    upserts, deletes = {}, []
+    for item_id, (stored_embyid, stored_name) in stored.items():
+        if item_id not in remote or stored_embyid != embyid:
+            deletes.append(item_id)
+    for item_id, item_name in remote.items():
+        old = stored.get(item_id)
+        if old is None or old != (embyid, item_name):
+            upserts[item_id] = item_name
+    return upserts, deletes
+
+
+async def _sync_user(user, semaphore: asyncio.Semaphore):
+    remote = await _fetch_user_favorites(user, semaphore)
+    if remote is None:
+        return None
+    stored = sql_get_favorite_map(user.name)
+    if stored is None:
+        return None
+    upserts, deletes = _diff_favorites(user.embyid, remote, stored)
+    if not sql_apply_favorites_diff(user.embyid, user.name, upserts, deletes):
+        return None
+    return len(upserts), len(deletes)
+
 
 async def sync_favorites():
     """
-    同步所有用户的Emby收藏记录到数据库
+    增量同步所有用户的Emby收藏记录到数据库：并发拉取，与已存储记录比对后只写入变化
     """
     LOGGER.info("开始同步用户Emby收藏记录...")
     try:
-        # 获取所有Emby用户
-        users = get_all_emby(Emby.embyid is not None)
+        # 获取所有绑定了Emby账户的用户
+        users = get_all_emby(Emby.embyid.isnot(None) & Emby.name.isnot(None))
         if not users:
             LOGGER.warning("没有找到Emby用户")
             return
 
-        for user in users:
-            # 获取用户的收藏列表
-            favorites = await emby.get_favorite_items(emby_id=user.embyid)
-            if not favorites:
-                continue
-            #  清除数据库中该用户的收藏记录
-            sql_clear_favorites(user.name)
-            # 遍历收藏项目并添加到数据库
-            for item in favorites.get("Items", []):
-                item_id = item.get("Id")
-                if not item_id:
-                    continue
-
-                # 获取项目名称
-                item_name = item.get("Name", "")
-                if not item_name:
-                    item_name = await emby.item_id_name(emby_id=user.embyid, item_id=item_id) or "未知"
-
-                # 添加到数据库
-                sql_add_favorites(
-                    embyid=user.embyid,
-                    embyname=user.name,
-                    item_id=item_id,
-                    item_name=item_name,
-                )
-
-        LOGGER.info("Emby收藏记录同步完成")
+        semaphore = asyncio.Semaphore(SYNC_CONCURRENCY)
+        results = await asyncio.gather(*(_sync_user(user, semaphore) for user in users), return_exceptions=True)
+
+        upserted = deleted = failed = 0
+        for user, result in zip(users, results):
+            if isinstance(result, Exception):
+                LOGGER.error(f"同步 {user.name} 的收藏记录时出错: {result}")
+                failed += 1
+            elif result is None:
+                failed += 1
+            else:
+                upserted += result[0]
+                deleted += result[1]
+
+        LOGGER.info(f"Emby收藏记录同步完成：用户 {len(users)}，写入 {upserted}，删除 {deleted}，失败 {failed}")
 
     except Exception as e:
         LOGGER.error(f"同步Emby收藏记录时出错: {str(e)}")
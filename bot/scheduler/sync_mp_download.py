@@ -1,84 +1,75 @@
 from bot import LOGGER, config, bot
-from bot.func_helper.moviepilot import get_download_task, get_history_transfer_task_by_title_download_id
-from bot.sql_helper.sql_request_record import sql_update_request_status, sql_get_request_record_by_transfer_state, sql_get_request_record_by_download_id
+from bot.func_helper.moviepilot import get_download_task, get_transfer_history
+from bot.sql_helper.sql_request_record import sql_bulk_update_request_status, sql_get_request_record_by_transfer_state, \
+    sql_get_request_records_by_download_ids
 from bot.func_helper.scheduler import scheduler
+
+# MoviePilot 下载状态 -> 写入数据库的 (download_state, progress, left_time)，None 表示沿用任务上报的值
+_STATE_FIELDS = {
+    'downloading': ('downloading', None, None),
+    'completed': ('completed', 100, '0'),
+    'failed': ('failed', None, '失败'),
+    'pending': ('pending', 0, '等待中'),
+}
+
+
+def _download_updates(download_tasks, records) -> list:
+    """对比 MP 任务与数据库记录，只返回状态有变化的记录"""
+    updates = []
+    for task in download_tasks:
+        record = records.get(task['download_id'])
+        fields = _STATE_FIELDS.get(task['state'])
+        if record is None or fields is None:
+            continue
+        state, progress, left_time = fields
+        row = {
+            'download_state': state,
+            'progress': task['progress'] if progress is None else progress,
+            'left_time': task.get('left_time', '未知') if left_time is None else left_time,
+        }
+        if any(getattr(record, k) != v for k, v in row.items()):
+            updates.append({'download_id': record.download_id, **row})
+    return updates
+
+
 async def sync_download_tasks():
-    """同步MoviePilot下载任务状态到数据库"""
+    """同步MoviePilot下载任务状态到数据库：一次 IN 查询取记录，对比后一次批量提交"""
     try:
         # 获取所有下载任务
         download_tasks = await get_download_task()
-        download_count = 0
-        if download_tasks is not None:
-            # 更新每个任务的状态
-            for task in download_tasks:
-                record = sql_get_request_record_by_download_id(task['download_id'])
-                if record is None:
-                    continue
-                download_id = task['download_id']
-                download_state = task['state']
-                progress = task['progress']
-                left_time = task.get('left_time', '未知')
+        download_updates = []
+        if download_tasks:
+            records = sql_get_request_records_by_download_ids(t['download_id'] for t in download_tasks)
+            download_updates = _download_updates(download_tasks, records)
+            sql_bulk_update_request_status(download_updates)
 
-                # 根据状态更新数据库
-                if download_state == 'downloading':
-                    # 正在下载中
-                    sql_update_request_status(
-                        download_id=download_id,
-                        download_state='downloading',
-                        progress=progress,
-                        left_time=left_time
-                    )
-                elif download_state == 'completed':
-                    # 下载完成
-                    sql_update_request_status(
-                        download_id=download_id,
-                        download_state='completed',
-                        progress=100,
-                        left_time='0'
-                    )
-                elif download_state == 'failed':
-                    # 下载失败
-                    sql_update_request_status(
-                        download_id=download_id,
-                        download_state='failed',
-                        progress=progress,
-                        left_time='失败'
-                    )
-                elif download_state == 'pending':
-                    # 等待下载
-                    sql_update_request_status(
-                        download_id=download_id,
-                        download_state='pending',
-                        progress=0,
-                        left_time='等待中'
-                    )
-                download_count += 1
-        # 获取需要检查转移状态的记录
+        # 获取需要检查转移状态的记录，转移历史每轮只拉取一次
         transfer_tasks = sql_get_request_record_by_transfer_state()
-        transfer_count = 0
-        if transfer_tasks is not None:
-            # 检查每个记录的转移状态
+        transfer_updates = []
+        if transfer_tasks:
+            history = await get_transfer_history(r.download_id for r in transfer_tasks)
             for record in transfer_tasks:
-                transfer_state = await get_history_transfer_task_by_title_download_id("", record.download_id, count=100)
-                if transfer_state is not None:
-                    if transfer_state:
-                        try:
-                            await bot.send_message(chat_id=record.tg, text = f"💯恭喜您点播的「{record.request_name}」已成功入库！")
-                        except Exception as e:
-                            LOGGER.error(f"[MoviePilot] 发送通知到{record.tg}失败: {str(e)}")
-                    sql_update_request_status(
-                        download_id=record.download_id,
-                        transfer_state=transfer_state,
-                        download_state='completed',
-                        progress=100,
-                        left_time='0'
-                    )
-                    transfer_count += 1
-        if download_count > 0 or transfer_count > 0:
-            LOGGER.info(f"[MoviePilot] 同步了 {download_count} 个下载任务状态, {transfer_count} 个转移任务状态")
+                transfer_state = history.get(record.download_id)
+                if transfer_state is None:
+                    continue
+                if transfer_state:
+                    try:
+                        await bot.send_message(chat_id=record.tg, text=f"💯恭喜您点播的「{record.request_name}」已成功入库！")
+                    except Exception as e:
+                        LOGGER.error(f"[MoviePilot] 发送通知到{record.tg}失败: {str(e)}")
+                transfer_updates.append({
+                    'download_id': record.download_id,
+                    'transfer_state': transfer_state,
+                    'download_state': 'completed',
+                    'progress': 100,
+                    'left_time': '0',
+                })
+            sql_bulk_update_request_status(transfer_updates)
+        if download_updates or transfer_updates:
+            LOGGER.info(f"[MoviePilot] 同步了 {len(download_updates)} 个下载任务状态, {len(transfer_updates)} 个转移任务状态")
     except Exception as e:
         LOGGER.error(f"[MoviePilot] 同步下载任务状态时出错: {str(e)}")
 # 如果MoviePilot功能开启，添加定时任务
 if config.moviepilot.status:
     scheduler.add_job(sync_download_tasks, 'interval',
-                     seconds=60, id='sync_download_tasks')
\ No newline at end of file
+                     seconds=60, id='sync_download_tasks')
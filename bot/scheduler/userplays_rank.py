@@ -5,96 +5,117 @@ from datetime import datetime, timezone, timedelta
 from bot import bot, bot_photo, group, sakura_b, LOGGER, ranks, _open 
 from bot.func_helper.emby import emby
 from bot.func_helper.utils import convert_to_beijing_time, convert_s, cache, get_users, tem_deluser
-from bot.sql_helper import Session
-from bot.sql_helper.sql_emby import sql_get_emby, sql_update_embys, Emby, sql_update_emby
+from bot.sql_helper.sql_emby import sql_get_emby, Emby, sql_update_emby, sql_get_embys_by_names
+from bot.sql_helper.sql_ledger import sql_credit_embys
 from bot.func_helper.fix_bottons import plays_list_button
 
 
+RANK_PAGE_SIZE = 10
+RANK_MEDALS = ["🥇", "🥈", "🥉", "🏅"]
+RANK_POINTS = [1000, 900, 800, 700, 600, 500, 400, 300, 200, 100]
+# 结算积分时每批 IN 查询的用户名数量
+REWARD_CHUNK_SIZE = 500
+
+
+def rank_medal(rank: int) -> str:
+    return RANK_MEDALS[rank - 1] if rank < 4 else RANK_MEDALS[3]
+
+
 class Uplaysinfo:
     client = emby
 
     @classmethod
     @cache.memoize(ttl=120)
     async def users_playback_list(cls, days):
+        """
+        拉取观影时长原始榜单，只缓存 (emby用户名, 观影秒数) 元组，页面按需渲染
+        :return: tuple or None
+        """
         try:
             play_list = await emby.emby_cust_commit(emby_id=None, days=days, method='sp')
         except Exception as e:
             print(f"Error fetching playback list: {e}")
-            return None, 1, 1
-
-        if play_list is None:
-            return None, 1, 1
-
-        with Session() as session:
-            # 更高效地查询 Emby 表的数据
-            result = session.query(Emby).filter(Emby.name.isnot(None)).all()
-
-            if not result:
-                return None, 1
-
-            total_pages = math.ceil(len(play_list) / 10)
-            members = await get_users()
-            members_dict = {}
-
-            for record in result:
-                members_dict[record.name] = {
-                    "name": members.get(record.tg, record.name),
-                    "tg": record.tg,
-                    "lv": record.lv,
-                    "iv": record.iv
-                }
-
-            rank_medals = ["🥇", "🥈", "🥉", "🏅"]
-            rank_points = [1000, 900, 800, 700, 600, 500, 400, 300, 200, 100]
+            return None
 
-            pages_data = []
-            leaderboard_data = []
+        if not play_list:
+            return None
+        return tuple((record[0], int(record[1])) for record in play_list)
 
-            for page_number in range(1, total_pages + 1):
-                start_index = (page_number - 1) * 10
-                end_index = start_index + 10
-                page_data = f'**▎🏆{ranks.logo} {days} 天观影榜**\n\n'
-
-                for rank, play_record in enumerate(play_list[start_index:end_index], start=start_index + 1):
-                    medal = rank_medals[rank - 1] if rank < 4 else rank_medals[3]
-                    member_info = members_dict.get(play_record[0], None)
-
-                    if not member_info or not member_info["tg"]:
-                        emby_name = '神秘客户' 
-                        # emby_name = play_record[0] + ' (未绑定Bot)'
-                        tg = 'None'
-                    else:
-                        emby_name = member_info["name"]
-                        tg = member_info["tg"]
-
-                        # 计算积分
-                        points = rank_points[rank - 1] + (int(play_record[1]) // 60) if rank <= 10 else (
-                                    int(play_record[1]) // 60)
-                        new_iv = member_info["iv"] + points
-                        leaderboard_data.append([member_info["tg"], new_iv, f'{medal}{emby_name}', points])
-
-                    formatted_time = await convert_s(int(play_record[1]))
-                    page_data += f'{medal}**第{cn2an.an2cn(rank)}名** | [{emby_name}](tg://user?id={tg})\n' \
-                                 f'  观影时长 | {formatted_time}\n'
+    @classmethod
+    @cache.memoize(ttl=120)
+    async def users_playback_page(cls, days, page: int = 1):
+        """
+        渲染观影榜的某一页，只对本页的用户名做一次 IN 查询
+        :return: page_text, total_pages
+        """
+        play_list = await cls.users_playback_list(days)
+        if not play_list:
+            return None, 1
+
+        total_pages = math.ceil(len(play_list) / RANK_PAGE_SIZE)
+        page = min(max(page, 1), total_pages)
+        start_index = (page - 1) * RANK_PAGE_SIZE
+        page_records = play_list[start_index:start_index + RANK_PAGE_SIZE]
+
+        embies = sql_get_embys_by_names([record[0] for record in page_records])
+        members = await get_users()
+
+        page_data = f'**▎🏆{ranks.logo} {days} 天观影榜**\n\n'
+        for rank, (name, seconds) in enumerate(page_records, start=start_index + 1):
+            e = embies.get(name)
+            if not e or not e.tg:
+                emby_name = '神秘客户'
+                tg = 'None'
+            else:
+                emby_name = members.get(e.tg, e.name)
+                tg = e.tg
+            formatted_time = await convert_s(seconds)
+            page_data += f'{rank_medal(rank)}**第{cn2an.an2cn(rank)}名** | [{emby_name}](tg://user?id={tg})\n' \
+                         f'  观影时长 | {formatted_time}\n'
 
-                page_data += f'\n#UPlaysRank {datetime.now(timezone(timedelta(hours=8))).strftime("%Y-%m-%d")}'
-                pages_data.append(page_data)
+        page_data += f'\n#UPlaysRank {datetime.now(timezone(timedelta(hours=8))).strftime("%Y-%m-%d")}'
+        return page_data, total_pages
 
-            return pages_data, total_pages, leaderboard_data
+    @classmethod
+    async def users_playback_rewards(cls, days):
+        """
+        计算观影时长奖励，分批按用户名 IN 查询
+        :return: [[tg, points, display_name], ...]
+        """
+        play_list = await cls.users_playback_list(days)
+        if not play_list:
+            return []
+
+        members = await get_users()
+        leaderboard_data = []
+        for start in range(0, len(play_list), REWARD_CHUNK_SIZE):
+            chunk = play_list[start:start + REWARD_CHUNK_SIZE]
+            embies = sql_get_embys_by_names([record[0] for record in chunk])
+            for rank, (name, seconds) in enumerate(chunk, start=start + 1):
+                e = embies.get(name)
+                if not e or not e.tg:
+                    continue
+                # 计算积分
+                points = RANK_POINTS[rank - 1] + (seconds // 60) if rank <= 10 else (seconds // 60)
+                emby_name = members.get(e.tg, e.name)
+                leaderboard_data.append([e.tg, points, f'{rank_medal(rank)}{emby_name}'])
+        return leaderboard_data
 
     @staticmethod
     async def user_plays_rank(days=7, uplays=True):
-        a, n, ls = await Uplaysinfo.users_playback_list(days)
+        a, n = await Uplaysinfo.users_playback_page(days, 1)
         if not a:
             return await bot.send_photo(chat_id=group[0], photo=bot_photo,
                                         caption=f'🍥 获取过去{days}天UserPlays失败了嘤嘤嘤 ~ 手动重试 ')
         play_button = await plays_list_button(n, 1, days)
-        send = await bot.send_photo(chat_id=group[0], photo=bot_photo, caption=a[0], reply_markup=play_button)
+        send = await bot.send_photo(chat_id=group[0], photo=bot_photo, caption=a, reply_markup=play_button)
         if uplays and _open.uplays:
-            if sql_update_embys(some_list=ls, method='iv'):
+            ls = await Uplaysinfo.users_playback_rewards(days)
+            ref = f'{days}d {datetime.now().strftime("%Y-%m-%d")}'
+            if sql_credit_embys([(i[0], i[1]) for i in ls], reason='uplays', ref=ref):
                 text = f'**自动将观看时长转换为{sakura_b}**\n\n'
                 for i in ls:
-                    text += f'[{i[2]}](tg://user?id={i[0]}) 获得了 {i[3]} {sakura_b}奖励\n'
+                    text += f'[{i[2]}](tg://user?id={i[0]}) 获得了 {i[1]} {sakura_b}奖励\n'
                 n = 4096
                 chunks = [text[i:i + n] for i in range(0, len(text), n)]
                 for c in chunks:
@@ -1,7 +1,9 @@
 import json
 import os
-from pydantic import BaseModel, Field
-from typing import Dict, List, Optional, Union
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Dict, List, Optional, Tuple, Union
+
+from bot.func_helper.config_store import write_json_atomic
 
 # 嵌套式的数据设计，规范数据 config.json
 
@@ -40,6 +42,7 @@ class Open(BaseModel):
     register_worker_count: int = 5
     register_queue_limit: int = 100
     timing: int = 0
+    # 已注册席位，运行中以数据库 bot_counters.open_tem 为准，此处仅用于首次初始化
     tem: Optional[int] = 0
     # allow_code: StrictBool
     # @field_validator('allow_code', mode='before')
@@ -204,12 +207,20 @@ class Config(BaseModel):
     tz_version: Optional[str] = "v0"  # "v0" for Nezha V0, "v1" for Nezha V1, "komari" for Komari
     tz_username: Optional[str] = None  # V1 API only
     tz_password: Optional[str] = None  # V1 API only
+    tz_poll_interval: int = 60  # 后台轮询探针的间隔（秒）
     ranks: Ranks
     schedall: Schedall
     db_is_docker: bool = False
     db_docker_name: str = "mysql"
     db_backup_dir: str = "./db_backup"
     db_backup_maxcount: int = 7
+    # 备份方式 mysqldump / native(内置导出器，不依赖 mysqldump 和 docker)
+    db_backup_method: str = "mysqldump"
+    # 备份压缩方式 gzip / zstd(需安装 zstandard) / none
+    db_backup_compress: str = "gzip"
+    # 按表分别导出；开启增量后只导出自上次备份以来有变化的表
+    db_backup_per_table: bool = False
+    db_backup_incremental: bool = False
     # another_line: Optional[List[str]] = []
     # 如果使用的是 Python 3.10+ ，|运算符能用
     # w_anti_channel_ids: Optional[List[str | int]] = []
@@ -237,6 +248,9 @@ class Config(BaseModel):
     line_filter_block_user: bool = False
     # 分区名 -> 库名列表
     partition_libs: Dict[str, List[str]] = Field(default_factory=dict)
+    # 新入库通知合并窗口(秒)，窗口内同一剧集同一季的多集合并为一条通知，0 为不合并
+    # 用户收到通知的延迟约为 本窗口 + notify_queue.DIGEST_DELAY
+    media_notify_window: int = 30
     moviepilot: MP = Field(default_factory=MP)
     auto_update: AutoUpdate = Field(default_factory=AutoUpdate)
     red_envelope: RedEnvelope = Field(default_factory=RedEnvelope)
@@ -255,17 +269,18 @@ class Config(BaseModel):
             return cls(**config)
 
     def save_config(self):
-        with open("config.json", "w", encoding="utf-8") as f:
-            json.dump(self.model_dump(), f, indent=4, ensure_ascii=False)
+        write_json_atomic("config.json", self.model_dump())
 
 
 class Yulv(BaseModel):
-    wh_msg: List[str]
-    red_bag: List[str]
-    white_list: List[str]
+    """语录，通过 bot.func_helper.resources.yulv 读取缓存"""
+    model_config = ConfigDict(frozen=True)
+
+    wh_msg: Tuple[str, ...]
+    red_bag: Tuple[str, ...]
+    white_list: Tuple[str, ...]
 
     @classmethod
     def load_yulv(cls):
-        with open("bot/func_helper/yvlu.json", "r", encoding="utf-8") as f:
-            yulv = json.load(f)
-            return cls(**yulv)
+        from bot.func_helper.resources import yulv
+        return yulv.get()
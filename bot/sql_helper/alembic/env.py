@@ -4,7 +4,7 @@ from alembic import context
 from sqlalchemy import engine_from_config, pool
 
 from bot.sql_helper import Base
-from bot.sql_helper import sql_code, sql_emby, sql_emby2, sql_favorites, sql_partition, sql_request_record  # noqa: F401
+from bot.sql_helper import sql_code, sql_counter, sql_emby, sql_emby2, sql_favorites, sql_ledger, sql_partition, sql_request_record, sql_sched  # noqa: F401
 
 config = context.config
 
@@ -0,0 +1,44 @@
+"""add iv_ledger table
+
+Revision ID: 20261019_01
+Revises: 20260315_02
+Create Date: 2026-10-19 10:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20261019_01"
+down_revision = "20260315_02"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "iv_ledger" in inspector.get_table_names():
+        return
+    op.create_table(
+        "iv_ledger",
+        sa.Column("id", sa.BigInteger(), primary_key=True, autoincrement=True),
+        sa.Column("tg", sa.BigInteger(), nullable=False),
+        sa.Column("amount", sa.Integer(), nullable=False),
+        sa.Column("reason", sa.String(length=64), nullable=False),
+        sa.Column("ref", sa.String(length=255), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8mb4",
+        mysql_collate="utf8mb4_unicode_ci",
+    )
+    op.create_index("ix_iv_ledger_tg", "iv_ledger", ["tg"])
+    op.create_index("ix_iv_ledger_reason", "iv_ledger", ["reason"])
+    op.create_index("ix_iv_ledger_created_at", "iv_ledger", ["created_at"])
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "iv_ledger" in inspector.get_table_names():
+        op.drop_table("iv_ledger")
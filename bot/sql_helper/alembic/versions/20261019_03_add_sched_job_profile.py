@@ -0,0 +1,45 @@
+"""add profiling columns to sched_job_runs
+
+Revision ID: 20261019_03
+Revises: 20261019_02
+Create Date: 2026-10-19 12:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20261019_03"
+down_revision = "20261019_02"
+branch_labels = None
+depends_on = None
+
+_COLUMNS = (
+    ("emby_calls", sa.Integer()),
+    ("db_calls", sa.Integer()),
+    ("tg_calls", sa.Integer()),
+    ("peak_rss_mb", sa.Float()),
+    ("rss_delta_mb", sa.Float()),
+)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "sched_job_runs" not in inspector.get_table_names():
+        return
+    existing = {col["name"] for col in inspector.get_columns("sched_job_runs")}
+    for name, type_ in _COLUMNS:
+        if name not in existing:
+            op.add_column("sched_job_runs", sa.Column(name, type_, nullable=True))
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "sched_job_runs" not in inspector.get_table_names():
+        return
+    existing = {col["name"] for col in inspector.get_columns("sched_job_runs")}
+    for name, _ in reversed(_COLUMNS):
+        if name in existing:
+            op.drop_column("sched_job_runs", name)
@@ -0,0 +1,36 @@
+"""add item_id index to emby_favorites
+
+Revision ID: 20261019_04
+Revises: 20261019_03
+Create Date: 2026-10-19 13:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20261019_04"
+down_revision = "20261019_03"
+branch_labels = None
+depends_on = None
+
+_INDEX = "ix_emby_favorites_item_id"
+
+
+def _has_index(inspector) -> bool:
+    return any(index["name"] == _INDEX for index in inspector.get_indexes("emby_favorites"))
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "emby_favorites" not in inspector.get_table_names() or _has_index(inspector):
+        return
+    op.create_index(_INDEX, "emby_favorites", ["item_id"])
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "emby_favorites" in inspector.get_table_names() and _has_index(inspector):
+        op.drop_index(_INDEX, table_name="emby_favorites")
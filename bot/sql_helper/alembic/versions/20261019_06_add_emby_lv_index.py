@@ -0,0 +1,46 @@
+"""add (lv, tg) index to emby
+
+Revision ID: 20261019_06
+Revises: 20261019_05
+Create Date: 2026-10-19 15:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20261019_06"
+down_revision = "20261019_05"
+branch_labels = None
+depends_on = None
+
+_TABLE = "emby"
+_INDEXES = {
+    "ix_emby_lv_tg": ["lv", "tg"],
+}
+
+
+def _existing(inspector) -> set:
+    return {index["name"] for index in inspector.get_indexes(_TABLE)}
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if _TABLE not in inspector.get_table_names():
+        return
+    existing = _existing(inspector)
+    for name, columns in _INDEXES.items():
+        if name not in existing:
+            op.create_index(name, _TABLE, columns)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if _TABLE not in inspector.get_table_names():
+        return
+    existing = _existing(inspector)
+    for name in _INDEXES:
+        if name in existing:
+            op.drop_index(name, table_name=_TABLE)
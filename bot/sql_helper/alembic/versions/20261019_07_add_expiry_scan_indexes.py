@@ -0,0 +1,55 @@
+"""add composite indexes for expiry scans
+
+Revision ID: 20261019_07
+Revises: 20261019_06
+Create Date: 2026-10-19 16:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20261019_07"
+down_revision = "20261019_06"
+branch_labels = None
+depends_on = None
+
+# 等值列在前、范围列（到期时间）在后
+_INDEXES = {
+    "emby": {
+        "ix_emby_lv_ex": ["lv", "ex"],
+    },
+    "emby2": {
+        "ix_emby2_lv_expired_ex": ["lv", "expired", "ex"],
+    },
+    "partition_grants": {
+        "ix_partition_grants_status_expires": ["status", "expires_at"],
+        "ix_partition_grants_tg_status_expires": ["tg", "status", "expires_at"],
+    },
+}
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+    for table, indexes in _INDEXES.items():
+        if table not in tables:
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table)}
+        for name, columns in indexes.items():
+            if name not in existing:
+                op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+    for table, indexes in _INDEXES.items():
+        if table not in tables:
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table)}
+        for name in indexes:
+            if name in existing:
+                op.drop_index(name, table_name=table)
@@ -0,0 +1,38 @@
+"""add bot_counters table
+
+Revision ID: 20261019_08
+Revises: 20261019_07
+Create Date: 2026-10-19 17:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20261019_08"
+down_revision = "20261019_07"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "bot_counters" in inspector.get_table_names():
+        return
+    op.create_table(
+        "bot_counters",
+        sa.Column("name", sa.String(length=64), primary_key=True),
+        sa.Column("value", sa.BigInteger(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8mb4",
+        mysql_collate="utf8mb4_unicode_ci",
+    )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "bot_counters" in inspector.get_table_names():
+        op.drop_table("bot_counters")
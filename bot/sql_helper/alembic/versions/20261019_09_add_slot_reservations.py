@@ -0,0 +1,49 @@
+"""add reserved column to bot_counters and slot_reservations table
+
+Revision ID: 20261019_09
+Revises: 20261019_08
+Create Date: 2026-10-19 18:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20261019_09"
+down_revision = "20261019_08"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+    if "bot_counters" in tables:
+        columns = {column["name"] for column in inspector.get_columns("bot_counters")}
+        if "reserved" not in columns:
+            op.add_column("bot_counters",
+                          sa.Column("reserved", sa.BigInteger(), nullable=False, server_default="0"))
+    if "slot_reservations" not in tables:
+        op.create_table(
+            "slot_reservations",
+            sa.Column("tg", sa.BigInteger(), primary_key=True, autoincrement=False),
+            sa.Column("counter", sa.String(length=64), nullable=False),
+            sa.Column("expires_at", sa.DateTime(), nullable=False),
+            mysql_engine="InnoDB",
+            mysql_charset="utf8mb4",
+            mysql_collate="utf8mb4_unicode_ci",
+        )
+        op.create_index("ix_slot_reservations_counter_expires", "slot_reservations", ["counter", "expires_at"])
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+    if "slot_reservations" in tables:
+        op.drop_table("slot_reservations")
+    if "bot_counters" in tables:
+        columns = {column["name"] for column in inspector.get_columns("bot_counters")}
+        if "reserved" in columns:
+            op.drop_column("bot_counters", "reserved")
@@ -1,5 +1,6 @@
 import math
 
+from bot import LOGGER
 from bot.sql_helper import Base, Session
 from sqlalchemy import (
     Column,
@@ -8,10 +9,15 @@ from sqlalchemy import (
     DateTime,
     Integer,
     func,
+    insert,
+    tuple_,
+    Index,
 )
 from cacheout import Cache
 
 cache = Cache()
+# (tg, us, page_size, page) -> 该页最后一行的排序键，顺序翻页时直接从这里接着取；码有增删改时清空
+_page_anchor_cache = Cache(maxsize=2048, ttl=600)
 
 
 class Code(Base):
@@ -26,6 +32,11 @@ class Code(Base):
     used = Column(BigInteger, nullable=True)
     usedtime = Column(DateTime, nullable=True)
 
+    __table_args__ = (
+        Index('ix_rcode_tg_us', 'tg', 'us'),
+        Index('ix_rcode_tg_usedtime', 'tg', 'usedtime'),
+    )
+
 def sql_add_code(code_list: list, tg: int, us: int):
     """批量添加记录，如果code已存在则忽略"""
     with Session() as session:
@@ -33,12 +44,74 @@ def sql_add_code(code_list: list, tg: int, us: int):
             code_list = [Code(code=c, tg=tg, us=us) for c in code_list]
             session.add_all(code_list)
             session.commit()
+            _page_anchor_cache.clear()
             return True
         except:
             session.rollback()
             return False
 
 
+# 批量铸码时单条 INSERT / IN 查询包含的最大码数
+CODE_CHUNK_SIZE = 1000
+
+
+def sql_existing_codes(code_list) -> set:
+    """批量查重，返回 code_list 中数据库已存在的码；查询失败返回 None"""
+    code_list = list(code_list)
+    existing = set()
+    with Session() as session:
+        try:
+            for start in range(0, len(code_list), CODE_CHUNK_SIZE):
+                chunk = code_list[start:start + CODE_CHUNK_SIZE]
+                existing.update(c for c, in session.query(Code.code).filter(Code.code.in_(chunk)))
+            return existing
+        except Exception as e:
+            LOGGER.error(f"批量查询码失败: {e}")
+            return None
+
+
+def sql_mint_codes(code_list, tg: int, us: int):
+    """
+    分块 INSERT IGNORE 批量写入码，已存在的码被忽略而不是让整批失败
+    :return: 实际写入的数量，失败返回 None
+    """
+    code_list = list(code_list)
+    inserted = 0
+    with Session() as session:
+        try:
+            for start in range(0, len(code_list), CODE_CHUNK_SIZE):
+                chunk = code_list[start:start + CODE_CHUNK_SIZE]
+                # 用 Core 表执行：ORM 批量插入返回的结果没有 rowcount
+                result = session.execute(insert(Code.__table__)
+                                         .prefix_with('IGNORE', dialect='mysql')
+                                         .prefix_with('OR IGNORE', dialect='sqlite'),
+                                         [{"code": c, "tg": tg, "us": us} for c in chunk])
+                inserted += result.rowcount
+            session.commit()
+            _page_anchor_cache.clear()
+            return inserted
+        except Exception as e:
+            session.rollback()
+            LOGGER.error(f"批量写入码失败: {e}")
+            return None
+
+
+def sql_get_minted_codes(code_list, tg: int, us: int) -> list:
+    """查询 code_list 中属于 tg 且未使用的码，用于确认 INSERT IGNORE 实际写入了哪些"""
+    code_list = list(code_list)
+    minted = []
+    with Session() as session:
+        try:
+            for start in range(0, len(code_list), CODE_CHUNK_SIZE):
+                chunk = code_list[start:start + CODE_CHUNK_SIZE]
+                minted += [c for c, in session.query(Code.code).filter(
+                    Code.code.in_(chunk), Code.tg == tg, Code.us == us, Code.used == None)]
+            return minted
+        except Exception as e:
+            LOGGER.error(f"批量查询码失败: {e}")
+            return []
+
+
 def sql_update_code(code, used: int, usedtime):
     with Session() as session:
         try:
@@ -47,6 +120,7 @@ def sql_update_code(code, used: int, usedtime):
             if c == 0:
                 return False
             session.commit()
+            _page_anchor_cache.clear()
             return True
         except Exception as e:
             print(e)
@@ -62,189 +136,163 @@ def sql_get_code(code):
             return None
 
 
-def sql_count_code(tg: int = None):
-    with Session() as session:
-        if tg is None:
-            try:
-                # 查询used不为空的数量
-                used_count = (
-                    session.query(func.count()).filter(Code.used != None).scalar()
-                )
-                # 查询所有未使用的数量
-                unused_count = (
-                    session.query(func.count()).filter(Code.used == None).scalar()
-                )
-                # 查询used为空时，us=30，90，180，360的数量
-                us_list = [30, 90, 180, 365]  # 创建一个列表，存储us的值
-                tg_mon, tg_sea, tg_half, tg_year = [
-                    session.query(func.count())
-                    .filter(Code.used == None)
-                    .filter(Code.us == us)
-                    .scalar()
-                    for us in us_list
-                ]  # 用一个列表推导式来查询数量
-                return used_count, tg_mon, tg_sea, tg_half, tg_year, unused_count
-            except Exception as e:
-                print(e)
-                return None
-        else:
-            try:
-                used_count = (
-                    session.query(func.count())
-                    .filter(Code.used != None)
-                    .filter(Code.tg == tg)
-                    .scalar()
-                )
-                unused_count = (
-                    session.query(func.count())
-                    .filter(Code.used == None)
-                    .filter(Code.tg == tg)
-                    .scalar()
-                )
-                us_list = [30, 90, 180, 365]
-                tg_mon, tg_sea, tg_half, tg_year = [
-                    session.query(func.count())
-                    .filter(Code.used == None)
-                    .filter(Code.us == us)
-                    .filter(Code.tg == tg)
-                    .scalar()
-                    for us in us_list
-                ]
-                return used_count, tg_mon, tg_sea, tg_half, tg_year, unused_count
-            except Exception as e:
-                print(e)
-                return None
-
-
-def sql_count_p_code(tg_id, us):
+# 统计中单独列出的天数：月/季/半年/年
+_STAT_DAYS = (30, 90, 180, 365)
+CODE_PAGE_SIZE = 30
+STORE_PAGE_SIZE = 5
+
+
+def _summarize_code_stats(stats: dict):
+    """{(是否未使用, us): 数量} -> (已使用, 月, 季, 半年, 年, 未使用)"""
+    used = sum(n for (unused, _), n in stats.items() if not unused)
+    unused = sum(n for (unused, _), n in stats.items() if unused)
+    return (used, *[stats.get((True, d), 0) for d in _STAT_DAYS], unused)
+
+
+def sql_code_stats(tg_list: list = None):
+    """
+    一次 GROUP BY tg, used IS NULL, us 统计码数量
+    :param tg_list: 只统计这些创建者；None 时统计全部（不区分创建者）
+    :return: {tg 或 None: {(是否未使用, us): 数量}}，失败返回 None
+    """
     with Session() as session:
         try:
-            if us == 0:
-                p = (
-                    session.query(func.count())
-                    .filter(Code.used != None)
-                    .filter(Code.tg == tg_id)
-                    .scalar()
-                )
-            elif us == -1:
-                p = (
-                    session.query(func.count())
-                    .filter(Code.used == None)
-                    .filter(Code.tg == tg_id)
-                    .scalar()
-                )
-            else:
-                p = (
-                    session.query(func.count())
-                    .filter(Code.us == us)
-                    .filter(Code.tg == tg_id)
-                    .scalar()
-                )
-            if p == 0:
-                return None, 1
-            i = math.ceil(p / 30)
-            a = []
-            b = 1
-            # 分析出页数，将检索出 分割p（总数目）的 间隔，将间隔分段，放进【】中返回
-            while b <= i:
-                d = (b - 1) * 30
-                if us == -1:
-                    result = (
-                        session.query(
-                            Code.tg, Code.code, Code.used, Code.usedtime, Code.us
-                        )
-                        .filter(Code.used == None)
-                        .filter(Code.tg == tg_id)
-                        .order_by(Code.us.asc())
-                        .limit(30)
-                        .offset(d)
-                        .all()
-                    )
-                elif us != 0:
-                    # 查询us和tg匹配的记录，按tg升序，usedtime降序排序，分页查询
-                    result = (
-                        session.query(Code.tg, Code.code, Code.used, Code.usedtime)
-                        .filter(Code.us == us)
-                        .filter(Code.tg == tg_id)
-                        .filter(Code.used == None)
-                        .order_by(Code.tg.asc(), Code.usedtime.desc())
-                        .limit(30)
-                        .offset(d)
-                        .all()
-                    )
-                else:
-                    result = (
-                        session.query(
-                            Code.tg, Code.code, Code.used, Code.usedtime, Code.us
-                        )
-                        .filter(Code.used != None)
-                        .filter(Code.tg == tg_id)
-                        .order_by(Code.tg.asc(), Code.usedtime.desc())
-                        .limit(30)
-                        .offset(d)
-                        .all()
-                    )
-                x = ""
-                e = 1 if d == 0 else d + 1
-                for link in result:
-                    if us == 0:
-                        c = (
-                            f"{e}. `"
-                            + f"{link[1]}`"
-                            + f"\n🎁 {link[4]}d - [{link[2]}](tg://user?id={link[0]})(__{link[3]}__)\n"
-                        )
-                    else:
-                        c = f"{e}. `" + f"{link[1]}`\n"
-                    x += c
-                    e += 1
-                a.append(x)
-                b += 1
-            # a 是数量，i是页数
-            return a, i
+            if tg_list is not None:
+                tg_list = [int(tg) for tg in tg_list]
+            unused = (Code.used == None).label("unused")
+            columns = [unused, Code.us, func.count()]
+            query = session.query(*columns).group_by(unused, Code.us)
+            if tg_list is not None:
+                query = session.query(Code.tg, *columns).filter(Code.tg.in_(tg_list)).group_by(Code.tg, unused, Code.us)
+            stats = {tg: {} for tg in tg_list} if tg_list is not None else {None: {}}
+            for row in query.all():
+                tg = row[0] if tg_list is not None else None
+                is_unused, us, n = row[-3:]
+                stats[tg][(bool(is_unused), us)] = n
+            return stats
         except Exception as e:
-            # 查询失败时，打印异常信息，并返回None
-            print(e)
-            return None, 1
+            LOGGER.error(f"统计码数量失败: {e}")
+            return None
+
+
+def sql_count_code(tg: int = None):
+    """
+    :return: (已使用, 月, 季, 半年, 年, 未使用)，失败返回 None
+    """
+    stats = sql_code_stats(None if tg is None else [tg])
+    if stats is None:
+        return None
+    return _summarize_code_stats(stats[tg])
+
+
+def sql_count_code_by_tg(tg_list: list) -> dict:
+    """多个创建者的统计一次查出 {tg: (已使用, 月, 季, 半年, 年, 未使用)}"""
+    stats = sql_code_stats(list(tg_list)) or {}
+    return {tg: _summarize_code_stats(stats.get(tg, {})) for tg in tg_list}
+
+
+def _code_page_query(session, tg_id, us):
+    """
+    返回 (查询, 排序键列, 是否降序)
+    us: 0 已使用 | -1 全部未使用 | 其他 该天数的未使用 | None 该创建者的全部码
+    """
+    query = session.query(Code.tg, Code.code, Code.used, Code.usedtime, Code.us).filter(Code.tg == tg_id)
+    if us == 0:
+        return query.filter(Code.used != None), (Code.usedtime, Code.code), True
+    if us == -1:
+        return query.filter(Code.used == None), (Code.us, Code.code), False
+    if us is None:
+        return query, (Code.code,), False
+    return query.filter(Code.used == None, Code.us == us), (Code.code,), False
 
 
-def sql_count_c_code(tg_id):
+def sql_code_page(tg_id, us, page: int = 1, page_size: int = CODE_PAGE_SIZE):
+    """
+    键集分页读取一页码，不再 OFFSET 扫描前面所有行
+    顺序翻页时用缓存的上一页末尾键；跳页时只在排序键上定位一次起点
+    :return: 该页记录列表，失败返回 None
+    """
     with Session() as session:
         try:
-            p = session.query(func.count()).filter(Code.tg == tg_id).scalar()
-            if p == 0:
-                return None, 1
-            i = math.ceil(p / 5)
-            a = []
-            b = 1
-            # 分析出页数，将检索出 分割p（总数目）的 间隔，将间隔分段，放进【】中返回
-            while b <= i:
-                d = (b - 1) * 5
-                result = (
-                    session.query(Code.tg, Code.code, Code.used, Code.usedtime, Code.us)
-                    .filter(Code.tg == tg_id)
-                    .order_by(Code.tg.asc(), Code.usedtime.desc())
-                    .limit(5)
-                    .offset(d)
-                    .all()
-                )
-                x = ""
-                e = 1 if d == 0 else d + 1
-                for link in result:
-                    c = (
-                        f"{e}. `{link[1]}`\n"
-                        f"🎁： {link[4]} 天 | 👤[{link[2]}](tg://user?id={link[2]})\n"
-                        f"🌏：{link[3]}\n\n"
-                    )
-                    x += c
-                    e += 1
-                a.append(x)
-                b += 1
-            # a 是数量，i是页数
-            return a, i
+            query, keys, desc = _code_page_query(session, tg_id, us)
+            order = [k.desc() for k in keys] if desc else list(keys)
+            anchor = None
+            if page > 1:
+                anchor = _page_anchor_cache.get((tg_id, us, page_size, page - 1))
+                if anchor is None:
+                    row = (query.with_entities(*keys).order_by(*order)
+                           .offset((page - 1) * page_size - 1).limit(1).first())
+                    if row is None:
+                        return []
+                    anchor = tuple(row)
+                key = tuple_(*keys) if len(keys) > 1 else keys[0]
+                value = tuple_(*anchor) if len(keys) > 1 else anchor[0]
+                query = query.filter(key < value if desc else key > value)
+            rows = query.order_by(*order).limit(page_size).all()
+            if rows:
+                last = rows[-1]
+                _page_anchor_cache.set((tg_id, us, page_size, page),
+                                       tuple(getattr(last, k.key) for k in keys))
+            return rows
         except Exception as e:
-            # 查询失败时，打印异常信息，并返回None
-            print(e)
-            return None, 1
+            LOGGER.error(f"分页查询码失败: {e}")
+            return None
+
+
+def sql_count_p_code(tg_id, us, page: int = 1):
+    """
+    管理员码列表的一页
+    :return: (该页文本, 总页数)，没有数据时为 (None, 1)
+    """
+    tg_id = int(tg_id)
+    stats = sql_code_stats([tg_id])
+    if not stats:
+        return None, 1
+    stats = stats[tg_id]
+    if us == 0:
+        total = sum(n for (unused, _), n in stats.items() if not unused)
+    elif us == -1:
+        total = sum(n for (unused, _), n in stats.items() if unused)
+    else:
+        total = stats.get((True, us), 0)
+    if total == 0:
+        return None, 1
+    pages = math.ceil(total / CODE_PAGE_SIZE)
+    rows = sql_code_page(tg_id, us, page) or []
+    e = (page - 1) * CODE_PAGE_SIZE + 1
+    x = ""
+    for link in rows:
+        if us == 0:
+            x += f"{e}. `{link[1]}`\n🎁 {link[4]}d - [{link[2]}](tg://user?id={link[0]})(__{link[3]}__)\n"
+        else:
+            x += f"{e}. `{link[1]}`\n"
+        e += 1
+    return x, pages
+
+
+def sql_count_c_code(tg_id, page: int = 1):
+    """
+    用户兑换的码列表的一页
+    :return: (该页文本, 总页数)，没有数据时为 (None, 1)
+    """
+    tg_id = int(tg_id)
+    stats = sql_code_stats([tg_id])
+    total = sum(stats[tg_id].values()) if stats else 0
+    if total == 0:
+        return None, 1
+    pages = math.ceil(total / STORE_PAGE_SIZE)
+    rows = sql_code_page(tg_id, None, page, STORE_PAGE_SIZE) or []
+    e = (page - 1) * STORE_PAGE_SIZE + 1
+    x = ""
+    for link in rows:
+        x += (
+            f"{e}. `{link[1]}`\n"
+            f"🎁： {link[4]} 天 | 👤[{link[2]}](tg://user?id={link[2]})\n"
+            f"🌏：{link[3]}\n\n"
+        )
+        e += 1
+    return x, pages
+
 
 def sql_delete_unused_by_days(days: list[int], user_id: int = None) -> int:
     with Session() as session:
@@ -255,6 +303,7 @@ def sql_delete_unused_by_days(days: list[int], user_id: int = None) -> int:
             query = query.filter(Code.us.in_(days))
             result = query.delete(synchronize_session=False)
             session.commit()
+            _page_anchor_cache.clear()
             return result
         except Exception as e:
             session.rollback()
@@ -270,6 +319,7 @@ def sql_delete_all_unused(user_id: int = None) -> int:
                 query = query.filter(Code.tg == user_id)
             result = query.delete(synchronize_session=False)
             session.commit()
+            _page_anchor_cache.clear()
             return result
         except Exception as e:
             session.rollback()
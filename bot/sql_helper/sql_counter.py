@@ -0,0 +1,188 @@
+"""
+计数器：频繁变化的计数（如已注册席位 open_tem）放在数据库中以原子的 value = value + n 更新，不再写回 config.json
+
+注册席位预留：
+    reserve  UPDATE ... SET reserved = reserved + 1 WHERE value + reserved < cap，同时写一条带过期时间的预留记录
+    commit   删除预留记录，reserved - 1、value + 1
+    release  删除预留记录，reserved - 1
+    进程崩溃留下的预留记录过期后由 sql_expire_slots 回收
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import BigInteger, Column, DateTime, Index, String, delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from bot import LOGGER
+from bot.sql_helper import Base, Session
+
+# 已注册席位，对应原 config.open.tem
+OPEN_TEM = 'open_tem'
+# 预留有效期（秒），需长于排队加创建账户的最长耗时
+RESERVATION_TTL = 900
+
+
+class BotCounter(Base):
+    __tablename__ = 'bot_counters'
+    name = Column(String(64), primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+    # 已预留、尚未提交的数量
+    reserved = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+
+
+class SlotReservation(Base):
+    """注册席位预留记录，每个 tg 同时只能持有一个"""
+    __tablename__ = 'slot_reservations'
+    tg = Column(BigInteger, primary_key=True, autoincrement=False)
+    counter = Column(String(64), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('ix_slot_reservations_counter_expires', 'counter', 'expires_at'),
+    )
+
+
+def sql_init_counter(name: str, value: int) -> Optional[int]:
+    """计数不存在时以 value 初始化，返回库中的当前值"""
+    with Session() as session:
+        try:
+            session.execute(insert(BotCounter).prefix_with('IGNORE'),
+                            [{'name': name, 'value': int(value or 0), 'reserved': 0, 'updated_at': datetime.now()}])
+            current = session.execute(select(BotCounter.value).where(BotCounter.name == name)).scalar()
+            session.commit()
+            return current
+        except Exception as e:
+            session.rollback()
+            LOGGER.error(f"初始化计数器失败 {name}: {e}")
+            return None
+
+
+def sql_get_counter(name: str, default: int = 0) -> int:
+    with Session() as session:
+        try:
+            value = session.execute(select(BotCounter.value).where(BotCounter.name == name)).scalar()
+            return default if value is None else value
+        except Exception as e:
+            LOGGER.error(f"读取计数器失败 {name}: {e}")
+            return default
+
+
+def sql_add_counter(name: str, delta: int = 1) -> Optional[int]:
+    """原子加减，返回更新后的值；计数不存在时返回 None"""
+    with Session() as session:
+        try:
+            result = session.execute(update(BotCounter).where(BotCounter.name == name)
+                                     .values(value=BotCounter.value + delta, updated_at=datetime.now()))
+            if result.rowcount == 0:
+                session.rollback()
+                return None
+            # 同一事务内读到的是本次更新后的值
+            value = session.execute(select(BotCounter.value).where(BotCounter.name == name)).scalar()
+            session.commit()
+            return value
+        except Exception as e:
+            session.rollback()
+            LOGGER.error(f"更新计数器失败 {name}: {e}")
+            return None
+
+
+def sql_set_counter(name: str, value: int) -> bool:
+    with Session() as session:
+        try:
+            result = session.execute(update(BotCounter).where(BotCounter.name == name)
+                                     .values(value=int(value), updated_at=datetime.now()))
+            if result.rowcount == 0:
+                session.add(BotCounter(name=name, value=int(value), reserved=0, updated_at=datetime.now()))
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            LOGGER.error(f"设置计数器失败 {name}: {e}")
+            return False
+
+
+def sql_reserve_slot(tg: int, cap: int, name: str = OPEN_TEM, ttl: int = RESERVATION_TTL) -> str:
+    """
+    在 value + reserved < cap 时为 tg 预留一个席位
+    :return: reserved / slot_full / duplicate（该 tg 已持有预留）/ error
+    """
+    with Session() as session:
+        try:
+            result = session.execute(update(BotCounter)
+                                     .where(BotCounter.name == name, BotCounter.value + BotCounter.reserved < cap)
+                                     .values(reserved=BotCounter.reserved + 1))
+            if result.rowcount == 0:
+                session.rollback()
+                return 'slot_full'
+            session.execute(insert(SlotReservation),
+                            [{'tg': tg, 'counter': name, 'expires_at': datetime.now() + timedelta(seconds=ttl)}])
+            session.commit()
+            return 'reserved'
+        except IntegrityError:
+            session.rollback()
+            return 'duplicate'
+        except Exception as e:
+            session.rollback()
+            LOGGER.error(f"预留注册席位失败 {tg}: {e}")
+            return 'error'
+
+
+def _take_reservation(session, tg: int, name: str) -> bool:
+    """删除 tg 的预留记录并归还 reserved，返回是否确实持有预留"""
+    deleted = session.execute(delete(SlotReservation)
+                              .where(SlotReservation.tg == tg, SlotReservation.counter == name)).rowcount
+    if deleted:
+        session.execute(update(BotCounter).where(BotCounter.name == name)
+                        .values(reserved=func.greatest(BotCounter.reserved - 1, 0)))
+    return bool(deleted)
+
+
+def sql_commit_slot(tg: int, name: str = OPEN_TEM) -> Optional[int]:
+    """
+    预留转为已注册，返回提交后的 value
+    预留已过期被回收时同样计入（账户已经创建）
+    """
+    with Session() as session:
+        try:
+            _take_reservation(session, tg, name)
+            session.execute(update(BotCounter).where(BotCounter.name == name)
+                            .values(value=BotCounter.value + 1, updated_at=datetime.now()))
+            value = session.execute(select(BotCounter.value).where(BotCounter.name == name)).scalar()
+            session.commit()
+            return value
+        except Exception as e:
+            session.rollback()
+            LOGGER.error(f"提交注册席位失败 {tg}: {e}")
+            return None
+
+
+def sql_release_slot(tg: int, name: str = OPEN_TEM) -> bool:
+    with Session() as session:
+        try:
+            released = _take_reservation(session, tg, name)
+            session.commit()
+            return released
+        except Exception as e:
+            session.rollback()
+            LOGGER.error(f"释放注册席位失败 {tg}: {e}")
+            return False
+
+
+def sql_expire_slots(name: str = OPEN_TEM) -> int:
+    """回收已过期的预留，返回回收数量"""
+    with Session() as session:
+        try:
+            tgs = session.execute(select(SlotReservation.tg)
+                                  .where(SlotReservation.counter == name, SlotReservation.expires_at < datetime.now())
+                                  .with_for_update()).scalars().all()
+            if tgs:
+                session.execute(delete(SlotReservation).where(SlotReservation.tg.in_(tgs)))
+                session.execute(update(BotCounter).where(BotCounter.name == name)
+                                .values(reserved=func.greatest(BotCounter.reserved - len(tgs), 0)))
+            session.commit()
+            return len(tgs)
+        except Exception as e:
+            session.rollback()
+            LOGGER.error(f"回收过期注册席位失败: {e}")
+            return 0
@@ -2,11 +2,19 @@
 基本的sql操作
 """
 from bot.sql_helper import Base, Session
-from sqlalchemy import Column, BigInteger, String, DateTime, Integer, case
+from sqlalchemy import Column, BigInteger, String, DateTime, Integer, Index, case
 from sqlalchemy import func
 from sqlalchemy import or_
+from cacheout import Cache
 from bot import LOGGER
 
+# ('count', lv) -> 该等级用户数；(lv, page_size, page) -> 该页最后一个 tg，顺序翻页时从这里接着取
+_lv_page_cache = Cache(maxsize=1024, ttl=300)
+
+
+def clear_lv_page_cache():
+    """写入 lv 或增删用户后调用；在本模块之外直接改 Emby.lv 的地方也要调用"""
+    _lv_page_cache.clear()
 
 
 class Emby(Base):
@@ -26,6 +34,13 @@ class Emby(Base):
     iv = Column(Integer, default=0)
     ch = Column(DateTime, nullable=True)
 
+    __table_args__ = (
+        Index('ix_emby_lv_tg', 'lv', 'tg'),
+        # 到期检查 lv == ? AND ex < now
+        Index('ix_emby_lv_ex', 'lv', 'ex'),
+    )
+
+
 def sql_add_emby(tg: int):
     """
     添加一条emby记录，如果tg已存在则忽略
@@ -35,6 +50,7 @@ def sql_add_emby(tg: int):
             emby = Emby(tg=tg)
             session.add(emby)
             session.commit()
+            _lv_page_cache.clear()
         except:
             pass
 
@@ -48,6 +64,7 @@ def sql_delete_emby_by_tg(tg):
             if emby:
                 session.delete(emby)
                 session.commit()
+                _lv_page_cache.clear()
                 LOGGER.info(f"删除数据库记录成功 {tg}")
                 return True
             else:
@@ -103,6 +120,7 @@ def sql_delete_emby(tg=None, embyid=None, name=None):
                 session.delete(emby)
                 try:
                     session.commit()
+                    _lv_page_cache.clear()
                     LOGGER.info(f"成功删除数据库记录: tg={tg}, embyid={embyid}, name={name}")
                     return True
                 except Exception as e:
@@ -126,6 +144,7 @@ def sql_update_embys(some_list: list, method=None):
                 mappings = [{"tg": c[0], "iv": c[1]} for c in some_list]
                 session.bulk_update_mappings(Emby, mappings)
                 session.commit()
+                _lv_page_cache.clear()
                 return True
             except:
                 session.rollback()
@@ -135,6 +154,7 @@ def sql_update_embys(some_list: list, method=None):
                 mappings = [{"tg": c[0], "ex": c[1]} for c in some_list]
                 session.bulk_update_mappings(Emby, mappings)
                 session.commit()
+                _lv_page_cache.clear()
                 return True
             except:
                 session.rollback()
@@ -145,6 +165,7 @@ def sql_update_embys(some_list: list, method=None):
                 mappings = [{"tg": c[0], "name": c[1], "embyid": c[2]} for c in some_list]
                 session.bulk_update_mappings(Emby, mappings)
                 session.commit()
+                _lv_page_cache.clear()
                 return True
             except Exception as e:
                 print(e)
@@ -197,6 +218,63 @@ def get_all_emby(condition):
             return None
 
 
+def sql_count_emby_by_lv(lv: str) -> int:
+    """某等级的用户数，结果缓存，用户增删或等级变化时失效"""
+    count = _lv_page_cache.get(('count', lv))
+    if count is not None:
+        return count
+    with Session() as session:
+        try:
+            count = session.query(func.count(Emby.tg)).filter(Emby.lv == lv).scalar()
+        except Exception as e:
+            LOGGER.error(f"统计用户数时发生异常 {e}")
+            return 0
+    _lv_page_cache.set(('count', lv), count)
+    return count
+
+
+def sql_get_emby_page(lv: str, page: int = 1, page_size: int = 20):
+    """
+    按 tg 键集分页查询某等级的用户，走 (lv, tg) 索引，不加载全部用户
+    顺序翻页从缓存的上一页末尾 tg 接着取；跳页时只在索引上定位起点
+    :return: (该页记录列表, 总数)
+    """
+    total = sql_count_emby_by_lv(lv)
+    with Session() as session:
+        try:
+            query = session.query(Emby).filter(Emby.lv == lv)
+            if page > 1:
+                anchor = _lv_page_cache.get((lv, page_size, page - 1))
+                if anchor is None:
+                    anchor = session.query(Emby.tg).filter(Emby.lv == lv).order_by(Emby.tg) \
+                        .offset((page - 1) * page_size - 1).limit(1).scalar()
+                    if anchor is None:
+                        return [], total
+                query = query.filter(Emby.tg > anchor)
+            embies = query.order_by(Emby.tg).limit(page_size).all()
+            if embies:
+                _lv_page_cache.set((lv, page_size, page), embies[-1].tg)
+            return embies, total
+        except Exception as e:
+            LOGGER.error(f"分页查询用户时发生异常 {e}")
+            return [], total
+
+
+def sql_get_embys_by_names(names: list):
+    """
+    根据emby用户名批量查询记录，一次IN查询，返回 {name: Emby}
+    """
+    if not names:
+        return {}
+    with Session() as session:
+        try:
+            embies = session.query(Emby).filter(Emby.name.in_(set(names))).all()
+            return {e.name: e for e in embies}
+        except Exception as e:
+            LOGGER.error(f"批量查询emby记录时发生异常 {e}")
+            return {}
+
+
 def sql_update_emby(condition, **kwargs):
     """
     更新一条emby记录，根据condition来匹配，然后更新其他的字段
@@ -211,6 +289,8 @@ def sql_update_emby(condition, **kwargs):
             for k, v in kwargs.items():
                 setattr(emby, k, v)
             session.commit()
+            if 'lv' in kwargs:
+                _lv_page_cache.clear()
             return True
         except Exception as e:
             LOGGER.error(e)
@@ -1,5 +1,5 @@
 from bot.sql_helper import Base, Session
-from sqlalchemy import Column, String, DateTime, Integer
+from sqlalchemy import Column, String, DateTime, Integer, Index
 from sqlalchemy import or_
 
 
@@ -17,6 +17,11 @@ class Emby2(Base):
     ex = Column(DateTime, nullable=True)
     expired = Column(Integer, nullable=True)
 
+    __table_args__ = (
+        # 到期检查 lv == ? AND expired == ? AND ex < now
+        Index('ix_emby2_lv_expired_ex', 'lv', 'expired', 'ex'),
+    )
+
 def sql_add_emby2(embyid, name, cr, ex, pwd='5210', pwd2='1234', lv='b', expired=0):
     """
     添加一条emby记录，如果tg已存在则忽略
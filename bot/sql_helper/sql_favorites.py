@@ -1,8 +1,15 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint
+from typing import Dict, Iterable, Optional, Tuple
+from cacheout import Cache
+from sqlalchemy import Column, Integer, String, DateTime, Index, UniqueConstraint, tuple_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 from bot.sql_helper import Base, Session
+from bot.sql_helper.sql_emby import Emby
 from bot import LOGGER
 
+# item_id -> 收藏该项目且绑定了tg的用户 (tg, ...)，收藏变动时按 item_id 失效
+_subscriber_cache = Cache(maxsize=4096, ttl=300)
+
 class EmbyFavorites(Base):
     """Emby收藏记录表"""
     __tablename__ = 'emby_favorites'
@@ -17,7 +24,124 @@ class EmbyFavorites(Base):
     # 创建联合唯一索引
     __table_args__ = (
         UniqueConstraint('embyid', 'item_id', name='uix_emby_item'),
-    ) 
+        Index('ix_emby_favorites_item_id', 'item_id'),
+    )
+
+
+# 单条 INSERT / DELETE 语句包含的最大记录数，超过则在同一事务内分块执行
+FAVORITES_CHUNK_SIZE = 1000
+
+
+def _upsert_rows(session, rows: list):
+    """
+    依靠 uix_emby_item(embyid, item_id) 唯一索引分块 INSERT ... ON DUPLICATE KEY UPDATE
+    同一 (embyid, item_id) 多次出现时以最后一条为准
+    """
+    merged = {(row["embyid"], row["item_id"]): row for row in rows}
+    rows = list(merged.values())
+    now = datetime.now()
+    for start in range(0, len(rows), FAVORITES_CHUNK_SIZE):
+        chunk = [{"embyid": r["embyid"], "embyname": r["embyname"], "item_id": r["item_id"],
+                  "item_name": r["item_name"], "created_at": r.get("created_at") or now}
+                 for r in rows[start:start + FAVORITES_CHUNK_SIZE]]
+        stmt = mysql_insert(EmbyFavorites).values(chunk)
+        stmt = stmt.on_duplicate_key_update(embyname=stmt.inserted.embyname,
+                                            item_name=stmt.inserted.item_name)
+        session.execute(stmt)
+    return len(rows)
+
+
+def _delete_keys(session, keys: list):
+    """按 (embyname, item_id) 分块删除，返回删除行数"""
+    deleted = 0
+    for start in range(0, len(keys), FAVORITES_CHUNK_SIZE):
+        chunk = keys[start:start + FAVORITES_CHUNK_SIZE]
+        deleted += session.query(EmbyFavorites).filter(
+            tuple_(EmbyFavorites.embyname, EmbyFavorites.item_id).in_(chunk)
+        ).delete(synchronize_session=False)
+    return deleted
+
+
+def _invalidate_subscribers(item_ids: Iterable[str]):
+    for item_id in set(item_ids):
+        _subscriber_cache.delete(item_id)
+
+
+def sql_get_item_subscribers(item_ids: Iterable[str]) -> Dict[str, Tuple[int, ...]]:
+    """
+    查询收藏了这些项目的用户tg {item_id: (tg, ...)}，走 item_id 索引一次 IN 查询，结果按项目缓存
+    """
+    item_ids = list(dict.fromkeys(i for i in item_ids if i))
+    result = {}
+    missing = []
+    for item_id in item_ids:
+        cached = _subscriber_cache.get(item_id)
+        if cached is None:
+            missing.append(item_id)
+        else:
+            result[item_id] = cached
+    if not missing:
+        return result
+    try:
+        with Session() as session:
+            rows = session.query(EmbyFavorites.item_id, Emby.tg).join(
+                Emby, EmbyFavorites.embyid == Emby.embyid
+            ).filter(
+                EmbyFavorites.item_id.in_(missing),
+                Emby.tg.isnot(None)
+            ).distinct().all()
+    except Exception as e:
+        LOGGER.error(f"查询项目订阅用户失败: {str(e)}")
+        return result
+    found = {item_id: [] for item_id in missing}
+    for item_id, tg in rows:
+        found[item_id].append(tg)
+    for item_id, tgs in found.items():
+        result[item_id] = tuple(tgs)
+        _subscriber_cache.set(item_id, result[item_id])
+    return result
+
+
+def sql_upsert_favorites(rows: Iterable[dict]) -> bool:
+    """
+    批量写入收藏记录，已存在的 (embyid, item_id) 更新用户名与项目名称
+    :param rows: [{"embyid", "embyname", "item_id", "item_name"}, ...]
+    """
+    rows = list(rows)
+    if not rows:
+        return True
+    try:
+        with Session() as session:
+            count = _upsert_rows(session, rows)
+            session.commit()
+        _invalidate_subscribers(row["item_id"] for row in rows)
+        LOGGER.debug(f"批量写入收藏记录 {count} 条")
+        return True
+    except Exception as e:
+        LOGGER.error(f"批量写入收藏记录失败: {str(e)}")
+        return False
+
+
+def sql_delete_favorites(keys: Iterable[Tuple[str, str]]) -> bool:
+    """
+    批量删除收藏记录
+    :param keys: [(embyname, item_id), ...]
+    """
+    keys = list(set(keys))
+    if not keys:
+        return True
+    try:
+        with Session() as session:
+            count = _delete_keys(session, keys)
+            session.commit()
+        _invalidate_subscribers(item_id for _, item_id in keys)
+        LOGGER.debug(f"批量删除收藏记录 {count} 条")
+        return True
+    except Exception as e:
+        LOGGER.error(f"批量删除收藏记录失败: {str(e)}")
+        return False
+
+
 def sql_add_favorites(embyid: str, embyname: str, item_id: str, item_name: str, is_favorite: bool = True) -> bool:
     """
     添加或删除收藏记录
@@ -33,68 +157,21 @@ def sql_add_favorites(embyid: str, embyname: str, item_id: str, item_name: str,
     try:
         with Session() as session:
             if is_favorite:
-                # 收藏操作：以 embyname 为主要标识符（embyname 是唯一且不变的）
-                
-                # 查找该用户是否已收藏此项目
-                existing_list = session.query(EmbyFavorites).filter(
+                # 同一用户名下旧 EmbyID 的记录先删除，再按唯一索引写入/刷新
+                session.query(EmbyFavorites).filter(
                     EmbyFavorites.embyname == embyname,
-                    EmbyFavorites.item_id == item_id
-                ).all()
-                
-                if existing_list:
-                    if len(existing_list) > 1:
-                        # 如果存在多个重复记录，只保留第一个，删除其余的
-                        LOGGER.warning(f"发现 {len(existing_list)} 个重复收藏记录: {embyname} -> {item_name}，清理重复记录")
-                        keep_record = existing_list[0]  # 保留第一个记录
-                        
-                        # 删除其余重复记录
-                        for duplicate in existing_list[1:]:
-                            session.delete(duplicate)
-                            LOGGER.info(f"删除重复收藏记录: {embyname} -> {item_name} (ID: {duplicate.id})")
-                    else:
-                        keep_record = existing_list[0]
-                    
-                    # 更新保留的记录
-                    old_embyid = keep_record.embyid
-                    keep_record.embyid = embyid
-                    keep_record.item_name = item_name
-                    keep_record.created_at = datetime.now()
-                    
-                    if old_embyid != embyid:
-                        LOGGER.info(f"更新收藏记录: {embyname} -> {item_name} (EmbyID: {old_embyid} -> {embyid})")
-                    else:
-                        LOGGER.info(f"刷新收藏记录: {embyname} -> {item_name}")
-                else:
-                    # 不存在收藏记录，创建新记录
-                    favorite = EmbyFavorites(
-                        embyid=embyid,
-                        embyname=embyname,
-                        item_id=item_id,
-                        item_name=item_name
-                    )
-                    session.add(favorite)
-                    LOGGER.info(f"新增收藏记录: {embyname} -> {item_name} (EmbyID: {embyid})")
-                    
+                    EmbyFavorites.item_id == item_id,
+                    EmbyFavorites.embyid != embyid
+                ).delete(synchronize_session=False)
+                _upsert_rows(session, [{"embyid": embyid, "embyname": embyname, "item_id": item_id,
+                                        "item_name": item_name}])
+                LOGGER.info(f"写入收藏记录: {embyname} -> {item_name} (EmbyID: {embyid})")
             else:
-                # 取消收藏操作：根据 embyname 删除记录
-                records_to_delete = session.query(EmbyFavorites).filter(
-                    EmbyFavorites.embyname == embyname,
-                    EmbyFavorites.item_id == item_id
-                ).all()
-                
-                if records_to_delete:
-                    if len(records_to_delete) > 1:
-                        LOGGER.warning(f"发现 {len(records_to_delete)} 个重复收藏记录，全部删除: {embyname} -> {item_name}")
-                    
-                    for record in records_to_delete:
-                        session.delete(record)
-                    
-                    LOGGER.info(f"删除收藏记录: {embyname} -> {item_name} (删除了 {len(records_to_delete)} 条记录)")
-                else:
-                    LOGGER.info(f"未找到要删除的收藏记录: {embyname} -> {item_name}")
-                    
+                deleted = _delete_keys(session, [(embyname, item_id)])
+                LOGGER.info(f"删除收藏记录: {embyname} -> {item_name} (删除了 {deleted} 条记录)")
             session.commit()
-            return True
+        _invalidate_subscribers([item_id])
+        return True
             
     except Exception as e:
         LOGGER.error(f"操作收藏记录失败: {str(e)}")
@@ -106,10 +183,48 @@ def sql_clear_favorites(emby_name: str) -> bool:
         with Session() as session:
             session.query(EmbyFavorites).filter(EmbyFavorites.embyname == emby_name).delete()
             session.commit()
+        _subscriber_cache.clear()
         return True
     except Exception as e:
         LOGGER.error(f"清除收藏记录失败: {str(e)}")
         return False
+
+
+def sql_get_favorite_map(embyname: str) -> Optional[Dict[str, Tuple[str, str]]]:
+    """获取用户已存储的收藏 {item_id: (embyid, item_name)}，用于增量同步比对"""
+    try:
+        with Session() as session:
+            rows = session.query(EmbyFavorites.item_id, EmbyFavorites.embyid, EmbyFavorites.item_name).filter(
+                EmbyFavorites.embyname == embyname).all()
+            return {item_id: (embyid, item_name) for item_id, embyid, item_name in rows}
+    except Exception as e:
+        LOGGER.error(f"获取收藏记录失败: {str(e)}")
+        return None
+
+
+def sql_apply_favorites_diff(embyid: str, embyname: str, upserts: Dict[str, str], deletes: Iterable[str]) -> bool:
+    """
+    在一个事务内应用收藏差异
+    先按 embyname 删除 deletes 中的项目，再依靠 uix_emby_item 唯一索引批量 INSERT ... ON DUPLICATE KEY UPDATE
+    :param upserts: {item_id: item_name}，新增或名称/EmbyID变化的项目
+    :param deletes: 需要删除的 item_id
+    """
+    deletes = list(deletes)
+    if not upserts and not deletes:
+        return True
+    try:
+        with Session() as session:
+            _delete_keys(session, [(embyname, item_id) for item_id in deletes])
+            _upsert_rows(session, [{"embyid": embyid, "embyname": embyname, "item_id": item_id, "item_name": item_name}
+                                   for item_id, item_name in upserts.items()])
+            session.commit()
+        _invalidate_subscribers([*deletes, *upserts])
+        return True
+    except Exception as e:
+        LOGGER.error(f"同步收藏记录失败 {embyname}: {str(e)}")
+        return False
+
+
 def sql_get_favorites(embyid: str, page: int = 1, page_size: int = 20) -> list:
     """获取Emby用户的收藏记录"""
     try:
@@ -137,6 +252,7 @@ def sql_update_favorites(condition, **kwargs):
                     for k, v in kwargs.items():
                         setattr(favorite, k, v)
                 session.commit()
+                _subscriber_cache.clear()
                 LOGGER.info(f"收藏记录更新完成，成功更新 {len(favorites)} 条记录")
                 return True
             
@@ -178,6 +294,7 @@ def sql_update_favorites(condition, **kwargs):
                     continue
                     
             session.commit()
+            _subscriber_cache.clear()
             LOGGER.info(f"收藏记录更新完成，成功更新 {success_count} 条记录，删除 {len(favorites) - success_count} 条重复记录")
             return True
             
@@ -0,0 +1,275 @@
+"""
+积分(iv)流水：原子增量入账 + 只追加的流水表，便于事后审计
+"""
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import BigInteger, Column, DateTime, Integer, String, case, delete, func, insert, select, update
+
+from bot import LOGGER
+from bot.sql_helper import Base, Session
+from bot.sql_helper.sql_emby import Emby
+
+# 单条 UPDATE 的 CASE 分支上限，过长的语句分块执行（同一事务内）
+CREDIT_CHUNK_SIZE = 1000
+
+
+class IvLedger(Base):
+    """
+    积分流水表，只追加不修改。amount 为本次变动值（可为负）
+    """
+    __tablename__ = 'iv_ledger'
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    tg = Column(BigInteger, nullable=False, index=True)
+    amount = Column(Integer, nullable=False)
+    reason = Column(String(64), nullable=False, index=True)
+    ref = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=datetime.now, index=True)
+
+
+class PendingCredit(Base):
+    """
+    待补发的积分：入账失败时先记下，之后由 sql_settle_pending_credits 补发，进程重启也不会丢失
+    """
+    __tablename__ = 'pending_credits'
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    tg = Column(BigInteger, nullable=False)
+    amount = Column(Integer, nullable=False)
+    reason = Column(String(64), nullable=False)
+    ref = Column(String(255), nullable=True, index=True)
+    created_at = Column(DateTime, default=datetime.now)
+
+
+def _merge_credits(credits: Iterable[Tuple[int, int]]) -> Dict[int, int]:
+    merged: Dict[int, int] = {}
+    for tg, amount in credits:
+        amount = int(amount)
+        if amount == 0:
+            continue
+        merged[tg] = merged.get(tg, 0) + amount
+    return merged
+
+
+def sql_credit_embys(credits: Iterable[Tuple[int, int]], reason: str, ref: str = None) -> bool:
+    """
+    批量原子加减积分：UPDATE emby SET iv = iv + CASE tg ... END，同时写入流水
+    不读取旧值，因此与并发的赌局/打劫/红包互不覆盖
+    :param credits: [(tg, amount), ...]，同一 tg 多次出现会合并
+    :param reason: 流水原因，如 'uplays'
+    :param ref: 关联信息，如榜单日期
+    """
+    merged = _merge_credits(credits)
+    if not merged:
+        return True
+    items = list(merged.items())
+    now = datetime.now()
+    with Session() as session:
+        try:
+            for start in range(0, len(items), CREDIT_CHUNK_SIZE):
+                chunk = dict(items[start:start + CREDIT_CHUNK_SIZE])
+                session.execute(
+                    update(Emby)
+                    .where(Emby.tg.in_(list(chunk)))
+                    .values(iv=func.coalesce(Emby.iv, 0) + case(chunk, value=Emby.tg, else_=0))
+                    .execution_options(synchronize_session=False)
+                )
+            session.execute(
+                insert(IvLedger),
+                [{"tg": tg, "amount": amount, "reason": reason, "ref": ref, "created_at": now}
+                 for tg, amount in items],
+            )
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            LOGGER.error(f"批量入账积分失败 reason={reason}: {e}")
+            return False
+
+
+def sql_add_pending_credits(credits: Iterable[Tuple[int, int]], reason: str, ref: str = None) -> bool:
+    """记录待补发的积分，不改动余额"""
+    merged = _merge_credits(credits)
+    if not merged:
+        return True
+    now = datetime.now()
+    with Session() as session:
+        try:
+            session.execute(insert(PendingCredit),
+                            [{"tg": tg, "amount": amount, "reason": reason, "ref": ref, "created_at": now}
+                             for tg, amount in merged.items()])
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            LOGGER.error(f"记录待补发积分失败 reason={reason} ref={ref}: {e}")
+            return False
+
+
+def sql_settle_pending_credits(ref: str = None) -> Optional[int]:
+    """
+    补发待补发的积分：加锁取出记录，入账、写流水并删除记录在同一事务内完成，重复调用不会重复入账
+    :param ref: 只补发该 ref 的记录，为空时补发全部
+    :return: 补发的记录数，失败返回 None
+    """
+    with Session() as session:
+        try:
+            query = select(PendingCredit).order_by(PendingCredit.id).with_for_update()
+            if ref is not None:
+                query = query.where(PendingCredit.ref == ref)
+            rows = session.execute(query).scalars().all()
+            if not rows:
+                session.rollback()
+                return 0
+            for row in rows:
+                session.execute(
+                    update(Emby)
+                    .where(Emby.tg == row.tg)
+                    .values(iv=func.coalesce(Emby.iv, 0) + row.amount)
+                    .execution_options(synchronize_session=False)
+                )
+            session.execute(insert(IvLedger), [_ledger_row(row.tg, row.amount, row.reason, row.ref) for row in rows])
+            session.execute(delete(PendingCredit).where(PendingCredit.id.in_([row.id for row in rows])))
+            session.commit()
+            return len(rows)
+        except Exception as e:
+            session.rollback()
+            LOGGER.error(f"补发待补发积分失败 ref={ref}: {e}")
+            return None
+
+
+def _ledger_row(tg: int, amount: int, reason: str, ref: str = None) -> dict:
+    return {"tg": tg, "amount": amount, "reason": reason, "ref": ref, "created_at": datetime.now()}
+
+
+def _balance(session, tg: int) -> Optional[int]:
+    iv = session.execute(select(Emby.iv).where(Emby.tg == tg)).scalar()
+    return None if iv is None else int(iv)
+
+
+def sql_debit_emby(tg: int, amount: int, reason: str, ref: str = None) -> Optional[int]:
+    """
+    条件扣减：UPDATE emby SET iv = iv - a WHERE tg = ? AND iv >= a
+    :return: 扣减后的余额；余额不足或用户不存在返回 None
+    """
+    amount = int(amount)
+    if amount < 0:
+        return None
+    with Session() as session:
+        try:
+            result = session.execute(
+                update(Emby)
+                .where(Emby.tg == tg, func.coalesce(Emby.iv, 0) >= amount)
+                .values(iv=func.coalesce(Emby.iv, 0) - amount)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 0:
+                session.rollback()
+                return None
+            if amount:
+                session.execute(insert(IvLedger), [_ledger_row(tg, -amount, reason, ref)])
+            balance = _balance(session, tg)
+            session.commit()
+            return balance
+        except Exception as e:
+            session.rollback()
+            LOGGER.error(f"扣减积分失败 tg={tg} reason={reason}: {e}")
+            return None
+
+
+def sql_credit_emby(tg: int, amount: int, reason: str, ref: str = None) -> Optional[int]:
+    """
+    增加积分：UPDATE emby SET iv = iv + a WHERE tg = ?
+    :return: 增加后的余额；用户不存在返回 None
+    """
+    amount = int(amount)
+    if amount < 0:
+        return None
+    with Session() as session:
+        try:
+            result = session.execute(
+                update(Emby)
+                .where(Emby.tg == tg)
+                .values(iv=func.coalesce(Emby.iv, 0) + amount)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 0:
+                session.rollback()
+                return None
+            if amount:
+                session.execute(insert(IvLedger), [_ledger_row(tg, amount, reason, ref)])
+            balance = _balance(session, tg)
+            session.commit()
+            return balance
+        except Exception as e:
+            session.rollback()
+            LOGGER.error(f"增加积分失败 tg={tg} reason={reason}: {e}")
+            return None
+
+
+def sql_transfer_emby(from_tg: int, to_tg: int, amount: int, reason: str, ref: str = None,
+                      partial: bool = False) -> Tuple[int, Optional[int], Optional[int]]:
+    """
+    在同一事务内从 from_tg 转积分给 to_tg，两行按 tg 顺序加锁避免互转死锁
+    :param partial: True 时余额不足则转出全部余额，False 时余额不足直接失败
+    :return: (实际转出数量, from余额, to余额)，失败时为 (0, None, None)
+    """
+    amount = int(amount)
+    if amount < 0 or from_tg == to_tg:
+        return 0, None, None
+    with Session() as session:
+        try:
+            rows = session.execute(
+                select(Emby.tg, Emby.iv)
+                .where(Emby.tg.in_([from_tg, to_tg]))
+                .order_by(Emby.tg)
+                .with_for_update()
+            ).all()
+            balances = {row.tg: int(row.iv or 0) for row in rows}
+            if from_tg not in balances or to_tg not in balances:
+                session.rollback()
+                return 0, None, None
+            moved = min(amount, balances[from_tg]) if partial else amount
+            if moved > balances[from_tg]:
+                session.rollback()
+                return 0, None, None
+            if moved:
+                session.execute(
+                    update(Emby)
+                    .where(Emby.tg == from_tg)
+                    .values(iv=func.coalesce(Emby.iv, 0) - moved)
+                    .execution_options(synchronize_session=False)
+                )
+                session.execute(
+                    update(Emby)
+                    .where(Emby.tg == to_tg)
+                    .values(iv=func.coalesce(Emby.iv, 0) + moved)
+                    .execution_options(synchronize_session=False)
+                )
+                session.execute(
+                    insert(IvLedger),
+                    [_ledger_row(from_tg, -moved, reason, ref), _ledger_row(to_tg, moved, reason, ref)],
+                )
+            session.commit()
+            return moved, balances[from_tg] - moved, balances[to_tg] + moved
+        except Exception as e:
+            session.rollback()
+            LOGGER.error(f"转移积分失败 {from_tg}->{to_tg} reason={reason}: {e}")
+            return 0, None, None
+
+
+def sql_get_ledger(tg: int, limit: int = 20):
+    """
+    查询某用户最近的积分流水
+    """
+    with Session() as session:
+        try:
+            return (
+                session.query(IvLedger)
+                .filter(IvLedger.tg == tg)
+                .order_by(IvLedger.id.desc())
+                .limit(limit)
+                .all()
+            )
+        except Exception as e:
+            LOGGER.error(f"查询积分流水失败: {e}")
+            return []
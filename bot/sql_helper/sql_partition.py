@@ -1,7 +1,7 @@
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 
-from sqlalchemy import BigInteger, Column, DateTime, Integer, String
+from sqlalchemy import BigInteger, Column, DateTime, Index, Integer, String
 
 from bot.sql_helper import Base, Session
 
@@ -29,6 +29,13 @@ class PartitionGrant(Base):
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+    __table_args__ = (
+        # 过期扫描 status == 'active' AND expires_at <= now
+        Index('ix_partition_grants_status_expires', 'status', 'expires_at'),
+        # 按用户查有效授权 tg IN (...) AND status == 'active' AND expires_at > now
+        Index('ix_partition_grants_tg_status_expires', 'tg', 'status', 'expires_at'),
+    )
+
 def sql_add_partition_codes(items: List[Dict]) -> bool:
     """批量插入分区码记录。items 需包含 code/partition/duration_days/created_by/expires_at(optional)。"""
     with Session() as session:
@@ -1,9 +1,12 @@
 from sqlalchemy import Column, String, DateTime, BigInteger, Text, Float
 import datetime
 from bot.sql_helper import Base, Session
+from bot import LOGGER
 from cacheout import Cache
 
 cache = Cache()
+# 单条 IN 查询包含的最大下载ID数
+RECORD_CHUNK_SIZE = 1000
 
 
 class RequestRecord(Base):
@@ -56,6 +59,22 @@ def sql_get_request_record_by_download_id(download_id: str):
         request_record = session.query(RequestRecord).filter(RequestRecord.download_id == download_id).first()
         return request_record
 
+def sql_get_request_records_by_download_ids(download_ids) -> dict:
+    """一次 IN 查询批量取记录，返回 {download_id: RequestRecord}"""
+    download_ids = list(set(download_ids))
+    records = {}
+    with Session() as session:
+        try:
+            for start in range(0, len(download_ids), RECORD_CHUNK_SIZE):
+                chunk = download_ids[start:start + RECORD_CHUNK_SIZE]
+                records.update((r.download_id, r) for r in
+                               session.query(RequestRecord).filter(RequestRecord.download_id.in_(chunk)))
+            return records
+        except Exception as e:
+            LOGGER.error(f"批量查询点播记录失败: {e}")
+            return {}
+
+
 def sql_get_request_record_by_transfer_state(transfer_state: str = None):
     with Session() as session:
         request_record = session.query(RequestRecord).filter(RequestRecord.transfer_state == transfer_state).all()
@@ -82,3 +101,21 @@ def sql_update_request_status(download_id: str, download_state: str, transfer_st
         except Exception as e:
             session.rollback()
             return False
+
+
+def sql_bulk_update_request_status(mappings: list) -> bool:
+    """
+    批量更新下载/转移状态，一次提交
+    :param mappings: [{'download_id': ..., 'download_state': ..., 'progress': ..., ...}]，只更新给出的字段
+    """
+    if not mappings:
+        return True
+    with Session() as session:
+        try:
+            session.bulk_update_mappings(RequestRecord, mappings)
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            LOGGER.error(f"批量更新点播状态失败: {e}")
+            return False
@@ -0,0 +1,156 @@
+"""
+定时任务运行记录：每次执行写一条，用于计算最后成功时间、启动时补跑错过的任务
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import BigInteger, Column, DateTime, Float, Index, Integer, String, Text, func
+
+from bot import LOGGER
+from bot.sql_helper import Base, Session
+
+
+class SchedJobRun(Base):
+    """
+    定时任务运行记录表，status: running/success/failed/skipped
+    """
+    __tablename__ = 'sched_job_runs'
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    job_id = Column(String(64), nullable=False)
+    status = Column(String(16), nullable=False, default='running')
+    trigger = Column(String(16), nullable=True)  # cron/manual/catch_up
+    started_at = Column(DateTime, nullable=False, default=datetime.now)
+    finished_at = Column(DateTime, nullable=True)
+    duration = Column(Float, nullable=True)
+    error = Column(Text, nullable=True)
+    # 剖析数据：本次运行中的调用次数与进程内存(MB)
+    emby_calls = Column(Integer, nullable=True)
+    db_calls = Column(Integer, nullable=True)
+    tg_calls = Column(Integer, nullable=True)
+    peak_rss_mb = Column(Float, nullable=True)
+    rss_delta_mb = Column(Float, nullable=True)
+
+    __table_args__ = (
+        Index('ix_sched_job_runs_job_status_started', 'job_id', 'status', 'started_at'),
+    )
+
+
+def sql_start_job_run(job_id: str, trigger: str = None, status: str = 'running') -> Optional[int]:
+    """
+    写入一条运行记录，返回记录id
+    """
+    with Session() as session:
+        try:
+            run = SchedJobRun(job_id=job_id, status=status, trigger=trigger, started_at=datetime.now())
+            session.add(run)
+            session.commit()
+            return run.id
+        except Exception as e:
+            session.rollback()
+            LOGGER.error(f"写入任务运行记录失败 {job_id}: {e}")
+            return None
+
+
+def sql_finish_job_run(run_id: Optional[int], status: str, duration: float = None, error: str = None,
+                       stats: dict = None) -> bool:
+    """
+    结束一条运行记录
+    :param stats: 剖析数据，见 JobStats.columns()
+    """
+    if run_id is None:
+        return False
+    with Session() as session:
+        try:
+            values = {
+                SchedJobRun.status: status,
+                SchedJobRun.finished_at: datetime.now(),
+                SchedJobRun.duration: duration,
+                SchedJobRun.error: error[:2000] if error else None,
+            }
+            for key, value in (stats or {}).items():
+                values[getattr(SchedJobRun, key)] = value
+            session.query(SchedJobRun).filter(SchedJobRun.id == run_id).update(values, synchronize_session=False)
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            LOGGER.error(f"更新任务运行记录失败 {run_id}: {e}")
+            return False
+
+
+def sql_get_last_success(job_ids: List[str]) -> Dict[str, datetime]:
+    """
+    查询任务最后一次成功开始的时间 {job_id: started_at}
+    """
+    if not job_ids:
+        return {}
+    with Session() as session:
+        try:
+            rows = (
+                session.query(SchedJobRun.job_id, func.max(SchedJobRun.started_at))
+                .filter(SchedJobRun.job_id.in_(job_ids), SchedJobRun.status == 'success')
+                .group_by(SchedJobRun.job_id)
+                .all()
+            )
+            return {job_id: started_at for job_id, started_at in rows}
+        except Exception as e:
+            LOGGER.error(f"查询任务最后成功时间失败: {e}")
+            return {}
+
+
+def sql_list_job_runs(job_id: str, limit: int = 10) -> List[SchedJobRun]:
+    """
+    查询某任务最近的运行记录
+    """
+    with Session() as session:
+        try:
+            return (
+                session.query(SchedJobRun)
+                .filter(SchedJobRun.job_id == job_id)
+                .order_by(SchedJobRun.started_at.desc())
+                .limit(limit)
+                .all()
+            )
+        except Exception as e:
+            LOGGER.error(f"查询任务运行记录失败 {job_id}: {e}")
+            return []
+
+
+def sql_mark_stale_job_runs(before: datetime) -> int:
+    """
+    进程重启后，之前遗留为 running 的记录不会再结束，标记为 failed
+    :param before: 本进程的启动时间，只处理在此之前开始的记录，不影响本进程刚开始的运行
+    """
+    with Session() as session:
+        try:
+            count = (
+                session.query(SchedJobRun)
+                .filter(SchedJobRun.status == 'running', SchedJobRun.started_at < before)
+                .update({SchedJobRun.status: 'failed', SchedJobRun.error: 'interrupted by restart'},
+                        synchronize_session=False)
+            )
+            session.commit()
+            return count
+        except Exception as e:
+            session.rollback()
+            LOGGER.error(f"标记中断的任务运行记录失败: {e}")
+            return 0
+
+
+def sql_prune_job_runs(days: int = 30) -> int:
+    """
+    清理超过 days 天的运行记录
+    """
+    with Session() as session:
+        try:
+            count = (
+                session.query(SchedJobRun)
+                .filter(SchedJobRun.started_at < datetime.now() - timedelta(days=days))
+                .delete(synchronize_session=False)
+            )
+            session.commit()
+            return count
+        except Exception as e:
+            session.rollback()
+            LOGGER.error(f"清理任务运行记录失败: {e}")
+            return 0
@@ -9,6 +9,7 @@ Date:2024/8/27
 import json
 from fastapi import APIRouter, Request
 from bot.sql_helper.sql_emby import Emby, sql_get_emby, sql_update_emby
+from bot.sql_helper.sql_ledger import sql_debit_emby, sql_credit_emby
 from bot.func_helper.emby import emby
 from bot import LOGGER, group, bot
 
@@ -51,21 +52,21 @@ async def update_credit(request: Request):
         if not user:
             return {"code": 404, "message": "用户不存在"}
 
-        # 计算新的积分值
-        new_iv = user.iv + int(credit)
-        if new_iv < 0:
-            return {"code": 400, "message": "积分不足"}
-        # 更新用户积分
-        user.iv = new_iv
-        res = sql_update_emby(Emby.tg == tg, iv=new_iv)
-        if res:
-
-            return {
-                "code": 200,
-                "data": {"tg": user.tg, "iv": user.iv, "changed": credit},
-            }
+        # 原子加减积分，扣减时余额不足直接失败
+        credit = int(credit)
+        if credit < 0:
+            new_iv = sql_debit_emby(user.tg, -credit, reason='api')
+            if new_iv is None:
+                return {"code": 400, "message": "积分不足"}
         else:
-            return {"code": 500, "message": "更新失败"}
+            new_iv = sql_credit_emby(user.tg, credit, reason='api')
+            if new_iv is None:
+                return {"code": 500, "message": "更新失败"}
+
+        return {
+            "code": 200,
+            "data": {"tg": user.tg, "iv": new_iv, "changed": credit},
+        }
     except json.JSONDecodeError:
         return {"code": 400, "message": "无效的JSON格式"}
     except Exception as e:
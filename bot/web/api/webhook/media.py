@@ -1,136 +1,136 @@
 from fastapi import APIRouter, Request
-from bot.sql_helper.sql_emby import Emby
-from bot.sql_helper.sql_favorites import EmbyFavorites
-from bot.sql_helper import Session
+from bot.sql_helper.sql_favorites import sql_get_item_subscribers
 from bot.func_helper.emby import emby
-from bot import LOGGER, bot
+from bot.func_helper.media_catalog import media_catalog
+from bot.func_helper.media_counts import media_counts
+from bot.func_helper.notify_queue import notify_queue
+from bot import LOGGER, media_notify_window
+from collections import OrderedDict
+import asyncio
 import json
 
 router = APIRouter()
 
-async def send_update_notification_to_user(tg_id: int, message: str):
-    """发送通知到指定用户"""
-    try:
-        await bot.send_message(
-            chat_id=tg_id,
-            text=message
-        )
-        return True
-    except Exception as e:
-        LOGGER.error(f"发送通知失败: {str(e)}")
-        return False
+def _format_episodes(numbers) -> str:
+    """把集号合并为区间，如 [1, 2, 3, 5] -> 第1-3、5集"""
+    nums = sorted({int(n) for n in numbers if str(n).isdigit()})
+    others = [str(n) for n in numbers if not str(n).isdigit() and n]
+    parts = []
+    for n in nums:
+        if parts and parts[-1][1] == n - 1:
+            parts[-1][1] = n
+        else:
+            parts.append([n, n])
+    labels = [f"{a}-{b}" if a != b else f"{a}" for a, b in parts] + others
+    return f"第{'、'.join(labels)}集" if labels else "新剧集"
+
 
-async def check_and_notify_series_update(item_data: dict):
-    """检查并通知剧集更新"""
+async def check_and_notify_series_update(groups: dict):
+    """
+    检查并通知剧集更新，一次查询所有剧集的收藏用户，每个 (剧集, 季) 给每个用户登记一条
+    :param groups: {(series_id, season_name): {"series_name": str, "episodes": [集号, ...]}}
+    """
     try:
-        # 获取剧集信息
-        series_id = item_data.get("SeriesId")  # 剧集ID
-        series_name = item_data.get("SeriesName")  # 剧集名称
-        season_name = item_data.get("SeasonName", "")  # 季名
-        episode_number = item_data.get("IndexNumber", "")  # 集号
-        
-        if not series_id:
-            return
-            
-        session = Session()
-        try:
-            # 查找收藏了这个剧集的用户
-            favorites = session.query(EmbyFavorites, Emby).join(
-                Emby, EmbyFavorites.embyid == Emby.embyid
-            ).filter(
-                EmbyFavorites.item_id == series_id,
-                Emby.tg.isnot(None)
-            ).all()
-            
-            if favorites:
-                message = (
-                    f"📺 您喜欢的剧集更新啦\n"
-                    f"剧集：《{series_name}》\n"
-                    f"季度：{season_name}\n"
-                    f"更新：第{episode_number}集 "
-                )
-                
-                # 给每个收藏了该剧集的用户发送通知
-                for favorite, user in favorites:
-                    await send_update_notification_to_user(user.tg, message)
-                    LOGGER.info(f"已发送剧集更新通知给用户 {user.tg}: {series_name} - {episode_number}")
-        finally:
-            session.close()
+        subscribers = sql_get_item_subscribers(series_id for series_id, _ in groups)
+        for (series_id, season_name), group in groups.items():
+            tgs = subscribers.get(series_id, ())
+            if not tgs:
+                continue
+            header = f"📺 您喜欢的剧集更新啦\n剧集：《{group['series_name']}》"
+            episodes = _format_episodes(group["episodes"])
+            for tg in tgs:
+                notify_queue.add(tg, header, season_name or "更新", episodes)
+            LOGGER.info(f"已登记剧集更新通知 {len(tgs)} 人: {group['series_name']} {season_name} {episodes}")
             
     except Exception as e:
         LOGGER.error(f"处理剧集更新通知失败: {str(e)}")
 
-async def check_and_notify_person_update(item_data: dict):
-    """检查并通知演员相关更新"""
+async def check_and_notify_person_update(items: list):
+    """检查并通知演员相关更新，所有作品的演员合并为一次订阅查询"""
     try:
-        # 获取电影/剧集ID
-        item_id = item_data.get("Id", "")
-        if not item_id:
+        works = []  # [(item_data, {person_id: person_name})]
+        for item_data in items:
+            # 获取电影/剧集ID
+            item_id = item_data.get("Id", "")
+            if not item_id:
+                continue
+            # 获取演员信息
+            success, people_list = await emby.item_id_people(item_id=item_id)
+            if not success:
+                continue
+            works.append((item_data, {p.get("Id"): p.get("Name") for p in people_list if p.get("Id")}))
+        if not works:
             return
-            
-        # 获取演员信息
-        success, people_list = await emby.item_id_people(item_id=item_id)
-        if not success:
-            return
-        session = Session()
-        try:
-            for person in people_list:
-                person_id = person.get("Id")
-                person_name = person.get("Name")
-                
-                if not person_id:
-                    continue
-                    
-                # 查找收藏了这个演员的用户
-                favorites = session.query(EmbyFavorites, Emby).join(
-                    Emby, EmbyFavorites.embyid == Emby.embyid
-                ).filter(
-                    EmbyFavorites.item_id == person_id,
-                    Emby.tg.isnot(None)
-                ).all()
-                
-                if favorites:
-                    # 获取作品信息
-                    item_name = item_data.get("Name", "")
-                    item_type = item_data.get("Type", "")
-                    
-                    message = (
-                        f"🎭 您喜欢的演员有新作品啦\n"
-                        f"演员：{person_name}\n"
-                        f"作品：《{item_name}》\n"
-                        f"类型：{item_type}\n"
-                    )
-                    
-                    # 给每个收藏了该演员的用户发送通知
-                    for favorite, user in favorites:
-                        await send_update_notification_to_user(user.tg, message)
-                        LOGGER.info(f"已发送演员新作品通知给用户 {user.tg}: {person_name} - {item_name}")
-        finally:
-            session.close()
+        subscribers = sql_get_item_subscribers(pid for _, people in works for pid in people)
+        for item_data, people in works:
+            item_name = item_data.get("Name", "")
+            item_type = item_data.get("Type", "")
+            for person_id, person_name in people.items():
+                tgs = subscribers.get(person_id, ())
+                header = f"🎭 您喜欢的演员有新作品啦\n演员：{person_name}"
+                for tg in tgs:
+                    notify_queue.add(tg, header, "", f"《{item_name}》({item_type})")
+                if tgs:
+                    LOGGER.info(f"已登记演员新作品通知 {len(tgs)} 人: {person_name} - {item_name}")
             
     except Exception as e:
         LOGGER.error(f"处理演员更新通知失败: {str(e)}")
 
-async def send_new_media_notification(item_data: dict):
-    """发送新媒体通知"""
-    try:
+
+class MediaEventBuffer:
+    """
+    新入库事件合并窗口：整季或批量入库时 Emby 会逐集/逐文件触发 library.new
+    窗口内的剧集按 (剧集, 季) 分组，电影/剧按项目去重，窗口结束后统一查询订阅用户并登记通知
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self._episodes: OrderedDict = OrderedDict()
+        self._items: OrderedDict = OrderedDict()
+        self._flush_handle = None
+        # 持有 flush 任务的引用，避免执行中被回收
+        self._tasks: set = set()
+
+    def _start_flush(self, loop):
+        task = loop.create_task(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def add(self, item_data: dict) -> bool:
         item_type = item_data.get("Type", "")
-        item_name = item_data.get("Name", "")
-        
-        # 根据媒体类型构建不同的消息
-        if item_type == "Movie":
-            # 检查演员相关通知
-            await check_and_notify_person_update(item_data)
-        elif item_type == "Series":
-            # 检查演员相关通知
-            await check_and_notify_person_update(item_data)
-        elif item_type == "Episode":
-            # 检查是否需要发送剧集更新通知
-            await check_and_notify_series_update(item_data)
-            return
-        LOGGER.info(f"已发送新媒体通知: {item_name}")
-    except Exception as e:
-        LOGGER.error(f"发送新媒体通知失败: {str(e)}")
+        if item_type == "Episode":
+            series_id = item_data.get("SeriesId")
+            if not series_id:
+                return False
+            key = (series_id, item_data.get("SeasonName", ""))
+            group = self._episodes.setdefault(key, {"series_name": item_data.get("SeriesName"), "episodes": []})
+            group["episodes"].append(item_data.get("IndexNumber", ""))
+        elif item_type in ["Movie", "Series"]:
+            if not item_data.get("Id"):
+                return False
+            self._items[item_data["Id"]] = item_data
+        else:
+            return False
+        loop = asyncio.get_running_loop()
+        if self.window <= 0:
+            self._start_flush(loop)
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._start_flush, loop)
+        return True
+
+    async def flush(self):
+        self._flush_handle = None
+        episodes, self._episodes = self._episodes, OrderedDict()
+        items, self._items = self._items, OrderedDict()
+        if episodes or items:
+            LOGGER.info(f"处理合并后的入库事件: 剧集分组 {len(episodes)}，电影/剧 {len(items)}")
+        if episodes:
+            await check_and_notify_series_update(episodes)
+        if items:
+            await check_and_notify_person_update(list(items.values()))
+
+
+media_event_buffer = MediaEventBuffer(media_notify_window)
 
 @router.post("/webhook/medias")
 async def handle_media_webhook(request: Request):
@@ -161,13 +161,14 @@ async def handle_media_webhook(request: Request):
         if event in ["item.added", "library.new"]:
             # 检查媒体类型
             item_type = item_data.get("Type", "")
+            media_catalog.upsert(item_data, advance=False)
+            media_counts.bump(item_type, item_id=item_data.get("Id"))
             
-            if item_type == "Episode":
-                # 处理剧集更新
-                await check_and_notify_series_update(item_data)
+            # 剧集/电影/剧进入合并窗口，窗口结束后统一通知
+            if media_event_buffer.add(item_data):
                 return {
                     "status": "success",
-                    "message": "Episode update notification sent",
+                    "message": "Media update queued for notification",
                     "data": {
                         "type": item_type,
                         "name": item_data.get("Name"),
@@ -175,24 +176,21 @@ async def handle_media_webhook(request: Request):
                         "event": event
                     }
                 }
-            elif item_type in ["Movie", "Series"]:
-                # 处理新电影或新剧集
-                await send_new_media_notification(item_data)
-                return {
-                    "status": "success",
-                    "message": "New media notification sent",
-                    "data": {
-                        "type": item_type,
-                        "name": item_data.get("Name"),
-                        "event": event
-                    }
-                }
                 
             return {
                 "status": "ignored",
                 "message": "Not a new media event",
                 "event": event
             }
+
+        if event == "library.deleted":
+            media_catalog.remove(item_data.get("Id"))
+            media_counts.bump(item_data.get("Type", ""), -1, item_data.get("Id"))
+            return {
+                "status": "success",
+                "message": "Media removed from catalog",
+                "event": event
+            }
                 
         return {
             "status": "ignored",
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+到期/活跃扫描基准：写入合成用户数据，对 sql_helper 的主要扫描查询输出 EXPLAIN，并对比走索引与 IGNORE INDEX 的耗时
+
+    python scripts/bench_expiry_scans.py --users 100000
+    python scripts/bench_expiry_scans.py --users 100000 --explain-only
+
+合成数据的 tg 从 TG_BASE 开始、字符串主键以 NAME_PREFIX 开头，结束后全部删除
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+os.environ.setdefault("SAKURA_RUNNING_MIGRATIONS", "1")
+
+from sqlalchemy import and_, func, insert, select
+
+from bot.sql_helper import engine
+from bot.sql_helper.sql_code import Code
+from bot.sql_helper.sql_emby import Emby
+from bot.sql_helper.sql_emby2 import Emby2
+from bot.sql_helper.sql_favorites import EmbyFavorites
+from bot.sql_helper.sql_partition import PartitionGrant
+
+TG_BASE = 8_000_000_000_000
+NAME_PREFIX = "bench_plan_"
+INSERT_CHUNK = 5000
+ADMINS = 20
+
+
+@dataclass
+class SeedInfo:
+    users: int
+    now: datetime
+    anchor_tg: int
+    user_ids: list
+    admin_tg: int
+    item_ids: list
+
+
+@dataclass
+class PlanQuery:
+    label: str
+    table: type
+    # 可接受的索引；PRIMARY 表示按主键范围扫描同样可接受
+    indexes: Tuple[str, ...]
+    build: Callable[[SeedInfo], object]
+
+
+PLAN_QUERIES = [
+    PlanQuery("check_expired lv=b", Emby, ("ix_emby_lv_ex",),
+              lambda s: select(Emby).where(and_(Emby.ex < s.now, Emby.lv == 'b'))),
+    PlanQuery("check_expired lv=c", Emby, ("ix_emby_lv_ex",),
+              lambda s: select(Emby).where(and_(Emby.ex < s.now, Emby.lv == 'c'))),
+    PlanQuery("emby2 expired", Emby2, ("ix_emby2_lv_expired_ex",),
+              lambda s: select(Emby2).where(and_(Emby2.lv == 'b', Emby2.expired == 0, Emby2.ex < s.now))),
+    PlanQuery("grants expired", PartitionGrant, ("ix_partition_grants_status_expires",),
+              lambda s: select(PartitionGrant).where(PartitionGrant.status == "active",
+                                                     PartitionGrant.expires_at <= s.now)),
+    PlanQuery("grants for users", PartitionGrant, ("ix_partition_grants_tg_status_expires",),
+              lambda s: select(PartitionGrant).where(PartitionGrant.tg.in_(s.user_ids),
+                                                     PartitionGrant.status == "active",
+                                                     PartitionGrant.expires_at > s.now)),
+    PlanQuery("user page lv=b", Emby, ("ix_emby_lv_tg", "PRIMARY"),
+              lambda s: select(Emby).where(Emby.lv == 'b', Emby.tg > s.anchor_tg).order_by(Emby.tg).limit(20)),
+    PlanQuery("code stats", Code, ("ix_rcode_tg_us",),
+              lambda s: select(Code.tg, (Code.used == None).label("unused"), Code.us, func.count())
+              .where(Code.tg.in_([s.admin_tg])).group_by(Code.tg, "unused", Code.us)),
+    PlanQuery("item subscribers", EmbyFavorites, ("ix_emby_favorites_item_id",),
+              lambda s: select(EmbyFavorites.item_id, EmbyFavorites.embyid)
+              .where(EmbyFavorites.item_id.in_(s.item_ids))),
+]
+
+
+def _insert_chunked(conn, model, rows: list):
+    for start in range(0, len(rows), INSERT_CHUNK):
+        conn.execute(insert(model), rows[start:start + INSERT_CHUNK])
+
+
+def seed(users: int, rng: random.Random = None) -> SeedInfo:
+    """
+    写入 users 个合成用户：约 80% 普通、10% 禁用、5% 白名单；约 5% 已到期
+    另按比例写入 emby2、分区授权、注册码和收藏，数据分布与线上接近
+    """
+    rng = rng or random.Random(0)
+    now = datetime.now()
+
+    def ex():
+        days = rng.randint(-30, -1) if rng.random() < 0.05 else rng.randint(1, 365)
+        return now + timedelta(days=days)
+
+    def lv():
+        r = rng.random()
+        return 'b' if r < 0.8 else 'c' if r < 0.9 else 'a' if r < 0.95 else 'd'
+
+    emby_rows = [{"tg": TG_BASE + i, "embyid": f"{NAME_PREFIX}id{i}", "name": f"{NAME_PREFIX}{i}",
+                  "lv": lv(), "cr": now - timedelta(days=30), "ex": ex(), "us": 0, "iv": 0}
+                 for i in range(users)]
+    emby2_rows = [{"embyid": f"{NAME_PREFIX}e2_{i}", "name": f"{NAME_PREFIX}e2_{i}", "lv": lv(),
+                   "cr": now - timedelta(days=30), "ex": ex(), "expired": 0 if rng.random() < 0.9 else 1}
+                  for i in range(users // 10)]
+    grant_rows = [{"tg": TG_BASE + rng.randrange(users), "partition": f"p{i % 5}", "expires_at": ex(),
+                   "status": "active" if rng.random() < 0.9 else "expired"}
+                  for i in range(users // 2)]
+    code_rows = [{"code": f"{NAME_PREFIX}c{i}", "tg": TG_BASE + i % ADMINS, "us": rng.choice((30, 90, 180, 365)),
+                  "used": TG_BASE + i if rng.random() < 0.5 else None}
+                 for i in range(users // 5)]
+    for row in code_rows:
+        row["usedtime"] = now if row["used"] else None
+    favorite_rows = [{"embyid": f"{NAME_PREFIX}id{i % users}", "embyname": f"{NAME_PREFIX}{i % users}",
+                      "item_id": f"{NAME_PREFIX}item{rng.randrange(users // 10 or 1)}", "item_name": "Item"}
+                     for i in range(users // 5)]
+    # 去掉 (embyid, item_id) 重复的收藏
+    favorite_rows = list({(r["embyid"], r["item_id"]): r for r in favorite_rows}.values())
+
+    with engine.begin() as conn:
+        for model, rows in ((Emby, emby_rows), (Emby2, emby2_rows), (PartitionGrant, grant_rows),
+                            (Code, code_rows), (EmbyFavorites, favorite_rows)):
+            _insert_chunked(conn, model, rows)
+    with engine.connect() as conn:
+        for model in (Emby, Emby2, PartitionGrant, Code, EmbyFavorites):
+            conn.exec_driver_sql(f"ANALYZE TABLE `{model.__tablename__}`")
+
+    return SeedInfo(users=users, now=now, anchor_tg=TG_BASE + users // 2,
+                    user_ids=[TG_BASE + rng.randrange(users) for _ in range(50)], admin_tg=TG_BASE,
+                    item_ids=[f"{NAME_PREFIX}item{i}" for i in range(20)])
+
+
+def cleanup():
+    with engine.begin() as conn:
+        conn.execute(Emby.__table__.delete().where(Emby.tg >= TG_BASE))
+        conn.execute(Emby2.__table__.delete().where(Emby2.embyid.like(f"{NAME_PREFIX}%")))
+        conn.execute(PartitionGrant.__table__.delete().where(PartitionGrant.tg >= TG_BASE))
+        conn.execute(Code.__table__.delete().where(Code.code.like(f"{NAME_PREFIX}%")))
+        conn.execute(EmbyFavorites.__table__.delete().where(EmbyFavorites.embyname.like(f"{NAME_PREFIX}%")))
+
+
+@contextmanager
+def seeded(users: int):
+    try:
+        yield seed(users)
+    finally:
+        cleanup()
+
+
+def _driver_sql(stmt):
+    compiled = stmt.compile(dialect=engine.dialect, compile_kwargs={"render_postcompile": True})
+    return str(compiled), compiled.params
+
+
+def explain(conn, query: PlanQuery, info: SeedInfo) -> dict:
+    """返回查询在目标表上的 EXPLAIN 行（type/key/rows 等）"""
+    sql, params = _driver_sql(query.build(info))
+    rows = conn.exec_driver_sql(f"EXPLAIN {sql}", params).mappings().all()
+    table = query.table.__tablename__
+    return dict(next((r for r in rows if r["table"] == table), rows[0]))
+
+
+def _ignore_indexes(query: PlanQuery, stmt):
+    names = [i for i in query.indexes if i != "PRIMARY"]
+    return stmt.with_hint(query.table, f"IGNORE INDEX ({', '.join(names)})", "mysql")
+
+
+def _time(conn, stmt, repeat: int) -> Tuple[float, int]:
+    sql, params = _driver_sql(stmt)
+    start = time.perf_counter()
+    rows = 0
+    for _ in range(repeat):
+        rows = len(conn.exec_driver_sql(sql, params).all())
+    return (time.perf_counter() - start) / repeat * 1000, rows
+
+
+def run(users: int, repeat: int, explain_only: bool) -> int:
+    print(f"[scenario] expiry-scans users={users} repeat={repeat}")
+    failed = 0
+    with seeded(users) as info, engine.connect() as conn:
+        for query in PLAN_QUERIES:
+            plan = explain(conn, query, info)
+            ok = plan["type"] != "ALL" and plan["key"] in query.indexes
+            failed += not ok
+            line = f"{query.label:<20} type={plan['type']:<6} key={str(plan['key']):<38} rows={plan['rows']:<8}"
+            if not explain_only:
+                indexed, rows = _time(conn, query.build(info), repeat)
+                scanned, _ = _time(conn, _ignore_indexes(query, query.build(info)), repeat)
+                line += f" result={rows:<6} indexed={indexed:8.2f}ms ignore_index={scanned:8.2f}ms"
+            print(("" if ok else "[unexpected plan] ") + line)
+    return 1 if failed else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark expiry/activity scans on synthetic users.")
+    parser.add_argument("--users", type=int, default=100000, help="Number of synthetic emby users.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per query when timing.")
+    parser.add_argument("--explain-only", action="store_true", help="Only print EXPLAIN, skip timing.")
+    args = parser.parse_args()
+    return run(args.users, args.repeat, args.explain_only)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+收藏表批量写入基准：对比逐条 SELECT+INSERT+COMMIT 与分块 INSERT ... ON DUPLICATE KEY UPDATE
+
+    python scripts/bench_favorites_upsert.py --rows 100000
+    python scripts/bench_favorites_upsert.py --rows 100000 --legacy-rows 2000   # 旧写法只跑部分再外推
+"""
+import argparse
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+os.environ.setdefault("SAKURA_RUNNING_MIGRATIONS", "1")
+
+from bot.sql_helper import Session
+from bot.sql_helper.sql_favorites import EmbyFavorites, sql_delete_favorites, sql_upsert_favorites
+
+NAME_PREFIX = f"bench_fav_{int(time.time())}_"
+
+
+def build_rows(rows: int, users: int, suffix: str = "") -> list:
+    return [
+        {
+            "embyid": f"{NAME_PREFIX}id{i % users}",
+            "embyname": f"{NAME_PREFIX}{i % users}",
+            "item_id": f"item{i}",
+            "item_name": f"Item {i}{suffix}",
+        }
+        for i in range(rows)
+    ]
+
+
+@contextmanager
+def cleanup():
+    try:
+        yield
+    finally:
+        with Session() as session:
+            session.query(EmbyFavorites).filter(
+                EmbyFavorites.embyname.like(f"{NAME_PREFIX}%")
+            ).delete(synchronize_session=False)
+            session.commit()
+
+
+def count_rows() -> int:
+    with Session() as session:
+        return session.query(EmbyFavorites).filter(EmbyFavorites.embyname.like(f"{NAME_PREFIX}%")).count()
+
+
+def legacy_insert(rows: list):
+    """历史写法：每条记录先 SELECT，再 add，再 commit"""
+    for row in rows:
+        with Session() as session:
+            existing = session.query(EmbyFavorites).filter(
+                EmbyFavorites.embyname == row["embyname"],
+                EmbyFavorites.item_id == row["item_id"],
+            ).all()
+            if existing:
+                existing[0].item_name = row["item_name"]
+            else:
+                session.add(EmbyFavorites(**row))
+            session.commit()
+
+
+def timed(label: str, rows: int, func, *args) -> float:
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<18} rows={rows:<8} elapsed={elapsed:8.2f}s rows/s={rows / elapsed:10.0f}")
+    if result is False:
+        raise SystemExit(f"{label} failed")
+    return elapsed
+
+
+def run(rows: int, users: int, legacy_rows: int) -> int:
+    print(f"[scenario] favorites-upsert rows={rows} users={users} legacy_rows={legacy_rows}")
+    data = build_rows(rows, users)
+    with cleanup():
+        if legacy_rows:
+            legacy = data[:legacy_rows]
+            elapsed = timed("legacy insert", len(legacy), legacy_insert, legacy)
+            print(f"legacy extrapolated to {rows} rows: {elapsed / len(legacy) * rows:.0f}s")
+            sql_delete_favorites([(r["embyname"], r["item_id"]) for r in legacy])
+
+        timed("bulk insert", rows, sql_upsert_favorites, data)
+        timed("bulk upsert(same)", rows, sql_upsert_favorites, data)
+        timed("bulk upsert(rename)", rows, sql_upsert_favorites, build_rows(rows, users, suffix=" v2"))
+        stored = count_rows()
+        print(f"stored_rows={stored}")
+        timed("bulk delete", rows, sql_delete_favorites, [(r["embyname"], r["item_id"]) for r in data])
+        remaining = count_rows()
+        print(f"remaining_rows={remaining}")
+        return 0 if stored == rows and remaining == 0 else 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark bulk favorites upsert/delete against per-row writes.")
+    parser.add_argument("--rows", type=int, default=100000, help="Number of favorites to write.")
+    parser.add_argument("--users", type=int, default=500, help="Number of distinct users the rows are spread across.")
+    parser.add_argument("--legacy-rows", type=int, default=2000,
+                        help="Rows to run through the per-row path (0 to skip); the result is extrapolated.")
+    args = parser.parse_args()
+    return run(args.rows, args.users, args.legacy_rows)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
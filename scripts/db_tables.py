@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+内置表导出/恢复命令，与 db_backup_method=native 的备份文件格式相同
+
+    python scripts/db_tables.py export db_backup/manual.jsonl.gz
+    python scripts/db_tables.py restore db_backup/embyboss-2026-10-19-02-30-00.jsonl.gz --yes
+    python scripts/db_tables.py restore backup.jsonl.gz --tables emby Rcode --yes   # 只恢复部分表
+"""
+import argparse
+import gzip
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+os.environ.setdefault("SAKURA_RUNNING_MIGRATIONS", "1")
+
+from bot.func_helper.table_export import bot_tables, export_tables, restore_from_file
+from bot.sql_helper import engine
+
+
+def export(path: str, tables: list) -> int:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "wb") as f:
+        counts = export_tables(engine, f, bot_tables(tables) if tables else None)
+    for name, rows in counts.items():
+        print(f"{name:<24} {rows}")
+    print(f"exported {sum(counts.values())} rows to {path}")
+    return 0
+
+
+def restore(path: str, tables: list, keep_existing: bool, yes: bool) -> int:
+    if not yes:
+        answer = input(f"restore {path} into {engine.url.database}, existing rows will be "
+                       f"{'kept' if keep_existing else 'DELETED'}. continue? [y/N] ")
+        if answer.strip().lower() != "y":
+            return 1
+    counts = restore_from_file(path, engine, tables=tables or None, replace=not keep_existing)
+    for name, rows in counts.items():
+        print(f"{name:<24} {rows}")
+    print(f"restored {sum(counts.values())} rows")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Export or restore the bot's tables without mysqldump.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_export = sub.add_parser("export", help="Export tables to a .jsonl or .jsonl.gz file.")
+    p_export.add_argument("path")
+    p_export.add_argument("--tables", nargs="*", default=[], help="Only export these tables.")
+    p_restore = sub.add_parser("restore", help="Restore tables from an export or native backup (parts are joined).")
+    p_restore.add_argument("path", help="Backup file; for split backups pass the name without .partNNN.")
+    p_restore.add_argument("--tables", nargs="*", default=[], help="Only restore these tables.")
+    p_restore.add_argument("--keep-existing", action="store_true", help="Do not clear tables before inserting.")
+    p_restore.add_argument("--yes", action="store_true", help="Skip the confirmation prompt.")
+    args = parser.parse_args()
+    if args.command == "export":
+        return export(args.path, args.tables)
+    return restore(args.path, args.tables, args.keep_existing, args.yes)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+积分并发压测：多线程同时执行 扣减/增加/转账，校验总额无漂移、余额不为负、流水与余额一致
+
+    python scripts/stress_currency_ops.py --mode old     # 复现旧的 读-改-写 漂移
+    python scripts/stress_currency_ops.py --mode fixed   # 验证原子操作
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import count
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+os.environ.setdefault("SAKURA_RUNNING_MIGRATIONS", "1")
+
+from sqlalchemy import func
+
+from bot.sql_helper import Session
+from bot.sql_helper.sql_emby import Emby, sql_get_emby, sql_update_emby
+from bot.sql_helper.sql_ledger import IvLedger, sql_credit_emby, sql_debit_emby, sql_transfer_emby
+
+REASON = "stress_test"
+
+_id_counter = count(int(time.time()) * 1000)
+
+
+@contextmanager
+def seeded_users(user_count: int, balance: int):
+    user_ids = [next(_id_counter) for _ in range(user_count)]
+    with Session() as session:
+        session.query(Emby).filter(Emby.tg.in_(user_ids)).delete(synchronize_session=False)
+        session.add_all([Emby(tg=tg, lv="b", us=0, iv=balance) for tg in user_ids])
+        session.commit()
+    try:
+        yield user_ids
+    finally:
+        with Session() as session:
+            session.query(IvLedger).filter(IvLedger.tg.in_(user_ids)).delete(synchronize_session=False)
+            session.query(Emby).filter(Emby.tg.in_(user_ids)).delete(synchronize_session=False)
+            session.commit()
+
+
+def fetch_balances(user_ids: list) -> dict:
+    with Session() as session:
+        rows = session.query(Emby.tg, Emby.iv).filter(Emby.tg.in_(user_ids)).all()
+        return {row.tg: int(row.iv or 0) for row in rows}
+
+
+def fetch_ledger_sums(user_ids: list) -> dict:
+    with Session() as session:
+        rows = (
+            session.query(IvLedger.tg, func.sum(IvLedger.amount))
+            .filter(IvLedger.tg.in_(user_ids), IvLedger.reason == REASON)
+            .group_by(IvLedger.tg)
+            .all()
+        )
+        return {tg: int(total or 0) for tg, total in rows}
+
+
+class OldOps:
+    """历史写法：先读余额，Python 里计算，再整行写回"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def debit(self, tg, amount):
+        e = sql_get_emby(tg)
+        if e.iv < amount:
+            return None
+        time.sleep(self.delay)
+        sql_update_emby(Emby.tg == tg, iv=e.iv - amount)
+        return e.iv - amount
+
+    def credit(self, tg, amount):
+        e = sql_get_emby(tg)
+        time.sleep(self.delay)
+        sql_update_emby(Emby.tg == tg, iv=e.iv + amount)
+        return e.iv + amount
+
+    def transfer(self, from_tg, to_tg, amount):
+        if self.debit(from_tg, amount) is None:
+            return 0
+        self.credit(to_tg, amount)
+        return amount
+
+
+class FixedOps:
+    def debit(self, tg, amount):
+        return sql_debit_emby(tg, amount, reason=REASON)
+
+    def credit(self, tg, amount):
+        return sql_credit_emby(tg, amount, reason=REASON)
+
+    def transfer(self, from_tg, to_tg, amount):
+        moved, _, _ = sql_transfer_emby(from_tg, to_tg, amount, reason=REASON, partial=True)
+        return moved
+
+
+def run(mode: str, users: int, balance: int, workers: int, ops: int, delay: float) -> int:
+    impl = OldOps(delay) if mode == "old" else FixedOps()
+    print(f"[scenario] currency-ops mode={mode} users={users} workers={workers} ops={ops}")
+
+    with seeded_users(users, balance) as user_ids:
+        net = {"credit": 0, "debit": 0}
+        lock = threading.Lock()
+
+        def worker(seed: int):
+            rnd = random.Random(seed)
+            for _ in range(ops):
+                action = rnd.choice(("debit", "credit", "transfer"))
+                amount = rnd.randint(1, max(1, balance // 4))
+                if action == "transfer":
+                    from_tg, to_tg = rnd.sample(user_ids, 2)
+                    impl.transfer(from_tg, to_tg, amount)
+                    continue
+                tg = rnd.choice(user_ids)
+                result = impl.debit(tg, amount) if action == "debit" else impl.credit(tg, amount)
+                if result is not None:
+                    with lock:
+                        net[action] += amount
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(worker, range(workers)))
+        elapsed = time.perf_counter() - start
+
+        balances = fetch_balances(user_ids)
+        expected_total = users * balance + net["credit"] - net["debit"]
+        actual_total = sum(balances.values())
+        negatives = [tg for tg, iv in balances.items() if iv < 0]
+        print(f"elapsed={elapsed:.2f}s ops/s={workers * ops / elapsed:.0f}")
+        print(f"expected_total={expected_total} actual_total={actual_total} drift={actual_total - expected_total}")
+        print(f"negative_balances={len(negatives)}")
+
+        if mode == "old":
+            reproduced = actual_total != expected_total or bool(negatives)
+            print(f"reproduced={reproduced}")
+            return 0 if reproduced else 1
+
+        ledger = fetch_ledger_sums(user_ids)
+        ledger_mismatch = [tg for tg in user_ids if balances[tg] - balance != ledger.get(tg, 0)]
+        print(f"ledger_mismatch={len(ledger_mismatch)}")
+        fixed_ok = actual_total == expected_total and not negatives and not ledger_mismatch
+        print(f"fixed_ok={fixed_ok}")
+        return 0 if fixed_ok else 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Stress concurrent debit/credit/transfer and check for balance drift.")
+    parser.add_argument("--mode", choices=["old", "fixed"], default="fixed",
+                        help="Run the historical read-modify-write flow or the atomic flow.")
+    parser.add_argument("--users", type=int, default=10, help="Number of seeded users.")
+    parser.add_argument("--balance", type=int, default=100, help="Initial balance of each user.")
+    parser.add_argument("--workers", type=int, default=16, help="Concurrent worker threads.")
+    parser.add_argument("--ops", type=int, default=200, help="Operations per worker.")
+    parser.add_argument("--delay", type=float, default=0.005,
+                        help="Artificial delay between read and write in old mode.")
+    args = parser.parse_args()
+    return run(args.mode, args.users, args.balance, args.workers, args.ops, args.delay)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+批量生成注册码测试，用 SQLite 代替 MySQL
+
+    python scripts/test_mint_codes.py
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+os.environ.setdefault("SAKURA_RUNNING_MIGRATIONS", "1")
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from bot.func_helper import utils
+from bot.sql_helper import Base
+from bot.sql_helper import sql_code
+from bot.sql_helper.sql_code import Code
+
+
+class MintCodesTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{self.tmp.name}/codes.db")
+        Base.metadata.create_all(self.engine, tables=[Code.__table__])
+        patcher = patch.object(sql_code, "Session",
+                               sessionmaker(bind=self.engine, autoflush=False, expire_on_commit=False))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp.cleanup()
+
+    def stored(self):
+        with self.engine.connect() as conn:
+            return {row.code: (row.tg, row.us) for row in conn.execute(select(Code.__table__))}
+
+    def test_sql_mint_codes_counts_inserted_rows(self):
+        codes = [f"SAKURA-30-Register_{i:05d}" for i in range(2500)]
+        self.assertEqual(sql_code.sql_mint_codes(codes, 1000, 30), 2500)
+        self.assertEqual(len(self.stored()), 2500)
+
+    def test_sql_mint_codes_skips_existing_codes(self):
+        self.assertEqual(sql_code.sql_mint_codes(["a", "b"], 1000, 30), 2)
+        self.assertEqual(sql_code.sql_mint_codes(["b", "c", "d"], 2000, 90), 2)
+        stored = self.stored()
+        self.assertEqual(stored["b"], (1000, 30))
+        self.assertEqual(stored["d"], (2000, 90))
+        self.assertEqual(sql_code.sql_get_minted_codes(["b", "c", "d"], 2000, 90), ["c", "d"])
+
+    def test_mint_codes_returns_requested_count(self):
+        minted = utils.mint_codes(1000, "SAKURA-30-Register", 300, 30)
+        self.assertEqual(len(minted), 300)
+        self.assertEqual(len(set(minted)), 300)
+        stored = self.stored()
+        self.assertEqual(set(stored), set(minted))
+        self.assertTrue(all(v == (1000, 30) for v in stored.values()))
+
+    def test_mint_codes_reports_database_failure(self):
+        with patch.object(utils, "sql_mint_codes", return_value=None):
+            self.assertIsNone(utils.mint_codes(1000, "SAKURA-30-Register", 5, 30))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+sql_helper 主要扫描查询的执行计划回归测试
+
+    python scripts/test_query_plans.py                    # 只检查模型上声明了所需索引
+    QUERY_PLAN_DB=1 python scripts/test_query_plans.py    # 连接配置中的 MySQL，写入合成数据后检查 EXPLAIN
+
+合成数据与查询列表见 scripts/bench_expiry_scans.py
+"""
+import os
+import sys
+import unittest
+from pathlib import Path
+
+SCRIPTS = Path(__file__).resolve().parent
+if str(SCRIPTS) not in sys.path:
+    sys.path.insert(0, str(SCRIPTS))
+
+from bench_expiry_scans import PLAN_QUERIES, engine, explain, seed, cleanup
+
+REAL_MODE = os.getenv("QUERY_PLAN_DB") == "1"
+REAL_USERS = int(os.getenv("QUERY_PLAN_USERS", "20000"))
+
+
+class DeclaredIndexTests(unittest.TestCase):
+    def test_expected_indexes_declared_on_models(self):
+        for query in PLAN_QUERIES:
+            declared = {index.name for index in query.table.__table__.indexes} | {"PRIMARY"}
+            with self.subTest(query=query.label):
+                self.assertTrue(set(query.indexes) & declared,
+                                f"{query.table.__tablename__} 未声明 {query.indexes}")
+
+
+@unittest.skipUnless(REAL_MODE, "set QUERY_PLAN_DB=1 to run EXPLAIN against MySQL")
+class QueryPlanTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.info = seed(REAL_USERS)
+
+    @classmethod
+    def tearDownClass(cls):
+        cleanup()
+
+    def test_scans_use_expected_index(self):
+        with engine.connect() as conn:
+            for query in PLAN_QUERIES:
+                plan = explain(conn, query, self.info)
+                with self.subTest(query=query.label, plan=plan):
+                    self.assertNotEqual(plan["type"], "ALL")
+                    self.assertIn(plan["key"], query.indexes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,18 @@
 #!/usr/bin/env python3
+"""
+注册队列测试与吞吐基准
+
+    python scripts/test_register_queue.py                        # 单元测试（席位、Emby、数据库均为内存替身）
+    REGISTER_QUEUE_REAL=1 python scripts/test_register_queue.py  # 真实 Emby + 数据库集成测试
+    python scripts/test_register_queue.py --bench --users 1000 --cap 800 --workers 1,5,20
+    python scripts/test_register_queue.py --bench --db ...       # 席位预留走真实数据库（独立计数器，结束后清理）
+"""
+import argparse
 import asyncio
 import os
 import sys
+import threading
+import time
 import types
 import unittest
 from datetime import datetime
@@ -24,12 +35,79 @@ if REAL_MODE:
     from bot.func_helper.emby import emby
     from bot.sql_helper.sql_emby import sql_add_emby, sql_delete_emby_by_tg, sql_get_emby
 
+# 测试/基准使用独立的计数器，不影响线上的 open_tem
+TEST_COUNTER = "rqtest_open_tem"
+
+
+def _reset_db_counter(name: str, value: int = None):
+    """删除计数器及其预留；value 不为 None 时重新以 value 初始化"""
+    from bot.sql_helper import engine
+    from bot.sql_helper.sql_counter import BotCounter, SlotReservation, sql_init_counter
+
+    with engine.begin() as conn:
+        conn.execute(SlotReservation.__table__.delete().where(SlotReservation.counter == name))
+        conn.execute(BotCounter.__table__.delete().where(BotCounter.name == name))
+    if value is not None:
+        sql_init_counter(name, value)
+
 
 class FakeMessage:
     def __init__(self):
         self.history = []
 
 
+class FakeSlots:
+    """内存版 sql_counter 席位预留，语义与数据库实现一致（value + reserved < cap 才能预留）"""
+
+    def __init__(self, value: int = 0):
+        self.value = value
+        self.reserved = 0
+        self.holders = set()
+        self._lock = threading.Lock()
+
+    def reserve(self, tg, cap, name=None, ttl=None):
+        with self._lock:
+            if self.value + self.reserved >= cap:
+                return "slot_full"
+            if tg in self.holders:
+                return "duplicate"
+            self.reserved += 1
+            self.holders.add(tg)
+            return "reserved"
+
+    def _take(self, tg):
+        if tg in self.holders:
+            self.holders.discard(tg)
+            self.reserved -= 1
+            return True
+        return False
+
+    def commit(self, tg, name=None):
+        with self._lock:
+            self._take(tg)
+            self.value += 1
+            return self.value
+
+    def release(self, tg, name=None):
+        with self._lock:
+            return self._take(tg)
+
+    def expire(self, name=None):
+        return 0
+
+    def get(self, name=None, default=0):
+        return self.value
+
+    def patches(self):
+        return [
+            patch.object(rq, "sql_reserve_slot", self.reserve),
+            patch.object(rq, "sql_commit_slot", self.commit),
+            patch.object(rq, "sql_release_slot", self.release),
+            patch.object(rq, "sql_expire_slots", self.expire),
+            patch.object(rq, "sql_get_counter", self.get),
+        ]
+
+
 class RegisterQueueTests(unittest.IsolatedAsyncioTestCase):
     async def asyncSetUp(self):
         self.old_open = {
@@ -94,17 +172,18 @@ class RegisterQueueTests(unittest.IsolatedAsyncioTestCase):
             self.deleted_emby_ids.append(emby_id)
             return True
 
-        def fake_tem_adduser():
-            rq._open.tem = int(rq._open.tem or 0) + 1
+        def fake_tem_update(tem):
+            rq._open.tem = tem
 
+        self.slots = FakeSlots()
         self.patches = [
             patch.object(rq, "editMessage", fake_edit),
             patch.object(rq, "sendMessage", fake_send),
             patch.object(rq, "sql_get_emby", fake_get_emby),
             patch.object(rq, "sql_update_emby", fake_update_emby),
-            patch.object(rq, "tem_adduser", fake_tem_adduser),
+            patch.object(rq, "tem_update", fake_tem_update),
             patch.object(rq, "emby", SimpleNamespace(emby_create=fake_emby_create, emby_del=fake_emby_del)),
-        ]
+        ] + self.slots.patches()
         for item in self.patches:
             item.start()
 
@@ -136,7 +215,9 @@ class RegisterQueueTests(unittest.IsolatedAsyncioTestCase):
 
         self.manager.ensure_started = noop
         rq._open.all_user = 5
-        rq._open.tem = 3
+        # 内存中的 tem 已过期，剩余席位按数据库中的 3 个已注册计算
+        rq._open.tem = 0
+        self.slots.value = 3
         rq._open.register_queue_limit = 100
         self.manager._active_jobs = 1
 
@@ -174,6 +255,33 @@ class RegisterQueueTests(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(reason1, "queued")
         self.assertFalse(ok2)
         self.assertEqual(reason2, "duplicate")
+        self.assertEqual(self.slots.reserved, 1)
+
+    async def test_database_capacity_is_not_oversold_by_concurrent_enqueues(self):
+        async def noop():
+            return None
+
+        self.manager.ensure_started = noop
+        rq._open.all_user = 10
+        rq._open.tem = 0
+        rq._open.register_queue_limit = 100
+        # 其他实例已注册 7 个，读取计数失败时本进程内存中的 tem 并不知道，只能靠数据库预留兜底
+        self.slots.value = 7
+
+        with patch.object(rq, "sql_get_counter", lambda name=None, default=0: default):
+            results = await asyncio.gather(*[
+                self.manager.enqueue(rq.RegisterJob(2100 + index, f"cap{index}", "1234", True, 30, FakeMessage()))
+                for index in range(10)
+            ])
+
+        reasons = [reason for _, reason, _ in results]
+        self.assertEqual(reasons.count("queued"), 3)
+        self.assertEqual(reasons.count("slot_full"), 7)
+        self.assertEqual(self.slots.reserved, 3)
+        self.assertEqual(self.manager._reserved_slots, 3)
+        self.assertEqual(self.manager._pending, 0)
+        for user_id, (ok, _, _) in zip(range(2100, 2110), results):
+            self.assertEqual(await self.manager.is_user_busy(user_id), ok)
 
     async def test_worker_processes_job_and_clears_queue_state(self):
         user_id = 3001
@@ -208,6 +316,8 @@ class RegisterQueueTests(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(user.lv, "b")
         self.assertEqual(user.us, 0)
         self.assertEqual(rq._open.tem, 1)
+        self.assertEqual(self.slots.value, 1)
+        self.assertEqual(self.slots.reserved, 0)
         self.assertEqual(self.manager._reserved_slots, 0)
         self.assertEqual(self.manager._active_jobs, 0)
         self.assertFalse(await self.manager.is_user_busy(user_id))
@@ -250,6 +360,8 @@ class RegisterQueueTests(unittest.IsolatedAsyncioTestCase):
 
         self.assertEqual(self.deleted_emby_ids, ["emby-queue-user-rollback"])
         self.assertEqual(rq._open.tem, 0)
+        self.assertEqual(self.slots.value, 0)
+        self.assertEqual(self.slots.reserved, 0)
         self.assertEqual(self.manager._reserved_slots, 0)
         self.assertEqual(self.manager._active_jobs, 0)
         self.assertFalse(await self.manager.is_user_busy(user_id))
@@ -301,7 +413,8 @@ class RegisterQueueIntegrationTests(unittest.IsolatedAsyncioTestCase):
         for tg_id in self.tg_ids:
             sql_delete_emby_by_tg(tg_id)
             sql_add_emby(tg_id)
-        self.manager = rq.RegisterQueueManager()
+        _reset_db_counter(TEST_COUNTER, 0)
+        self.manager = rq.RegisterQueueManager(counter=TEST_COUNTER)
 
     async def asyncTearDown(self):
         await self._cancel_workers()
@@ -318,6 +431,7 @@ class RegisterQueueIntegrationTests(unittest.IsolatedAsyncioTestCase):
         await emby.close()
         for tg_id in self.tg_ids:
             sql_delete_emby_by_tg(tg_id)
+        _reset_db_counter(TEST_COUNTER)
 
         rq._open.all_user = self.old_open["all_user"]
         rq._open.tem = self.old_open["tem"]
@@ -367,5 +481,115 @@ class RegisterQueueIntegrationTests(unittest.IsolatedAsyncioTestCase):
         self.assertTrue(all(any("创建用户成功" in item[1] for item in message.history) for message in self.messages))
 
 
+async def _bench_once(users: int, cap: int, workers: int, latency: float, use_db: bool) -> dict:
+    """
+    users 个用户同时提交注册，Emby 创建耗时 latency 秒；返回吞吐与席位统计
+    席位预留默认用内存替身，use_db 时走真实数据库的独立计数器
+    """
+    accounts = {tg: SimpleNamespace(tg=tg, embyid=None, us=30) for tg in range(1, users + 1)}
+
+    async def fake_edit(message, text, buttons=None):
+        return True
+
+    async def fake_create(name, days):
+        await asyncio.sleep(latency)
+        return (f"emby-{name}", "pwd", datetime.now())
+
+    async def fake_del(emby_id):
+        return True
+
+    def fake_update(condition, **kwargs):
+        accounts[int(str(condition.right.value))].embyid = kwargs["embyid"]
+        return True
+
+    slots = None
+    patches = [
+        patch.object(rq, "editMessage", fake_edit),
+        patch.object(rq, "sendMessage", fake_edit),
+        patch.object(rq, "sql_get_emby", lambda tg: accounts.get(tg)),
+        patch.object(rq, "sql_update_emby", fake_update),
+        patch.object(rq, "tem_update", lambda tem: None),
+        patch.object(rq, "emby", SimpleNamespace(emby_create=fake_create, emby_del=fake_del)),
+    ]
+    if use_db:
+        _reset_db_counter(TEST_COUNTER, 0)
+    else:
+        slots = FakeSlots()
+        patches += slots.patches()
+
+    old_open = (rq._open.all_user, rq._open.tem, rq._open.register_worker_count, rq._open.register_queue_limit)
+    rq._open.all_user, rq._open.tem = cap, 0
+    rq._open.register_worker_count, rq._open.register_queue_limit = workers, users
+    for item in patches:
+        item.start()
+    manager = rq.RegisterQueueManager(counter=TEST_COUNTER)
+    try:
+        start = time.perf_counter()
+        results = await asyncio.gather(*[
+            manager.enqueue(rq.RegisterJob(tg, f"bench{tg}", "0000", True, 30, FakeMessage()))
+            for tg in accounts
+        ])
+        admitted = time.perf_counter() - start
+        await manager._queue.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        for task in manager._workers:
+            task.cancel()
+        await asyncio.gather(*manager._workers, return_exceptions=True)
+        for item in reversed(patches):
+            item.stop()
+        rq._open.all_user, rq._open.tem, rq._open.register_worker_count, rq._open.register_queue_limit = old_open
+
+    if use_db:
+        from bot.sql_helper.sql_counter import sql_get_counter
+        committed = sql_get_counter(TEST_COUNTER)
+        _reset_db_counter(TEST_COUNTER)
+    else:
+        committed = slots.value
+    created = sum(1 for account in accounts.values() if account.embyid)
+    reasons = [reason for _, reason, _ in results]
+    return {
+        "workers": workers,
+        "queued": reasons.count("queued"),
+        "rejected": len(reasons) - reasons.count("queued"),
+        "created": created,
+        "committed": committed,
+        "admit_ms": admitted * 1000,
+        "elapsed_s": elapsed,
+        "throughput": created / elapsed if elapsed else 0.0,
+        "oversold": committed > cap or created != committed,
+    }
+
+
+def bench(users: int, cap: int, workers_list: list, latency: float, use_db: bool) -> int:
+    print(f"[scenario] register-queue users={users} cap={cap} latency={latency * 1000:.0f}ms "
+          f"slots={'db' if use_db else 'memory'}")
+    failed = 0
+    for workers in workers_list:
+        r = asyncio.run(_bench_once(users, cap, workers, latency, use_db))
+        failed += r["oversold"]
+        print(("[oversold] " if r["oversold"] else "")
+              + f"workers={r['workers']:<4} queued={r['queued']:<6} rejected={r['rejected']:<6} "
+                f"created={r['created']:<6} committed={r['committed']:<6} admit={r['admit_ms']:8.1f}ms "
+                f"total={r['elapsed_s']:7.2f}s throughput={r['throughput']:8.1f}/s")
+    return 1 if failed else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Register queue tests and throughput benchmark.")
+    parser.add_argument("--bench", action="store_true", help="Run the throughput benchmark instead of tests.")
+    parser.add_argument("--users", type=int, default=500, help="Number of concurrent registrations.")
+    parser.add_argument("--cap", type=int, default=400, help="Registration capacity (open.all_user).")
+    parser.add_argument("--workers", default="1,5,20", help="Comma separated worker counts.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated Emby create latency (s).")
+    parser.add_argument("--db", action="store_true", help="Reserve slots in the configured database.")
+    args, rest = parser.parse_known_args()
+    if not args.bench:
+        unittest.main(argv=[sys.argv[0]] + rest, verbosity=2)
+        return 0
+    workers_list = [int(w) for w in args.workers.split(",") if w.strip()]
+    return bench(args.users, args.cap, workers_list, args.latency, args.db)
+
+
 if __name__ == "__main__":
-    unittest.main(verbosity=2)
+    raise SystemExit(main())
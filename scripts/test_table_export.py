@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+内置表导出/恢复的往返测试，用 SQLite 代替 MySQL
+
+    python scripts/test_table_export.py
+"""
+import io
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+os.environ.setdefault("SAKURA_RUNNING_MIGRATIONS", "1")
+
+from sqlalchemy import create_engine, insert, select
+
+from bot.func_helper import table_export
+from bot.func_helper.backup_db_utils import _CompressedFile
+from bot.sql_helper import Base
+from bot.sql_helper.sql_code import Code
+from bot.sql_helper.sql_emby import Emby
+from bot.sql_helper.sql_favorites import EmbyFavorites
+
+
+def snapshot(engine, tables):
+    with engine.connect() as conn:
+        return {t.name: [tuple(r) for r in conn.execute(select(t).order_by(*t.primary_key.columns))] for t in tables}
+
+
+class TableExportRoundTripTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = create_engine(f"sqlite:///{self.tmp.name}/source.db")
+        self.target = create_engine(f"sqlite:///{self.tmp.name}/target.db")
+        self.tables = table_export.bot_tables()
+        Base.metadata.create_all(self.source)
+        now = datetime(2026, 10, 19, 2, 30, 15, 123456)
+        with self.source.begin() as conn:
+            conn.execute(insert(Emby), [
+                {"tg": 1000 + i, "embyid": f"id{i}", "name": f"用户{i}", "lv": "b", "cr": now, "ex": None,
+                 "us": i, "iv": i * 10} for i in range(2500)
+            ])
+            conn.execute(insert(Code), [{"code": "SAKURA-1-abc", "tg": 1000, "us": 30, "used": None,
+                                         "usedtime": None}])
+            conn.execute(insert(EmbyFavorites), [{"id": 1, "embyid": "id1", "embyname": "用户1", "item_id": "42",
+                                                  "item_name": "名字 \"带引号\"\n换行", "created_at": now}])
+
+    def tearDown(self):
+        self.source.dispose()
+        self.target.dispose()
+        self.tmp.cleanup()
+
+    def export_bytes(self):
+        buf = io.BytesIO()
+        counts = table_export.export_tables(self.source, buf, self.tables)
+        return buf.getvalue(), counts
+
+    def test_round_trip_restores_identical_rows(self):
+        data, counts = self.export_bytes()
+        self.assertEqual(counts["emby"], 2500)
+        restored = table_export.restore_tables(self.target, io.BytesIO(data))
+        self.assertEqual(restored, counts)
+        self.assertEqual(snapshot(self.target, self.tables), snapshot(self.source, self.tables))
+
+    def test_restore_replaces_existing_rows_and_filters_tables(self):
+        Base.metadata.create_all(self.target)
+        with self.target.begin() as conn:
+            conn.execute(insert(Emby), [{"tg": 1, "name": "stale", "lv": "d"}])
+        data, _ = self.export_bytes()
+        restored = table_export.restore_tables(self.target, io.BytesIO(data), tables=["emby"])
+        self.assertEqual(list(restored), ["emby"])
+        after = snapshot(self.target, self.tables)
+        self.assertEqual(after["emby"], snapshot(self.source, self.tables)["emby"])
+        self.assertEqual(after["Rcode"], [])
+
+    def test_split_compressed_backup_restores_from_parts(self):
+        path = os.path.join(self.tmp.name, "backup.jsonl.gz")
+        out = _CompressedFile(path, "gzip")
+        out.parts.part_size = 4096
+        table_export.export_tables(self.source, out, self.tables)
+        out.close()
+        self.assertGreater(len(out.parts.files), 1)
+        self.assertFalse(os.path.exists(path))
+        table_export.restore_from_file(path, self.target)
+        self.assertEqual(snapshot(self.target, self.tables), snapshot(self.source, self.tables))
+
+    def test_rejects_foreign_files(self):
+        with self.assertRaises(table_export.ExportFormatError):
+            table_export.restore_tables(self.target, io.BytesIO(b"-- MySQL dump\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()